@@ -77,6 +77,14 @@ class Evaluator(object):
             # cycle (unless alarm state reverts in the meantime)
             LOG.exception(_('alarm state update failed'))
 
+    def evaluate_all(self, alarms):
+        """Evaluate the alarms of one evaluation cycle.
+
+        Evaluators able to share work between the alarms override this.
+        """
+        for alarm in alarms:
+            self.evaluate(alarm)
+
     @abc.abstractmethod
     def evaluate(self, alarm):
         '''interface definition
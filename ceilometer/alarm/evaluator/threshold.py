@@ -20,11 +20,27 @@
 import datetime
 import operator
 
+from ceilometerclient.v2 import options as client_options
+from oslo.config import cfg
+
 from ceilometer.alarm import evaluator
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 
+OPTS = [
+    cfg.IntOpt('statistics_group_min_size',
+               default=10,
+               help='Minimum number of threshold alarms only differing by '
+                    'their resource whose statistics are retrieved with a '
+                    'single query grouped by resource. That query returns '
+                    'the statistics of every resource of the meter, so it '
+                    'only pays off when the alarms cover enough of them. '
+                    '0 disables the grouped queries.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='alarm')
+
 LOG = log.getLogger(__name__)
 
 COMPARATORS = {
@@ -36,6 +52,9 @@ COMPARATORS = {
     'ne': operator.ne,
 }
 
+# Field by which the statistics of similar alarms are queried at once
+GROUP_FIELD = 'resource_id'
+
 
 class ThresholdEvaluator(evaluator.Evaluator):
 
@@ -85,6 +104,50 @@ class ThresholdEvaluator(evaluator.Evaluator):
             LOG.exception(_('alarm stats retrieval failed'))
             return []
 
+    @staticmethod
+    def _group_key(alarm):
+        """Return the key of the alarms sharing their statistics query.
+
+        The alarms on a single resource whose rules only differ by that
+        resource share the key; the other alarms have none.
+        """
+        rule = alarm.rule
+        resources = [q for q in rule['query'] if q['field'] == GROUP_FIELD]
+        if len(resources) != 1 or resources[0].get('op', 'eq') != 'eq':
+            return None
+        constraints = tuple(sorted(
+            (q['field'], q.get('op', 'eq'), q['value'], q.get('type'))
+            for q in rule['query'] if q['field'] != GROUP_FIELD))
+        return (rule['meter_name'], rule['period'],
+                rule['evaluation_periods'], constraints)
+
+    def _grouped_statistics(self, alarm):
+        """Retrieve the statistics of the alarms sharing the query of one.
+
+        Return the statistics by resource, or None if they could not be
+        retrieved.
+        """
+        query = self._bound_duration(
+            alarm,
+            [q for q in alarm.rule['query'] if q['field'] != GROUP_FIELD]
+        )
+        LOG.debug(_('grouped stats query %s') % query)
+        # The statistics manager of the client has no groupby argument,
+        # so the request is built here and sent through it
+        url = client_options.build_url(
+            '/v2/meters/%s/statistics' % alarm.rule['meter_name'], query,
+            ['period=%s' % alarm.rule['period'], 'groupby=%s' % GROUP_FIELD])
+        try:
+            statistics = self._client.statistics._list(url)
+        except Exception:
+            LOG.exception(_('grouped alarm stats retrieval failed, '
+                            'querying the alarms one by one'))
+            return None
+        by_resource = {}
+        for stat in statistics:
+            by_resource.setdefault(stat.groupby[GROUP_FIELD], []).append(stat)
+        return by_resource
+
     def _sufficient(self, alarm, statistics):
         """Ensure there is sufficient data for evaluation,
            transitioning to unknown otherwise.
@@ -142,16 +205,42 @@ class ThresholdEvaluator(evaluator.Evaluator):
             reason = self._reason(alarm, statistics, distilled, state)
             self._refresh(alarm, state, reason)
 
+    def evaluate_all(self, alarms):
+        """Evaluate the alarms, sharing their statistics queries.
+
+        The statistics of the alarms only differing by their resource are
+        retrieved with a single query grouped by resource, once they are
+        at least statistics_group_min_size. That query returns the
+        statistics of every resource of the meter matching the other
+        constraints of the rule, not only those of the alarmed resources.
+        """
+        min_size = cfg.CONF.alarm.statistics_group_min_size
+        groups = {}
+        for alarm in alarms:
+            groups.setdefault(self._group_key(alarm), []).append(alarm)
+        for key, group in groups.iteritems():
+            by_resource = None
+            if (key is not None and min_size and
+                    len(group) >= max(min_size, 2)):
+                by_resource = self._grouped_statistics(group[0])
+            for alarm in group:
+                if by_resource is None:
+                    self.evaluate(alarm)
+                else:
+                    resource_id = [q['value'] for q in alarm.rule['query']
+                                   if q['field'] == GROUP_FIELD][0]
+                    self._evaluate_statistics(
+                        alarm, by_resource.get(resource_id, []))
+
     def evaluate(self, alarm):
         query = self._bound_duration(
             alarm,
             alarm.rule['query']
         )
+        self._evaluate_statistics(alarm, self._statistics(alarm, query))
 
-        statistics = self._sanitize(
-            alarm,
-            self._statistics(alarm, query)
-        )
+    def _evaluate_statistics(self, alarm, statistics):
+        statistics = self._sanitize(alarm, statistics)
 
         if self._sufficient(alarm, statistics):
             def _compare(stat):
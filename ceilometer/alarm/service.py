@@ -95,20 +95,23 @@ class AlarmService(object):
             alarms = self._assigned_alarms()
             LOG.info(_('initiating evaluation cycle on %d alarms') %
                      len(alarms))
+            alarms_by_type = {}
             for alarm in alarms:
-                self._evaluate_alarm(alarm)
+                if alarm.type not in self.supported_evaluators:
+                    LOG.debug(_('skipping alarm %s: type unsupported') %
+                              alarm.alarm_id)
+                    continue
+                alarms_by_type.setdefault(alarm.type, []).append(alarm)
+            for alarm_type, typed_alarms in alarms_by_type.iteritems():
+                self._evaluate_alarms(alarm_type, typed_alarms)
         except Exception:
             LOG.exception(_('alarm evaluation cycle failed'))
 
-    def _evaluate_alarm(self, alarm):
-        """Evaluate the alarms assigned to this evaluator."""
-        if alarm.type not in self.supported_evaluators:
-            LOG.debug(_('skipping alarm %s: type unsupported') %
-                      alarm.alarm_id)
-            return
-
-        LOG.debug(_('evaluating alarm %s') % alarm.alarm_id)
-        self.evaluators[alarm.type].obj.evaluate(alarm)
+    def _evaluate_alarms(self, alarm_type, alarms):
+        """Evaluate the alarms of a type with their evaluator."""
+        LOG.debug(_('evaluating %(count)d %(type)s alarms') %
+                  {'count': len(alarms), 'type': alarm_type})
+        self.evaluators[alarm_type].obj.evaluate_all(alarms)
 
     @abc.abstractmethod
     def _assigned_alarms(self):
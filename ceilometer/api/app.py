@@ -27,6 +27,7 @@ from ceilometer.api import acl
 from ceilometer.api import config as api_config
 from ceilometer.api import hooks
 from ceilometer.api import middleware
+from ceilometer.api import renderers
 from ceilometer.openstack.common import log
 from ceilometer import service
 from ceilometer import storage
@@ -60,6 +61,7 @@ def setup_app(pecan_config=None, extra_hooks=None):
                      storage_engine,
                      storage_engine.get_connection(cfg.CONF),
                  ),
+                 hooks.StatisticsCacheHook(),
                  hooks.PipelineHook(),
                  hooks.TranslationHook()]
     if extra_hooks:
@@ -77,6 +79,7 @@ def setup_app(pecan_config=None, extra_hooks=None):
         debug=CONF.debug,
         force_canonical=getattr(pecan_config.app, 'force_canonical', True),
         hooks=app_hooks,
+        custom_renderers={'jsonstream': renderers.JSONStreamRenderer},
         wrap_app=middleware.ParsableErrorMiddleware,
         guess_content_type_from_ext=False
     )
@@ -28,7 +28,9 @@ import copy
 import datetime
 import functools
 import inspect
+import itertools
 import json
+import urllib
 import uuid
 
 from oslo.config import cfg
@@ -36,6 +38,7 @@ import pecan
 from pecan import rest
 import six
 import wsme
+import wsme.rest.json
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
@@ -525,6 +528,72 @@ def _make_link(rel_name, url, type, type_arg, query=None):
                 rel=rel_name)
 
 
+def _encode_marker(sample):
+    return base64.urlsafe_b64encode(json.dumps(
+        [timeutils.strtime(sample.timestamp), sample.message_id]))
+
+
+def _decode_marker(marker):
+    try:
+        timestamp, message_id = json.loads(
+            base64.urlsafe_b64decode(str(marker)))
+        return timeutils.parse_strtime(timestamp), message_id
+    except (TypeError, ValueError):
+        raise ClientSideError(_("Invalid marker %s") % marker)
+
+
+def _stream_samples(sample_type, samples, limit, next_url):
+    """Return the chunks of a JSON document listing the samples.
+
+    The document is {"samples": [...], "links": [...]}, a "next" link
+    carrying the marker of the last sample is added when the limit is
+    reached.
+    """
+    yield '{"samples": ['
+    last = None
+    for count, s in enumerate(samples):
+        chunk = json.dumps(wsme.rest.json.tojson(
+            sample_type, sample_type.from_db_model(s)))
+        yield chunk if last is None else ', ' + chunk
+        last = s
+    yield '], "links": ['
+    if limit and last is not None and count + 1 == limit:
+        link = Link(href=next_url(_encode_marker(last)), rel='next')
+        yield json.dumps(wsme.rest.json.tojson(Link, link))
+    yield ']}'
+
+
+def _get_samples(sample_type, sample_filter, limit, marker, stream):
+    """Return the samples as a list, or as a JSON stream if requested."""
+    if limit and limit < 0:
+        raise ClientSideError(_("Limit must be positive"))
+    if marker:
+        marker = _decode_marker(marker)
+    samples = iter(pecan.request.storage_conn.get_samples(
+        sample_filter, limit=limit, marker=marker))
+    try:
+        # Run the query before the status of the response is sent
+        first = next(samples, None)
+    except NotImplementedError:
+        raise ClientSideError(_("Markers are not supported by the storage "
+                                "driver"), status_code=501)
+    if first is not None:
+        samples = itertools.chain([first], samples)
+
+    if not stream:
+        return [sample_type.from_db_model(s) for s in samples]
+
+    params = [(k, v) for k, v in pecan.request.GET.items() if k != 'marker']
+    path_url = pecan.request.path_url
+
+    def next_url(marker):
+        return '%s?%s' % (path_url,
+                          urllib.urlencode(params + [('marker', marker)]))
+
+    pecan.override_template('jsonstream:', 'application/json')
+    return _stream_samples(sample_type, samples, limit, next_url)
+
+
 def _send_notification(event, payload):
     notification = event.replace(" ", "_")
     notification = "alarm.%s" % notification
@@ -713,21 +782,21 @@ class MeterController(rest.RestController):
         pecan.request.context['meter_id'] = meter_id
         self._id = meter_id
 
-    @wsme_pecan.wsexpose([OldSample], [Query], int)
-    def get_all(self, q=[], limit=None):
+    @wsme_pecan.wsexpose([OldSample], [Query], int, wtypes.text, bool)
+    def get_all(self, q=[], limit=None, marker=None, stream=False):
         """Return samples for the meter.
 
         :param q: Filter rules for the data to be returned.
         :param limit: Maximum number of samples to return.
+        :param marker: Marker of the last sample of the previous page, as
+                       found in the "next" link of a streamed response.
+        :param stream: Write the samples as they are fetched in a
+                       {"samples": [...], "links": [...]} JSON document.
         """
-        if limit and limit < 0:
-            raise ClientSideError(_("Limit must be positive"))
         kwargs = _query_to_kwargs(q, storage.SampleFilter.__init__)
         kwargs['meter'] = self._id
         f = storage.SampleFilter(**kwargs)
-        return [OldSample.from_db_model(e)
-                for e in pecan.request.storage_conn.get_samples(f, limit=limit)
-                ]
+        return _get_samples(OldSample, f, limit, marker, stream)
 
     @wsme_pecan.wsexpose([OldSample], body=[OldSample])
     def post(self, samples):
@@ -804,9 +873,8 @@ class MeterController(rest.RestController):
         kwargs['meter'] = self._id
         f = storage.SampleFilter(**kwargs)
         g = _validate_groupby_fields(groupby)
-        computed = pecan.request.storage_conn.get_meter_statistics(f,
-                                                                   period,
-                                                                   g)
+        computed = pecan.request.statistics_cache.get_meter_statistics(
+            pecan.request.storage_conn, f, period, g)
         LOG.debug(_('computed value coming from %r'),
                   pecan.request.storage_conn)
         # Find the original timestamp in the query to use for clamping
@@ -959,19 +1027,20 @@ class Sample(_Base):
 class SamplesController(rest.RestController):
     """Controller managing the samples."""
 
-    @wsme_pecan.wsexpose([Sample], [Query], int)
-    def get_all(self, q=[], limit=None):
+    @wsme_pecan.wsexpose([Sample], [Query], int, wtypes.text, bool)
+    def get_all(self, q=[], limit=None, marker=None, stream=False):
         """Return all known samples, based on the data recorded so far.
 
         :param q: Filter rules for the samples to be returned.
         :param limit: Maximum number of samples to be returned.
+        :param marker: Marker of the last sample of the previous page, as
+                       found in the "next" link of a streamed response.
+        :param stream: Write the samples as they are fetched in a
+                       {"samples": [...], "links": [...]} JSON document.
         """
-        if limit and limit < 0:
-            raise ClientSideError(_("Limit must be positive"))
         kwargs = _query_to_kwargs(q, storage.SampleFilter.__init__)
         f = storage.SampleFilter(**kwargs)
-        return map(Sample.from_db_model,
-                   pecan.request.storage_conn.get_samples(f, limit=limit))
+        return _get_samples(Sample, f, limit, marker, stream)
 
 
 class Resource(_Base):
@@ -1782,19 +1851,23 @@ class EventsController(rest.RestController):
     """Works on Events."""
 
     @requires_admin
-    @wsme_pecan.wsexpose([Event], [EventQuery])
-    def get_all(self, q=[]):
+    @wsme_pecan.wsexpose([Event], [EventQuery], int)
+    def get_all(self, q=[], limit=None):
         """Return all events matching the query filters.
 
         :param q: Filter arguments for which Events to return
+        :param limit: Maximum number of events to be returned.
         """
+        if limit and limit < 0:
+            raise ClientSideError(_("Limit must be positive"))
         event_filter = _event_query_to_event_filter(q)
         return [Event(message_id=event.message_id,
                       event_type=event.event_type,
                       generated=event.generated,
                       traits=event.traits)
                 for event in
-                pecan.request.storage_conn.get_events(event_filter)]
+                pecan.request.storage_conn.get_events(event_filter,
+                                                      limit=limit)]
 
     @requires_admin
     @wsme_pecan.wsexpose(Event, wtypes.text)
@@ -22,6 +22,7 @@ import threading
 from oslo.config import cfg
 from pecan import hooks
 
+from ceilometer.api import statistics_cache
 from ceilometer import pipeline
 from ceilometer import transformer
 
@@ -46,6 +47,18 @@ class DBHook(hooks.PecanHook):
         state.request.storage_conn = self.storage_connection
 
 
+class StatisticsCacheHook(hooks.PecanHook):
+    """Attach the statistics cache shared by the requests."""
+
+    def __init__(self):
+        self.statistics_cache = statistics_cache.StatisticsCache(
+            cfg.CONF.api.statistics_cache_size,
+            cfg.CONF.api.statistics_cache_ttl)
+
+    def before(self, state):
+        state.request.statistics_cache = self.statistics_cache
+
+
 class PipelineHook(hooks.PecanHook):
     '''Create and attach a pipeline to the request so that
     new samples can be posted via the /v2/meters/ API.
@@ -0,0 +1,36 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Pecan renderers used by the API.
+"""
+
+import pecan
+import wsme.rest.json
+
+
+class JSONStreamRenderer(object):
+    """Write the chunks of JSON returned by a controller as they come.
+
+    The controller returns an iterable of strings instead of a value to be
+    serialized, it is used as the body of the response so the document is
+    never built in memory.
+    """
+
+    def __init__(self, path, extra_vars):
+        pass
+
+    def render(self, template_path, namespace):
+        if 'faultcode' in namespace:
+            return wsme.rest.json.encode_error(None, namespace)
+        pecan.response.app_iter = namespace['result']
+        return ''
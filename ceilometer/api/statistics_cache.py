@@ -0,0 +1,133 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Cache of the statistics computed by the storage driver.
+
+The statistics of a period which is over and entirely covered by a query
+do not depend on the rest of the query time range, so they are kept and
+reused by the following queries sharing the same filter. Only the periods
+missing from the cache and the ones still open are computed again.
+"""
+
+import copy
+import datetime
+import math
+import threading
+
+from oslo.config import cfg
+
+from ceilometer.openstack.common import timeutils
+from ceilometer import utils
+
+OPTS = [
+    cfg.IntOpt('statistics_cache_size',
+               default=0,
+               help='Maximum number of periods of statistics kept in the '
+                    'API cache, 0 disables the cache.'),
+    cfg.IntOpt('statistics_cache_ttl',
+               default=600,
+               help='Number of seconds the statistics of a period are kept '
+                    'in the API cache; samples received late for a period '
+                    'are ignored until then.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='api')
+
+
+class StatisticsCache(object):
+    """LRU cache of the statistics of the closed periods."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._periods = utils.LRUCache(size)
+        self._lock = threading.Lock()
+
+    def _cacheable(self, sample_filter, period):
+        return (self.size > 0 and period and
+                sample_filter.start and sample_filter.end and
+                sample_filter.start_timestamp_op in (None, 'ge') and
+                sample_filter.end_timestamp_op in (None, 'lt', 'le'))
+
+    @staticmethod
+    def _series_key(sample_filter, period, groupby):
+        return (sample_filter.meter, sample_filter.user, sample_filter.project,
+                sample_filter.resource, sample_filter.source,
+                tuple(sorted(sample_filter.metaquery.items())),
+                period, tuple(groupby or []))
+
+    def _lookup(self, key, now):
+        with self._lock:
+            entry = self._periods.get(key)
+            if entry is None:
+                return None
+            stored_at, statistics = entry
+            if timeutils.delta_seconds(stored_at, now) > self.ttl:
+                self._periods.pop(key)
+                return None
+            return statistics
+
+    def _store(self, key, now, statistics):
+        with self._lock:
+            self._periods[key] = (now, statistics)
+
+    def clear(self):
+        with self._lock:
+            self._periods.clear()
+
+    def get_meter_statistics(self, conn, sample_filter, period=None,
+                             groupby=None):
+        """Return the statistics as conn.get_meter_statistics would."""
+        if not self._cacheable(sample_filter, period):
+            return conn.get_meter_statistics(sample_filter, period, groupby)
+
+        series = self._series_key(sample_filter, period, groupby)
+        start = sample_filter.start
+        end = sample_filter.end
+        now = timeutils.utcnow()
+        periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                / float(period)))
+
+        def period_start(index):
+            return start + datetime.timedelta(seconds=index * period)
+
+        def is_closed(index):
+            period_end = period_start(index + 1)
+            return period_end <= end and period_end <= now
+
+        results = []
+        first = 0
+        while first < periods and is_closed(first):
+            cached = self._lookup((series, period_start(first)), now)
+            if cached is None:
+                break
+            results.extend(cached)
+            first += 1
+
+        if first < periods:
+            f = copy.copy(sample_filter)
+            f.start = period_start(first)
+            f.start_timestamp_op = 'ge'
+            computed = list(conn.get_meter_statistics(f, period, groupby))
+            by_period = {}
+            for stat in computed:
+                # Round as some drivers align the periods on the second
+                index = first + int(round(timeutils.delta_seconds(
+                    f.start, stat.period_start) / float(period)))
+                by_period.setdefault(index, []).append(stat)
+            for index in range(first, periods):
+                if is_closed(index):
+                    self._store((series, period_start(index)), now,
+                                by_period.get(index, []))
+            results.extend(computed)
+        return results
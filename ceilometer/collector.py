@@ -16,6 +16,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import errno
+import inspect
 import socket
 
 import msgpack
@@ -26,6 +28,7 @@ from ceilometer.openstack.common import log
 from ceilometer.openstack.common.rpc import dispatcher as rpc_dispatcher
 from ceilometer.openstack.common.rpc import service as rpc_service
 from ceilometer.openstack.common import service as os_service
+from ceilometer.publisher import utils as publisher_utils
 from ceilometer import service
 
 OPTS = [
@@ -36,56 +39,125 @@ OPTS = [
     cfg.IntOpt('udp_port',
                default=4952,
                help='port to bind the UDP socket to'),
+    cfg.IntOpt('udp_workers',
+               default=1,
+               help='Number of processes receiving the UDP datagrams, they '
+                    'share the port with SO_REUSEPORT which needs Linux 3.9 '
+                    'or later.'),
+    cfg.IntOpt('udp_receive_buffer',
+               default=0,
+               help='Size in bytes of the receive buffer of the UDP '
+                    'sockets, capped by the net.core.rmem_max sysctl. 0 '
+                    'keeps the system default.'),
+    cfg.IntOpt('udp_batch_size',
+               default=100,
+               help='Maximum number of pending UDP datagrams decoded and '
+                    'handed to the dispatchers at once.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
 cfg.CONF.import_opt('rpc_backend', 'ceilometer.openstack.common.rpc')
+cfg.CONF.import_opt('collector_workers', 'ceilometer.service')
 cfg.CONF.import_opt('metering_topic', 'ceilometer.publisher.rpc',
                     group="publisher_rpc")
 
 
 LOG = log.getLogger(__name__)
 
+# NOTE(jd) Arbitrary limit of 64K because that ought to be enough for
+# anybody.
+UDP_DATAGRAM_SIZE = 64 * 1024
 
-class CollectorService(service.DispatchedService, rpc_service.Service):
-    """Listener for the collector service."""
+# Python 2 does not expose the option, this is its Linux value
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
+
+def _udp_in_process():
+    """Whether the collector service itself receives the UDP datagrams."""
+    return (cfg.CONF.collector.udp_address and
+            cfg.CONF.collector.udp_workers <= 1)
+
+
+def _udp_port_shared():
+    """Whether several processes bind the UDP port."""
+    if cfg.CONF.collector.udp_workers > 1:
+        return True
+    return bool(_udp_in_process()) and cfg.CONF.collector_workers > 1
+
+
+class UDPCollectorService(service.DispatchedService, os_service.Service):
+    """Receiver of the samples sent by the UDP publisher."""
 
     def start(self):
-        """Bind the UDP socket and handle incoming data."""
-        if cfg.CONF.collector.udp_address:
-            self.tg.add_thread(self.start_udp)
-        if cfg.CONF.rpc_backend:
-            super(CollectorService, self).start()
-            if not cfg.CONF.collector.udp_address:
-                # Add a dummy thread to have wait() working
-                self.tg.add_timer(604800, lambda: None)
+        super(UDPCollectorService, self).start()
+        self.tg.add_thread(self.start_udp)
 
     def start_udp(self):
         udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if _udp_port_shared():
+            udp.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+        if cfg.CONF.collector.udp_receive_buffer > 0:
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                           cfg.CONF.collector.udp_receive_buffer)
         udp.bind((cfg.CONF.collector.udp_address,
                   cfg.CONF.collector.udp_port))
 
         self.udp_run = True
         while self.udp_run:
-            # NOTE(jd) Arbitrary limit of 64K because that ought to be
-            # enough for anybody.
-            data, source = udp.recvfrom(64 * 1024)
-            try:
-                sample = msgpack.loads(data)
-            except Exception:
-                LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
-            else:
+            samples = []
+            for data, source in self._receive_datagrams(udp):
                 try:
-                    LOG.debug(_("UDP: Storing %s"), str(sample))
+                    payload = msgpack.loads(data)
+                except Exception:
+                    LOG.warn(_("UDP: Cannot decode data sent by %s"),
+                             str(source))
+                    continue
+                # The publisher may pack several samples in a datagram
+                if isinstance(payload, list):
+                    samples.extend(payload)
+                else:
+                    samples.append(payload)
+            if samples:
+                try:
+                    LOG.debug(_("UDP: Storing %s"), str(samples))
                     self.dispatcher_manager.map_method('record_metering_data',
-                                                       sample)
+                                                       samples)
                 except Exception:
                     LOG.exception(_("UDP: Unable to store meter"))
 
+    @staticmethod
+    def _receive_datagrams(udp):
+        """Wait for a datagram and return it with the ones pending."""
+        datagrams = [udp.recvfrom(UDP_DATAGRAM_SIZE)]
+        udp.setblocking(False)
+        try:
+            while len(datagrams) < cfg.CONF.collector.udp_batch_size:
+                datagrams.append(udp.recvfrom(UDP_DATAGRAM_SIZE))
+        except socket.error as err:
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        finally:
+            udp.setblocking(True)
+        return datagrams
+
     def stop(self):
         self.udp_run = False
-        super(CollectorService, self).stop()
+        super(UDPCollectorService, self).stop()
+
+
+class CollectorService(UDPCollectorService, rpc_service.Service):
+    """Listener for the collector service."""
+
+    def start(self):
+        """Bind the UDP socket and handle incoming data."""
+        if _udp_in_process():
+            self.tg.add_thread(self.start_udp)
+        if cfg.CONF.rpc_backend:
+            rpc_service.Service.start(self)
+            if not _udp_in_process():
+                # Add a dummy thread to have wait() working
+                self.tg.add_timer(604800, lambda: None)
 
     def initialize_service_hook(self, service):
         '''Consumers must be declared before consume_thread start.'''
@@ -97,17 +169,57 @@ class CollectorService(service.DispatchedService, rpc_service.Service):
             'ceilometer.collector.' + cfg.CONF.publisher_rpc.metering_topic,
         )
 
-    def record_metering_data(self, context, data):
+    def record_metering_data(self, context, data, signature=None):
         """RPC endpoint for messages we send to ourselves.
 
         When the notification messages are re-published through the
         RPC publisher, this method receives them for processing.
         """
-        self.dispatcher_manager.map_method('record_metering_data',
-                                           data=data)
+        if signature is None:
+            self.dispatcher_manager.map_method('record_metering_data',
+                                               data=data)
+        elif publisher_utils.verify_batch_signature(
+                data, signature, cfg.CONF.publisher.metering_secret):
+            self.dispatcher_manager.map(_record_verified, data)
+        else:
+            LOG.warning(_('batch signature invalid, discarding %d '
+                          'messages'), len(data))
+
+
+def _record_verified(ext, data):
+    """Pass a batch whose signature was checked to a dispatcher.
+
+    The dispatchers written before the verified argument was added to
+    the interface are called without it, and check the signature of
+    each sample themselves.
+    """
+    record = ext.obj.record_metering_data
+    try:
+        argspec = inspect.getargspec(record)
+    except TypeError:
+        # Not a Python function, call it as the interface defines it
+        argspec = None
+    if argspec is None or 'verified' in argspec.args or argspec.keywords:
+        record(data=data, verified=True)
+    else:
+        record(data=data)
 
 
 def collector():
     service.prepare_service()
-    os_service.launch(CollectorService(cfg.CONF.host,
-                                       'ceilometer.collector')).wait()
+    udp_workers = (cfg.CONF.collector.udp_workers
+                   if cfg.CONF.collector.udp_address else 0)
+    if cfg.CONF.collector_workers <= 1 and udp_workers <= 1:
+        os_service.launch(CollectorService(cfg.CONF.host,
+                                           'ceilometer.collector')).wait()
+        return
+    # The services are forked into their workers, they must not open any
+    # socket or storage connection before they are started.
+    launcher = os_service.ProcessLauncher()
+    if udp_workers > 1:
+        launcher.launch_service(UDPCollectorService(), workers=udp_workers)
+    if cfg.CONF.rpc_backend or _udp_in_process():
+        launcher.launch_service(CollectorService(cfg.CONF.host,
+                                                 'ceilometer.collector'),
+                                workers=cfg.CONF.collector_workers)
+    launcher.wait()
@@ -16,6 +16,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import itertools
+
+import eventlet
 from oslo.config import cfg
 from stevedore import extension
 
@@ -25,36 +28,120 @@ from ceilometer import nova_client
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import service as os_service
+from ceilometer.openstack.common import timeutils
 from ceilometer import service
 
+OPTS = [
+    cfg.IntOpt('instance_polling_concurrency',
+               default=1,
+               help='Number of instances polled concurrently by the compute '
+                    'agent, the libvirt calls are then made from native '
+                    'threads.'),
+    cfg.IntOpt('instance_polling_timeout',
+               default=0,
+               help='Maximum number of seconds spent polling an instance, '
+                    'the samples not collected in time are skipped for the '
+                    'cycle. A libvirt call already running is not '
+                    'interrupted and keeps its native thread until it '
+                    'returns. 0 means no limit.'),
+    cfg.StrOpt('instance_discovery_method',
+               default='nova',
+               help='How the compute agent finds the instances to poll, '
+                    '"nova" or "local": "nova" lists the instances of the '
+                    'host through the Nova API at every cycle, "local" lists '
+                    'the running domains of the hypervisor and only asks Nova '
+                    'about the new ones. With "local", the stopped instances '
+                    'are not polled, and the changes of an instance, such as '
+                    'a resize or a new state, are only seen once its details '
+                    'are refreshed.'),
+    cfg.IntOpt('instance_metadata_refresh',
+               default=3600,
+               help='Number of seconds the details of an instance found by '
+                    'the "local" discovery method are used before they are '
+                    'fetched again from Nova, the changes of the instance are '
+                    'seen that late at most.'),
+]
+
+cfg.CONF.register_opts(OPTS)
+
 LOG = log.getLogger(__name__)
 
+DISCOVERY_METHODS = ('nova', 'local')
+
 
 class PollingTask(agent.PollingTask):
+
+    def __init__(self, agent_manager):
+        super(PollingTask, self).__init__(agent_manager)
+        self.discovery_method = cfg.CONF.instance_discovery_method
+        if self.discovery_method not in DISCOVERY_METHODS:
+            LOG.error(_('Unknown instance discovery method %(method)s, '
+                        'using "nova" instead of it, valid methods are: '
+                        '%(methods)s') %
+                      {'method': self.discovery_method,
+                       'methods': ', '.join(DISCOVERY_METHODS)})
+            self.discovery_method = 'nova'
+
+    def _poll_instance(self, instance, cache):
+        """Return the samples of all the pollsters for an instance."""
+        samples = []
+        timeout = eventlet.Timeout(cfg.CONF.instance_polling_timeout or None)
+        try:
+            for pollster in self.pollsters:
+                try:
+                    LOG.info(_("Polling pollster %s"), pollster.name)
+                    samples.extend(pollster.obj.get_samples(self.manager,
+                                                            cache,
+                                                            instance))
+                except Exception as err:
+                    LOG.warning(_(
+                        'Continue after error from %(name)s: %(error)s')
+                        % ({'name': pollster.name, 'error': err}))
+                    LOG.exception(err)
+        except eventlet.Timeout as t:
+            if t is not timeout:
+                raise
+            LOG.warning(_('Polling of instance %(name)s took more than '
+                          '%(timeout)d seconds, skipping the remaining '
+                          'pollsters') %
+                        ({'name': instance.name,
+                          'timeout': cfg.CONF.instance_polling_timeout}))
+        finally:
+            timeout.cancel()
+        return samples
+
     def poll_and_publish_instances(self, instances):
+        instances = [instance for instance in instances
+                     if getattr(instance, 'OS-EXT-STS:vm_state',
+                                None) != 'error']
+        start = timeutils.utcnow()
+        pool = eventlet.GreenPool(
+            max(cfg.CONF.instance_polling_concurrency, 1))
+        # Shared by all the instances so the pollsters can inspect the
+        # hypervisor once per cycle
+        cache = {}
         with self.publish_context as publisher:
-            for instance in instances:
-                if getattr(instance, 'OS-EXT-STS:vm_state', None) == 'error':
-                    continue
-                cache = {}
-                for pollster in self.pollsters:
-                    try:
-                        LOG.info(_("Polling pollster %s"), pollster.name)
-                        samples = list(pollster.obj.get_samples(
-                            self.manager,
-                            cache,
-                            instance,
-                        ))
-                        publisher(samples)
-                    except Exception as err:
-                        LOG.warning(_(
-                            'Continue after error from %(name)s: %(error)s')
-                            % ({'name': pollster.name, 'error': err}))
-                        LOG.exception(err)
+            for samples in pool.imap(self._poll_instance, instances,
+                                     itertools.repeat(cache)):
+                publisher(samples)
+
+        duration = timeutils.delta_seconds(start, timeutils.utcnow())
+        interval = min([p.get_interval()
+                        for p in self.publish_context.pipelines] or [0])
+        LOG.info(_('Polled %(count)d instances in %(duration).1f seconds') %
+                 ({'count': len(instances), 'duration': duration}))
+        if interval and duration > interval:
+            LOG.warning(_('Polling cycle took %(duration).1f seconds, more '
+                          'than the %(interval)d seconds interval') %
+                        ({'duration': duration, 'interval': interval}))
 
     def poll_and_publish(self):
         try:
-            instances = self.manager.nv.instance_get_all_by_host(cfg.CONF.host)
+            if self.discovery_method == 'local':
+                instances = self.manager.discover_local_instances()
+            else:
+                instances = self.manager.nv.instance_get_all_by_host(
+                    cfg.CONF.host)
         except Exception as err:
             LOG.exception(_('Unable to retrieve instances: %s') % err)
         else:
@@ -72,6 +159,8 @@ class AgentManager(agent.AgentManager):
         )
         self._inspector = virt_inspector.get_hypervisor_inspector()
         self.nv = nova_client.Client()
+        # Details of the local instances fetched from Nova, by UUID
+        self._instances = {}
 
     def create_polling_task(self):
         return PollingTask(self)
@@ -80,6 +169,39 @@ class AgentManager(agent.AgentManager):
     def inspector(self):
         return self._inspector
 
+    def discover_local_instances(self):
+        """Return the instances running on the hypervisor.
+
+        The details of the instances come from Nova, they are kept in
+        memory and only fetched again for the new instances and once they
+        are older than instance_metadata_refresh seconds.
+        """
+        now = timeutils.utcnow()
+        known = self._instances
+        self._instances = {}
+        for local in self._inspector.inspect_instances():
+            entry = known.get(local.UUID)
+            if entry is None or (timeutils.delta_seconds(entry[0], now) >
+                                 cfg.CONF.instance_metadata_refresh):
+                try:
+                    instance = self.nv.instance_get_by_uuid(local.UUID)
+                except Exception as err:
+                    if entry is None:
+                        LOG.warning(_('Unable to retrieve instance '
+                                      '%(uuid)s: %(error)s') %
+                                    ({'uuid': local.UUID, 'error': err}))
+                        continue
+                    # Keep polling with what we knew until Nova answers
+                    self._instances[local.UUID] = entry
+                else:
+                    # None is kept too, so the domains unknown to Nova are
+                    # not looked up at every cycle
+                    self._instances[local.UUID] = (now, instance)
+            else:
+                self._instances[local.UUID] = entry
+        return [instance for fetched_at, instance in self._instances.values()
+                if instance is not None]
+
 
 def agent_compute():
     service.prepare_service()
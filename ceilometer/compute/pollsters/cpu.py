@@ -34,7 +34,12 @@ class CPUPollster(plugin.ComputePollster):
         LOG.info(_('checking instance %s'), instance.id)
         instance_name = util.instance_name(instance)
         try:
-            cpu_info = manager.inspector.inspect_cpus(instance_name)
+            stats = util.get_instance_stats(manager.inspector, cache,
+                                            instance_name)
+            if stats is not None:
+                cpu_info = stats.cpu
+            else:
+                cpu_info = manager.inspector.inspect_cpus(instance_name)
             LOG.info(_("CPUTIME USAGE: %(instance)s %(time)d") % (
                      {'instance': instance.__dict__, 'time': cpu_info.time}))
             cpu_num = {'cpu_number': cpu_info.number}
@@ -45,6 +50,7 @@ class CPUPollster(plugin.ComputePollster):
                 unit='ns',
                 volume=cpu_info.time,
                 additional_metadata=cpu_num,
+                cache=cache,
             )
         except virt_inspector.InstanceNotFoundException as err:
             # Instance was deleted while getting samples. Ignore it.
@@ -67,9 +67,13 @@ class _Base(plugin.ComputePollster):
     def _get_vnics_for_instance(self, cache, inspector, instance_name):
         i_cache = cache.setdefault(self.CACHE_KEY_VNIC, {})
         if instance_name not in i_cache:
-            i_cache[instance_name] = list(
-                inspector.inspect_vnics(instance_name)
-            )
+            stats = util.get_instance_stats(inspector, cache, instance_name)
+            if stats is not None:
+                i_cache[instance_name] = stats.vnics
+            else:
+                i_cache[instance_name] = list(
+                    inspector.inspect_vnics(instance_name)
+                )
         return i_cache[instance_name]
 
     def get_samples(self, manager, cache, instance):
@@ -18,11 +18,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
+
 from oslo.config import cfg
 
+from ceilometer.openstack.common.gettextutils import _  # noqa
+from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 from ceilometer import sample
 
+LOG = log.getLogger(__name__)
+
 
 INSTANCE_PROPERTIES = [
     # Identity properties
@@ -100,10 +106,28 @@ def _get_metadata_from_object(instance):
     return _add_reserved_user_metadata(instance, metadata)
 
 
+CACHE_KEY_METADATA = 'resource_metadata'
+
+
+def _get_cached_metadata(instance, cache):
+    """Return the metadata dictionary of the instance for the cycle.
+
+    It is built once per instance and shared by the samples of all the
+    pollsters, so it must not be modified.
+    """
+    if cache is None:
+        return _get_metadata_from_object(instance)
+    i_cache = cache.setdefault(CACHE_KEY_METADATA, {})
+    if instance.id not in i_cache:
+        i_cache[instance.id] = _get_metadata_from_object(instance)
+    return i_cache[instance.id]
+
+
 def make_sample_from_instance(instance, name, type, unit, volume,
-                              additional_metadata={}):
-    resource_metadata = _get_metadata_from_object(instance)
-    resource_metadata.update(additional_metadata)
+                              additional_metadata={}, cache=None):
+    resource_metadata = _get_cached_metadata(instance, cache)
+    if additional_metadata:
+        resource_metadata = dict(resource_metadata, **additional_metadata)
     return sample.Sample(
         name=name,
         type=type,
@@ -120,3 +144,28 @@ def make_sample_from_instance(instance, name, type, unit, volume,
 def instance_name(instance):
     """Shortcut to get instance name."""
     return getattr(instance, 'OS-EXT-SRV-ATTR:instance_name', None)
+
+
+CACHE_KEY_ALL_STATS = 'all_stats'
+
+_all_stats_lock = threading.Lock()
+
+
+def get_instance_stats(inspector, cache, instance_name):
+    """Return the statistics of an instance from the bulk inspection.
+
+    All the instances are inspected at once the first time it is called
+    during a polling cycle. None is returned if the inspector can't do it
+    or if the instance wasn't found, the instance is then inspected alone.
+    """
+    with _all_stats_lock:
+        if CACHE_KEY_ALL_STATS not in cache:
+            try:
+                cache[CACHE_KEY_ALL_STATS] = inspector.inspect_all()
+            except NotImplementedError:
+                cache[CACHE_KEY_ALL_STATS] = {}
+            except Exception as err:
+                LOG.warning(_('Unable to inspect all the instances at '
+                              'once: %s') % err)
+                cache[CACHE_KEY_ALL_STATS] = {}
+    return cache[CACHE_KEY_ALL_STATS].get(instance_name)
@@ -98,6 +98,16 @@ DiskStats = collections.namedtuple('DiskStats',
                                     'errors'])
 
 
+# Named tuple representing the statistics of an instance.
+#
+# cpu: the CPUStats
+# vnics: the (Interface, InterfaceStats) pair of each vNIC
+# disks: the (Disk, DiskStats) pair of each disk
+#
+InstanceStats = collections.namedtuple('InstanceStats',
+                                       ['cpu', 'vnics', 'disks'])
+
+
 # Exception types
 #
 class InspectorException(Exception):
@@ -143,6 +153,13 @@ class Inspector(object):
         """
         raise NotImplementedError()
 
+    def inspect_all(self):
+        """Inspect the statistics of all the instances at once.
+
+        :return: a dict of InstanceStats by instance name
+        """
+        raise NotImplementedError()
+
 
 def get_hypervisor_inspector():
     try:
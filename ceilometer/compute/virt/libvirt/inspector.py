@@ -17,12 +17,17 @@
 # under the License.
 """Implementation of Inspector abstraction for libvirt."""
 
+import threading
+
+from eventlet import tpool
 from lxml import etree
 from oslo.config import cfg
 
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log as logging
+from ceilometer.openstack.common import timeutils
+from ceilometer import utils
 
 libvirt = None
 
@@ -37,10 +42,49 @@ libvirt_opts = [
                default='',
                help='Override the default libvirt URI '
                     '(which is dependent on libvirt_type)'),
+    cfg.IntOpt('libvirt_devices_cache_ttl',
+               default=300,
+               help='Number of seconds the devices read from the XML '
+                    'description of a domain are reused, they are read '
+                    'again sooner if the domain is restarted'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(libvirt_opts)
+CONF.import_opt('instance_polling_concurrency', 'ceilometer.compute.manager')
+CONF.import_opt('instance_polling_timeout', 'ceilometer.compute.manager')
+
+# Maximum number of domains whose UUID and devices are cached
+DOMAIN_CACHE_SIZE = 1024
+
+
+def _parse_devices(xml):
+    """Return the interfaces and the disk devices of a domain."""
+    tree = etree.fromstring(xml)
+    interfaces = []
+    for iface in tree.findall('devices/interface'):
+        target = iface.find('target')
+        if target is not None:
+            name = target.get('dev')
+        else:
+            continue
+        mac = iface.find('mac')
+        if mac is not None:
+            mac_address = mac.get('address')
+        else:
+            continue
+        fref = iface.find('filterref')
+        if fref is not None:
+            fref = fref.get('filter')
+
+        params = dict((p.get('name').lower(), p.get('value'))
+                      for p in iface.findall('filterref/parameter'))
+        interfaces.append(virt_inspector.Interface(name=name, mac=mac_address,
+                                                   fref=fref,
+                                                   parameters=params))
+    disks = filter(bool, [target.get("dev")
+                          for target in tree.findall('devices/disk/target')])
+    return interfaces, disks
 
 
 class LibvirtInspector(virt_inspector.Inspector):
@@ -50,6 +94,11 @@ class LibvirtInspector(virt_inspector.Inspector):
     def __init__(self):
         self.uri = self._get_uri()
         self.connection = None
+        # Domain UUIDs by instance name
+        self._uuids = utils.LRUCache(DOMAIN_CACHE_SIZE)
+        # (domain ID, parsing time, interfaces, disks) by domain UUID
+        self._devices = utils.LRUCache(DOMAIN_CACHE_SIZE)
+        self._lock = threading.Lock()
 
     def _get_uri(self):
         return CONF.libvirt_uri or self.per_type_uris.get(CONF.libvirt_type,
@@ -63,6 +112,17 @@ class LibvirtInspector(virt_inspector.Inspector):
 
             LOG.debug(_('Connecting to libvirt: %s'), self.uri)
             self.connection = libvirt.openReadOnly(self.uri)
+            if (CONF.instance_polling_concurrency > 1 or
+                    CONF.instance_polling_timeout):
+                # Make the blocking libvirt calls from native threads, so
+                # that the other instances are polled meanwhile and the
+                # polling deadline can fire
+                self.connection = tpool.Proxy(
+                    self.connection,
+                    autowrap=(libvirt.virConnect, libvirt.virDomain))
+            with self._lock:
+                self._uuids.clear()
+                self._devices.clear()
 
         return self.connection
 
@@ -92,6 +152,51 @@ class LibvirtInspector(virt_inspector.Inspector):
                                'ex': ex})
             raise virt_inspector.InstanceNotFoundException(msg)
 
+    def _lookup_domain(self, instance_name):
+        """Return a handle on the domain of an instance and its ID.
+
+        The ID held by a domain handle is never refreshed by libvirt, so
+        the domain is looked up again at every call: by the UUID found
+        the first time, which also tells when it is gone.
+        """
+        with self._lock:
+            uuid = self._uuids.get(instance_name)
+        if uuid is not None:
+            try:
+                domain = self._get_connection().lookupByUUIDString(uuid)
+                return domain, domain.ID()
+            except Exception as ex:
+                if not libvirt or not isinstance(ex, libvirt.libvirtError):
+                    raise virt_inspector.InspectorException(unicode(ex))
+                # The domain is gone, a new one may have taken its name
+                with self._lock:
+                    self._uuids.pop(instance_name)
+        domain = self._lookup_by_name(instance_name)
+        with self._lock:
+            self._uuids[instance_name] = domain.UUIDString()
+        return domain, domain.ID()
+
+    def _get_devices(self, domain, domain_id):
+        """Return the interfaces and the disk devices of a domain.
+
+        The XML description of the domain is only parsed again when the
+        domain has been restarted or the cached devices have expired.
+        """
+        uuid = domain.UUIDString()
+        now = timeutils.utcnow()
+        with self._lock:
+            cached = self._devices.get(uuid)
+        if cached is not None:
+            cached_id, parsed_at, interfaces, disks = cached
+            if (cached_id == domain_id and
+                    timeutils.delta_seconds(parsed_at, now) <
+                    CONF.libvirt_devices_cache_ttl):
+                return interfaces, disks
+        interfaces, disks = _parse_devices(domain.XMLDesc(0))
+        with self._lock:
+            self._devices[uuid] = (domain_id, now, interfaces, disks)
+        return interfaces, disks
+
     def inspect_instances(self):
         if self._get_connection().numOfDomains() > 0:
             for domain_id in self._get_connection().listDomainsID():
@@ -106,34 +211,17 @@ class LibvirtInspector(virt_inspector.Inspector):
                     pass
 
     def inspect_cpus(self, instance_name):
-        domain = self._lookup_by_name(instance_name)
+        domain, domain_id = self._lookup_domain(instance_name)
         (_, _, _, num_cpu, cpu_time) = domain.info()
         return virt_inspector.CPUStats(number=num_cpu, time=cpu_time)
 
     def inspect_vnics(self, instance_name):
-        domain = self._lookup_by_name(instance_name)
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for iface in tree.findall('devices/interface'):
-            target = iface.find('target')
-            if target is not None:
-                name = target.get('dev')
-            else:
-                continue
-            mac = iface.find('mac')
-            if mac is not None:
-                mac_address = mac.get('address')
-            else:
-                continue
-            fref = iface.find('filterref')
-            if fref is not None:
-                fref = fref.get('filter')
-
-            params = dict((p.get('name').lower(), p.get('value'))
-                          for p in iface.findall('filterref/parameter'))
-            interface = virt_inspector.Interface(name=name, mac=mac_address,
-                                                 fref=fref, parameters=params)
+        domain, domain_id = self._lookup_domain(instance_name)
+        interfaces, disks = self._get_devices(domain, domain_id)
+        for interface in interfaces:
             rx_bytes, rx_packets, _, _, \
-                tx_bytes, tx_packets, _, _ = domain.interfaceStats(name)
+                tx_bytes, tx_packets, _, _ = domain.interfaceStats(
+                    interface.name)
             stats = virt_inspector.InterfaceStats(rx_bytes=rx_bytes,
                                                   rx_packets=rx_packets,
                                                   tx_bytes=tx_bytes,
@@ -141,12 +229,9 @@ class LibvirtInspector(virt_inspector.Inspector):
             yield (interface, stats)
 
     def inspect_disks(self, instance_name):
-        domain = self._lookup_by_name(instance_name)
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for device in filter(
-                bool,
-                [target.get("dev")
-                 for target in tree.findall('devices/disk/target')]):
+        domain, domain_id = self._lookup_domain(instance_name)
+        interfaces, disks = self._get_devices(domain, domain_id)
+        for device in disks:
             disk = virt_inspector.Disk(device=device)
             block_stats = domain.blockStats(device)
             stats = virt_inspector.DiskStats(read_requests=block_stats[0],
@@ -155,3 +240,56 @@ class LibvirtInspector(virt_inspector.Inspector):
                                              write_bytes=block_stats[3],
                                              errors=block_stats[4])
             yield (disk, stats)
+
+    def inspect_all(self):
+        connection = self._get_connection()
+        if not hasattr(connection, 'getAllDomainStats'):
+            # The bulk statistics need libvirt >= 1.2.8
+            raise NotImplementedError()
+
+        stats_types = (libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+                       libvirt.VIR_DOMAIN_STATS_VCPU |
+                       libvirt.VIR_DOMAIN_STATS_INTERFACE |
+                       libvirt.VIR_DOMAIN_STATS_BLOCK)
+        all_stats = {}
+        for domain, stats in connection.getAllDomainStats(
+                stats_types, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE):
+            # The ID and the UUID of the domains returned are known without
+            # calling libvirt again
+            interfaces = dict((i.name, i) for i in
+                              self._get_devices(domain, domain.ID())[0])
+
+            vnics = []
+            for i in range(stats.get('net.count', 0)):
+                prefix = 'net.%d.' % i
+                interface = interfaces.get(stats.get(prefix + 'name'))
+                if interface is None:
+                    continue
+                vnics.append((interface, virt_inspector.InterfaceStats(
+                    rx_bytes=stats.get(prefix + 'rx.bytes', 0),
+                    rx_packets=stats.get(prefix + 'rx.pkts', 0),
+                    tx_bytes=stats.get(prefix + 'tx.bytes', 0),
+                    tx_packets=stats.get(prefix + 'tx.pkts', 0))))
+
+            block_devices = []
+            for i in range(stats.get('block.count', 0)):
+                prefix = 'block.%d.' % i
+                device = stats.get(prefix + 'name')
+                if not device:
+                    continue
+                block_devices.append((
+                    virt_inspector.Disk(device=device),
+                    virt_inspector.DiskStats(
+                        read_requests=stats.get(prefix + 'rd.reqs', 0),
+                        read_bytes=stats.get(prefix + 'rd.bytes', 0),
+                        write_requests=stats.get(prefix + 'wr.reqs', 0),
+                        write_bytes=stats.get(prefix + 'wr.bytes', 0),
+                        errors=stats.get(prefix + 'errors', -1))))
+
+            all_stats[domain.name()] = virt_inspector.InstanceStats(
+                cpu=virt_inspector.CPUStats(
+                    number=stats.get('vcpu.current', 0),
+                    time=stats.get('cpu.time', 0)),
+                vnics=vnics,
+                disks=block_devices)
+        return all_stats
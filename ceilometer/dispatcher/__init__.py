@@ -27,8 +27,14 @@ class Base(object):
         self.conf = conf
 
     @abc.abstractmethod
-    def record_metering_data(self, data):
-        """Recording metering data interface."""
+    def record_metering_data(self, data, verified=False):
+        """Recording metering data interface.
+
+        :param data: A metering message or a list of them.
+        :param verified: Whether the signatures of the messages were
+                         already checked, through the signature of the
+                         whole batch.
+        """
 
     @abc.abstractmethod
     def record_events(self, events):
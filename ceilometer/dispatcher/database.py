@@ -41,11 +41,12 @@ class DatabaseDispatcher(dispatcher.Base):
         super(DatabaseDispatcher, self).__init__(conf)
         self.storage_conn = storage.get_connection(conf)
 
-    def record_metering_data(self, data):
+    def record_metering_data(self, data, verified=False):
         # We may have receive only one counter on the wire
         if not isinstance(data, list):
             data = [data]
 
+        samples = []
         for meter in data:
             LOG.debug(_(
                 'metering data %(counter_name)s '
@@ -54,7 +55,7 @@ class DatabaseDispatcher(dispatcher.Base):
                     'resource_id': meter['resource_id'],
                     'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
                     'counter_volume': meter['counter_volume']}))
-            if publisher_utils.verify_signature(
+            if verified or publisher_utils.verify_signature(
                     meter,
                     self.conf.publisher.metering_secret):
                 try:
@@ -64,15 +65,36 @@ class DatabaseDispatcher(dispatcher.Base):
                     if meter.get('timestamp'):
                         ts = timeutils.parse_isotime(meter['timestamp'])
                         meter['timestamp'] = timeutils.normalize_time(ts)
-                    self.storage_conn.record_metering_data(meter)
                 except Exception as err:
                     LOG.exception(_('Failed to record metering data: %s'),
                                   err)
+                else:
+                    samples.append(meter)
             else:
                 LOG.warning(_(
                     'message signature invalid, discarding message: %r'),
                     meter)
 
+        if samples:
+            try:
+                self.storage_conn.record_metering_data_batch(samples)
+            except Exception as err:
+                if len(samples) == 1:
+                    LOG.exception(_('Failed to record metering data: %s'),
+                                  err)
+                    return
+                # Record them one by one so only the faulty ones are lost
+                LOG.warning(_('Failed to record a batch of %(count)d '
+                              'samples, recording them one by one: '
+                              '%(error)s') %
+                            {'count': len(samples), 'error': err})
+                for meter in samples:
+                    try:
+                        self.storage_conn.record_metering_data(meter)
+                    except Exception as err:
+                        LOG.exception(_('Failed to record metering data: '
+                                        '%s'), err)
+
     def record_events(self, events):
         if not isinstance(events, list):
             events = [events]
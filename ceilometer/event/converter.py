@@ -16,7 +16,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import fnmatch
 import os
 
 import jsonpath_rw
@@ -27,6 +26,7 @@ import yaml
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 from ceilometer.storage import models
+from ceilometer import utils
 
 OPTS = [
     cfg.StrOpt('definitions_cfg_file',
@@ -44,6 +44,9 @@ cfg.CONF.register_opts(OPTS, group='event')
 
 LOG = log.getLogger(__name__)
 
+# Maximum number of event types whose definition is remembered
+EVENT_TYPE_CACHE_SIZE = 1024
+
 
 class EventDefinitionException(Exception):
     def __init__(self, message, definition_cfg):
@@ -110,12 +113,55 @@ class TraitDefinition(object):
                 _("Parse error in JSONPath specification "
                   "'%(jsonpath)s' for %(trait)s: %(err)s")
                 % dict(jsonpath=fields, trait=name, err=e), self.cfg)
+        self._field_paths = self._compile_paths(self.fields)
         self.trait_type = models.Trait.get_type_by_name(type_name)
         if self.trait_type is None:
             raise EventDefinitionException(
                 _("Invalid trait type '%(type)s' for trait %(trait)s")
                 % dict(type=type_name, trait=name), self.cfg)
 
+    @classmethod
+    def _compile_paths(cls, expr):
+        """Return the keys leading to the fields of a JSONPath expression.
+
+        Only the field names and their unions are supported, the result
+        is a list of (path, keys) pairs or None for the other expressions.
+        """
+        if isinstance(expr, jsonpath_rw.Fields):
+            if len(expr.fields) == 1 and expr.fields[0] != '*':
+                return [(str(expr), (expr.fields[0],))]
+        elif isinstance(expr, (jsonpath_rw.Child, jsonpath_rw.Union)):
+            left = cls._compile_paths(expr.left)
+            right = cls._compile_paths(expr.right)
+            if left is None or right is None:
+                return None
+            if isinstance(expr, jsonpath_rw.Union):
+                return left + right
+            if len(left) == 1 and len(right) == 1:
+                (left_path, left_keys), = left
+                (right_path, right_keys), = right
+                return [('%s.%s' % (left_path, right_path),
+                         left_keys + right_keys)]
+        return None
+
+    def _find_values(self, notification_body):
+        """Return the (path, value) pairs of the fields set in the body."""
+        if self._field_paths is None:
+            return [('.'.join(self._get_path(match)), match.value)
+                    for match in self.fields.find(notification_body)
+                    if match.value is not None]
+        values = []
+        for path, keys in self._field_paths:
+            value = notification_body
+            for key in keys:
+                if not isinstance(value, dict):
+                    value = None
+                    break
+                value = value.get(key)
+            if value is not None:
+                values.append((path, value))
+        return values
+
     def _get_path(self, match):
         if match.context is not None:
             for path_element in self._get_path(match.context):
@@ -123,15 +169,12 @@ class TraitDefinition(object):
             yield str(match.path)
 
     def to_trait(self, notification_body):
-        values = [match for match in self.fields.find(notification_body)
-                  if match.value is not None]
+        values = self._find_values(notification_body)
 
         if self.plugin is not None:
-            value_map = [('.'.join(self._get_path(match)), match.value) for
-                         match in values]
-            value = self.plugin.trait_value(value_map)
+            value = self.plugin.trait_value(values)
         else:
-            value = values[0].value if values else None
+            value = values[0][1] if values else None
 
         if value is None:
             return None
@@ -178,6 +221,8 @@ class EventDefinition(object):
 
         if self._excluded_types and not self._included_types:
             self._included_types.append('*')
+        self._included_match = utils.compile_patterns(self._included_types)
+        self._excluded_match = utils.compile_patterns(self._excluded_types)
 
         for trait_name in self.DEFAULT_TRAITS:
             self.traits[trait_name] = TraitDefinition(
@@ -191,16 +236,10 @@ class EventDefinition(object):
                 trait_plugin_mgr)
 
     def included_type(self, event_type):
-        for t in self._included_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return self._included_match(event_type)
 
     def excluded_type(self, event_type):
-        for t in self._excluded_types:
-            if fnmatch.fnmatch(event_type, t):
-                return True
-        return False
+        return self._excluded_match(event_type)
 
     def match_type(self, event_type):
         return (self.included_type(event_type)
@@ -327,15 +366,25 @@ class NotificationEventsConverter(object):
             event_def = dict(event_type='*', traits={})
             self.definitions.append(EventDefinition(event_def,
                                                     trait_plugin_mgr))
+        self._definitions_by_type = utils.LRUCache(EVENT_TYPE_CACHE_SIZE)
+
+    def _get_definition(self, event_type):
+        """Return the definition of an event type, None if none matches."""
+        try:
+            return self._definitions_by_type[event_type]
+        except KeyError:
+            edef = None
+            for d in self.definitions:
+                if d.match_type(event_type):
+                    edef = d
+                    break
+            self._definitions_by_type[event_type] = edef
+            return edef
 
     def to_event(self, notification_body):
         event_type = notification_body['event_type']
         message_id = notification_body['message_id']
-        edef = None
-        for d in self.definitions:
-            if d.match_type(event_type):
-                edef = d
-                break
+        edef = self._get_definition(event_type)
 
         if edef is None:
             msg = (_('Dropping Notification %(type)s (uuid:%(msgid)s)')
@@ -29,6 +29,7 @@ from ceilometer import pipeline
 from ceilometer import service
 from ceilometer.storage import models
 from ceilometer import transformer
+from ceilometer import utils
 
 
 LOG = log.getLogger(__name__)
@@ -43,10 +44,24 @@ OPTS = [
                 deprecated_group='collector',
                 default=False,
                 help='Save event details'),
+    cfg.IntOpt('event_batch_size',
+               default=1,
+               help='Number of events buffered before being saved '
+                    'together, 1 saves each event as its notification is '
+                    'received. Buffered events which fail to be saved are '
+                    'logged and dropped instead of being requeued.'),
+    cfg.IntOpt('event_batch_timeout',
+               default=1,
+               help='Number of seconds between the saves of the buffered '
+                    'events when fewer than event_batch_size of them are '
+                    'received.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="notification")
 
+# Maximum number of event types whose handlers are remembered
+EVENT_TYPE_CACHE_SIZE = 1024
+
 
 class UnableToSaveEventException(Exception):
     """Thrown when we want to requeue an event.
@@ -60,10 +75,43 @@ class NotificationService(service.DispatchedService, rpc_service.Service):
 
     NOTIFICATION_NAMESPACE = 'ceilometer.notification'
 
+    def __init__(self, *args, **kwargs):
+        super(NotificationService, self).__init__(*args, **kwargs)
+        self._events = []
+
+    @property
+    def notification_manager(self):
+        return self._notification_manager
+
+    @notification_manager.setter
+    def notification_manager(self, manager):
+        """Set the notification handlers and index their event types."""
+        self._notification_manager = manager
+        self._event_type_matchers = [
+            (ext, utils.compile_patterns(ext.obj.event_types))
+            for ext in manager]
+        self._handlers = utils.LRUCache(EVENT_TYPE_CACHE_SIZE)
+
+    def _get_handlers(self, event_type):
+        """Return the extensions handling an event type."""
+        handlers = self._handlers.get(event_type)
+        if handlers is None:
+            handlers = [ext for ext, match in self._event_type_matchers
+                        if event_type is not None and match(event_type)]
+            self._handlers[event_type] = handlers
+        return handlers
+
     def start(self):
         super(NotificationService, self).start()
         # Add a dummy thread to have wait() working
         self.tg.add_timer(604800, lambda: None)
+        if cfg.CONF.notification.event_batch_size > 1:
+            self.tg.add_timer(cfg.CONF.notification.event_batch_timeout,
+                              self._flush_events)
+
+    def stop(self):
+        self._flush_events()
+        super(NotificationService, self).stop()
 
     def initialize_service_hook(self, service):
         '''Consumers must be declared before consume_thread start.'''
@@ -131,9 +179,25 @@ class NotificationService(service.DispatchedService, rpc_service.Service):
         bus, this method receives it. See _setup_subscription().
 
         """
-        LOG.debug(_('notification %r'), notification.get('event_type'))
-        self.notification_manager.map(self._process_notification_for_ext,
-                                      notification=notification)
+        event_type = notification.get('event_type')
+        LOG.debug(_('notification %r'), event_type)
+        handlers = self._get_handlers(event_type)
+        if handlers:
+            samples = []
+            for ext in handlers:
+                try:
+                    samples.extend(ext.obj.process_notification(notification))
+                except Exception:
+                    LOG.exception(_('Error processing notification with '
+                                    '%s'), ext.name)
+            try:
+                with self.pipeline_manager.publisher(
+                        context.get_admin_context()) as p:
+                    # FIXME(dhellmann): Spawn green thread?
+                    p(samples)
+            except Exception:
+                LOG.exception(_('Unable to publish the samples of '
+                                'notification %r'), event_type)
 
         if cfg.CONF.notification.store_events:
             self._message_to_event(notification)
@@ -148,26 +212,41 @@ class NotificationService(service.DispatchedService, rpc_service.Service):
         event = self.event_converter.to_event(body)
 
         if event is not None:
+            if cfg.CONF.notification.event_batch_size > 1:
+                self._events.append(event)
+                if (len(self._events) >=
+                        cfg.CONF.notification.event_batch_size):
+                    self._flush_events()
+                return
             LOG.debug('Saving event "%s"', event.event_type)
-            problem_events = []
-            for dispatcher in self.dispatcher_manager:
-                problem_events.extend(dispatcher.obj.record_events(event))
+            problem_events = self._record_events([event])
             if models.Event.UNKNOWN_PROBLEM in [x[0] for x in problem_events]:
                 # Don't ack the message, raise to requeue it
                 # if ack_on_error = False
                 raise UnableToSaveEventException()
 
-    def _process_notification_for_ext(self, ext, notification):
-        """Wrapper for calling pipelines when a notification arrives
-
-        When a message is received by process_notification(), it calls
-        this method with each notification plugin to allow all the
-        plugins process the notification.
-
-        """
-        with self.pipeline_manager.publisher(context.get_admin_context()) as p:
-            # FIXME(dhellmann): Spawn green thread?
-            p(list(ext.obj.to_samples(notification)))
+    def _record_events(self, events):
+        problem_events = []
+        for dispatcher in self.dispatcher_manager:
+            problem_events.extend(dispatcher.obj.record_events(events))
+        return problem_events
+
+    def _flush_events(self):
+        """Save the buffered events together."""
+        events, self._events = self._events, []
+        if not events:
+            return
+        LOG.debug(_('Saving %d events'), len(events))
+        try:
+            problem_events = self._record_events(events)
+        except Exception:
+            LOG.exception(_('Unable to save %d events'), len(events))
+            return
+        failed = [x for x in problem_events
+                  if x[0] == models.Event.UNKNOWN_PROBLEM]
+        if failed:
+            LOG.error(_('Unable to save %(failed)d of %(count)d events') %
+                      {'failed': len(failed), 'count': len(events)})
 
 
 def agent():
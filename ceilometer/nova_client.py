@@ -15,17 +15,32 @@
 # under the License.
 
 import functools
+import threading
 
 import novaclient
 from novaclient.v1_1 import client as nova_client
 from oslo.config import cfg
 
 from ceilometer.openstack.common import log
-
+from ceilometer.openstack.common import timeutils
+from ceilometer import utils
+
+OPTS = [
+    cfg.IntOpt('nova_metadata_cache_ttl',
+               default=600,
+               help='Number of seconds the flavors and images looked up '
+                    'for the instances are cached, including the ones which '
+                    'were not found; 0 disables the cache.'),
+]
+
+cfg.CONF.register_opts(OPTS)
 cfg.CONF.import_group('service_credentials', 'ceilometer.service')
 
 LOG = log.getLogger(__name__)
 
+# Maximum number of flavors and of images kept in the cache
+METADATA_CACHE_SIZE = 1024
+
 
 def logged(func):
 
@@ -56,6 +71,33 @@ class Client(object):
             endpoint_type=conf.os_endpoint_type,
             cacert=conf.os_cacert,
             no_cache=True)
+        self._flavors = utils.LRUCache(METADATA_CACHE_SIZE)
+        self._images = utils.LRUCache(METADATA_CACHE_SIZE)
+        self._lock = threading.Lock()
+
+    def _cached_get(self, cache, manager, key):
+        """Get a flavor or an image, None if it does not exist.
+
+        The lookups, including the ones which failed with NotFound, are
+        kept for nova_metadata_cache_ttl seconds.
+        """
+        ttl = cfg.CONF.nova_metadata_cache_ttl
+        now = timeutils.utcnow()
+        if ttl > 0:
+            with self._lock:
+                entry = cache.get(key)
+            if entry is not None:
+                fetched_at, value = entry
+                if timeutils.delta_seconds(fetched_at, now) <= ttl:
+                    return value
+        try:
+            value = manager.get(key)
+        except novaclient.exceptions.NotFound:
+            value = None
+        if ttl > 0:
+            with self._lock:
+                cache[key] = (now, value)
+        return value
 
     def _with_flavor_and_image(self, instances):
         for instance in instances:
@@ -66,10 +108,8 @@ class Client(object):
 
     def _with_flavor(self, instance):
         fid = instance.flavor['id']
-        try:
-            flavor = self.nova_client.flavors.get(fid)
-        except novaclient.exceptions.NotFound:
-            flavor = None
+        flavor = self._cached_get(self._flavors,
+                                  self.nova_client.flavors, fid)
 
         attr_defaults = [('name', 'unknown-id-%s' % fid),
                          ('vcpus', 0), ('ram', 0), ('disk', 0),
@@ -83,9 +123,8 @@ class Client(object):
 
     def _with_image(self, instance):
         iid = instance.image['id']
-        try:
-            image = self.nova_client.images.get(iid)
-        except novaclient.exceptions.NotFound:
+        image = self._cached_get(self._images, self.nova_client.images, iid)
+        if image is None:
             instance.image['name'] = 'unknown-id-%s' % iid
             instance.kernel_id = None
             instance.ramdisk_id = None
@@ -106,6 +145,15 @@ class Client(object):
             detailed=True,
             search_opts=search_opts))
 
+    @logged
+    def instance_get_by_uuid(self, uuid):
+        """Returns an instance, None if it does not exist."""
+        try:
+            instance = self.nova_client.servers.get(uuid)
+        except novaclient.exceptions.NotFound:
+            return None
+        return self._with_flavor_and_image([instance])[0]
+
     @logged
     def floating_ip_get_all(self):
         """Returns all floating ips."""
@@ -16,8 +16,6 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
-import fnmatch
-import itertools
 import operator
 import os
 
@@ -27,6 +25,7 @@ import yaml
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer import utils
 
 
 OPTS = [
@@ -40,6 +39,10 @@ cfg.CONF.register_opts(OPTS)
 
 LOG = log.getLogger(__name__)
 
+# Maximum number of meter names whose routing or support is remembered,
+# the names come from the samples and are not bounded
+METER_CACHE_SIZE = 1024
+
 
 class PipelineException(Exception):
     def __init__(self, message, pipeline_cfg):
@@ -50,20 +53,42 @@ class PipelineException(Exception):
         return 'Pipeline %s: %s' % (self.pipeline_cfg, self.msg)
 
 
+def _group_by_meter(samples):
+    """Return the (meter name, samples) pairs ordered by meter name."""
+    groups = {}
+    for s in samples:
+        groups.setdefault(s.name, []).append(s)
+    return sorted(groups.iteritems(), key=operator.itemgetter(0))
+
+
 class PublishContext(object):
 
-    def __init__(self, context, pipelines=[]):
+    def __init__(self, context, pipelines=[], routes=None):
         self.pipelines = set(pipelines)
         self.context = context
+        # The pipelines supporting each meter name
+        self._routes = (utils.LRUCache(METER_CACHE_SIZE) if routes is None
+                        else routes)
 
     def add_pipelines(self, pipelines):
         self.pipelines.update(pipelines)
+        # Don't alter the routes shared with the other contexts
+        self._routes = utils.LRUCache(METER_CACHE_SIZE)
+
+    def _route(self, meter_name):
+        try:
+            return self._routes[meter_name]
+        except KeyError:
+            pipelines = [p for p in self.pipelines
+                         if p.support_meter(meter_name)]
+            self._routes[meter_name] = pipelines
+            return pipelines
 
     def __enter__(self):
         def p(samples):
-            for p in self.pipelines:
-                p.publish_samples(self.context,
-                                  samples)
+            for meter_name, meter_samples in _group_by_meter(samples):
+                for p in self._route(meter_name):
+                    p.publish_meter_samples(self.context, meter_samples)
         return p
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -114,6 +139,14 @@ class Pipeline(object):
             raise PipelineException("Interval value should > 0", cfg)
 
         self._check_meters()
+        self._included_meters = utils.compile_patterns(
+            [m for m in self.meters if m[0] != '!'])
+        self._excluded_meters = utils.compile_patterns(
+            [m[1:] for m in self.meters if m[0] == '!'])
+        # Special case: if we only have negation, we suppose the default it
+        # allow
+        self._default_support = all(m[0] == '!' for m in self.meters)
+        self._supported_meters = utils.LRUCache(METER_CACHE_SIZE)
 
         if not cfg.get('publishers'):
             raise PipelineException("No publisher specified", cfg)
@@ -238,12 +271,18 @@ class Pipeline(object):
         self.publish_samples(ctxt, [sample])
 
     def publish_samples(self, ctxt, samples):
-        for meter_name, samples in itertools.groupby(
-                sorted(samples, key=operator.attrgetter('name')),
-                operator.attrgetter('name')):
+        for meter_name, samples in _group_by_meter(samples):
             if self.support_meter(meter_name):
                 self._publish_samples(0, ctxt, samples)
 
+    def publish_meter_samples(self, ctxt, samples):
+        """Push samples of a single meter supported by the pipeline.
+
+        Unlike publish_samples, this does not check the meter names, the
+        caller has already routed the samples to the pipeline.
+        """
+        self._publish_samples(0, ctxt, samples)
+
     # (yjiang5) To support meters like instance:m1.tiny,
     # which include variable part at the end starting with ':'.
     # Hope we will not add such meters in future.
@@ -255,28 +294,24 @@ class Pipeline(object):
             return name
 
     def support_meter(self, meter_name):
-        meter_name = self._variable_meter_name(meter_name)
-
-        # Special case: if we only have negation, we suppose the default it
-        # allow
-        if all(meter.startswith('!') for meter in self.meters):
-            default = True
-        else:
-            default = False
-
+        try:
+            return self._supported_meters[meter_name]
+        except KeyError:
+            supported = self._match_meter(
+                self._variable_meter_name(meter_name))
+            self._supported_meters[meter_name] = supported
+            return supported
+
+    def _match_meter(self, meter_name):
         # Support wildcard like storage.* and !disk.*
         # Start with negation, we consider that the order is deny, allow
-        if any(fnmatch.fnmatch(meter_name, meter[1:])
-               for meter in self.meters
-               if meter[0] == '!'):
+        if self._excluded_meters(meter_name):
             return False
 
-        if any(fnmatch.fnmatch(meter_name, meter)
-               for meter in self.meters
-               if meter[0] != '!'):
+        if self._included_meters(meter_name):
             return True
 
-        return default
+        return self._default_support
 
     def flush(self, ctxt):
         """Flush data after all samples have been injected to pipeline."""
@@ -355,13 +390,15 @@ class PipelineManager(object):
         """
         self.pipelines = [Pipeline(pipedef, transformer_manager)
                           for pipedef in cfg]
+        # The routing of the meters, shared by the publishers
+        self._routes = utils.LRUCache(METER_CACHE_SIZE)
 
     def publisher(self, context):
         """Build a new Publisher for these manager pipelines.
 
         :param context: The context.
         """
-        return PublishContext(context, self.pipelines)
+        return PublishContext(context, self.pipelines, self._routes)
 
 
 def setup_pipeline(transformer_manager):
@@ -96,6 +96,10 @@ class RPCPublisher(publisher.PublisherBase):
 
         self.target = options.get('target', ['record_metering_data'])[0]
 
+        # Sign each batch of messages as a whole so the collector only
+        # computes one signature per batch
+        self.sign_batch = bool(int(options.get('sign_batch', [0])[-1]))
+
         self.policy = options.get('policy', ['default'])[-1]
         self.max_queue_length = int(options.get(
             'max_queue_length', [1024])[-1])
@@ -133,7 +137,7 @@ class RPCPublisher(publisher.PublisherBase):
         msg = {
             'method': self.target,
             'version': '1.0',
-            'args': {'data': meters},
+            'args': self._make_args(meters),
         }
         LOG.audit(_('Publishing %(m)d samples on %(t)s') % (
                   {'m': len(msg['args']['data']), 't': topic}))
@@ -146,7 +150,7 @@ class RPCPublisher(publisher.PublisherBase):
                 msg = {
                     'method': self.target,
                     'version': '1.0',
-                    'args': {'data': list(meter_list)},
+                    'args': self._make_args(list(meter_list)),
                 }
                 topic_name = topic + '.' + meter_name
                 LOG.audit(_('Publishing %(m)d samples on %(n)s') % (
@@ -155,6 +159,13 @@ class RPCPublisher(publisher.PublisherBase):
 
         self.flush()
 
+    def _make_args(self, meters):
+        args = {'data': meters}
+        if self.sign_batch:
+            args['signature'] = utils.compute_batch_signature(
+                meters, cfg.CONF.publisher.metering_secret)
+        return args
+
     def flush(self):
         #note(sileht):
         # IO of the rpc stuff in handled by eventlet,
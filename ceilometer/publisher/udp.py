@@ -20,6 +20,8 @@
 """
 
 import socket
+import struct
+import urlparse
 
 import msgpack
 from oslo.config import cfg
@@ -35,12 +37,60 @@ cfg.CONF.import_opt('udp_port', 'ceilometer.collector',
 
 LOG = log.getLogger(__name__)
 
+# Payload of a datagram on an Ethernet link once the IPv4 and UDP headers
+# are removed from the 1500 bytes MTU
+DEFAULT_DATAGRAM_SIZE = 1472
+
+# Largest msgpack array header, for up to 2^32 - 1 items
+ARRAY_HEADER_SIZE = 5
+
+
+def _array_header(length):
+    """Return the msgpack header of an array of `length` items."""
+    if length < 16:
+        return chr(0x90 | length)
+    elif length < 0x10000:
+        return struct.pack('>BH', 0xdc, length)
+    return struct.pack('>BI', 0xdd, length)
+
+
+def pack_messages(messages, datagram_size):
+    """Encode the messages as msgpack arrays fitting in the datagrams.
+
+    The items of a msgpack array are the encoded values one after the
+    other, so each message is only encoded once. A message which is too
+    large to share a datagram is sent alone, not in an array.
+    """
+    payloads = []
+    batch = []
+    batch_size = ARRAY_HEADER_SIZE
+    for msg in messages:
+        data = msgpack.dumps(msg)
+        if len(data) + ARRAY_HEADER_SIZE > datagram_size:
+            payloads.append(data)
+            continue
+        if batch_size + len(data) > datagram_size:
+            payloads.append(_array_header(len(batch)) + ''.join(batch))
+            batch = []
+            batch_size = ARRAY_HEADER_SIZE
+        batch.append(data)
+        batch_size += len(data)
+    if batch:
+        payloads.append(_array_header(len(batch)) + ''.join(batch))
+    return payloads
+
 
 class UDPPublisher(publisher.PublisherBase):
     def __init__(self, parsed_url):
         self.host, self.port = network_utils.parse_host_port(
             parsed_url.netloc,
             default_port=cfg.CONF.collector.udp_port)
+        options = urlparse.parse_qs(parsed_url.query)
+        # Send several messages per datagram, the collector then
+        # receives lists of messages
+        self.packed = bool(int(options.get('packed', [0])[-1]))
+        self.datagram_size = int(options.get(
+            'datagram_size', [DEFAULT_DATAGRAM_SIZE])[-1])
         self.socket = socket.socket(socket.AF_INET,
                                     socket.SOCK_DGRAM)
 
@@ -51,6 +101,7 @@ class UDPPublisher(publisher.PublisherBase):
         :param samples: Samples from pipeline after transformation
         """
 
+        messages = []
         for sample in samples:
             msg = utils.meter_message_from_counter(
                 sample,
@@ -60,9 +111,15 @@ class UDPPublisher(publisher.PublisherBase):
             LOG.debug(_("Publishing sample %(msg)s over UDP to "
                         "%(host)s:%(port)d") % {'msg': msg, 'host': host,
                                                 'port': port})
+            messages.append(msg)
+
+        if self.packed:
+            payloads = pack_messages(messages, self.datagram_size)
+        else:
+            payloads = [msgpack.dumps(msg) for msg in messages]
+        for payload in payloads:
             try:
-                self.socket.sendto(msgpack.dumps(msg),
-                                   (self.host, self.port))
+                self.socket.sendto(payload, (self.host, self.port))
             except Exception as e:
                 LOG.warn(_("Unable to send sample over UDP"))
                 LOG.exception(e)
@@ -21,6 +21,7 @@
 
 import hashlib
 import hmac
+import json
 
 from oslo.config import cfg
 
@@ -36,8 +37,18 @@ METER_PUBLISH_OPTS = [
                                 cfg.DeprecatedOpt("metering_secret",
                                                   "publisher_rpc")]
                ),
+    cfg.IntOpt('signature_version',
+               default=1,
+               help='Version of the signature of the metering messages: 1 '
+                    'signs each flattened item, 2 signs the canonical JSON '
+                    'serialization of the message and is faster. Both are '
+                    'accepted when verifying.'),
 ]
 
+# Prefix of the version 2 signatures, the version 1 ones are bare
+# hexadecimal digests
+SIGNATURE_V2_PREFIX = 'v2:'
+
 
 def register_opts(config):
     """Register the options for publishing metering messages.
@@ -48,9 +59,25 @@ def register_opts(config):
 register_opts(cfg.CONF)
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary.
+def _canonical(value):
+    """Replace the dictionaries by their items sorted by key.
+
+    The C JSON encoder does not sort the keys itself. The items are
+    wrapped in a single key object so a dictionary can't be mistaken for
+    a list of pairs. The tuples are turned into lists as the transport
+    would do.
     """
+    if isinstance(value, dict):
+        return {'': [(key, _canonical(value[key])) for key in sorted(value)]}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+_canonical_encoder = json.JSONEncoder(separators=(',', ':'), default=unicode)
+
+
+def _compute_signature_v1(message, secret):
     digest_maker = hmac.new(secret, '', hashlib.sha256)
     for name, value in utils.recursive_keypairs(message):
         if name == 'message_signature':
@@ -62,15 +89,57 @@ def compute_signature(message, secret):
     return digest_maker.hexdigest()
 
 
+def _compute_signature_v2(message, secret):
+    # Skip any existing signature value, which would not have been part
+    # of the original message.
+    items = [(name, _canonical(message[name])) for name in sorted(message)
+             if name != 'message_signature']
+    return SIGNATURE_V2_PREFIX + hmac.new(
+        secret, _canonical_encoder.encode({'': items}),
+        hashlib.sha256).hexdigest()
+
+
+def compute_signature(message, secret, version=None):
+    """Return the signature for a message dictionary.
+
+    The version defaults to the signature_version option.
+    """
+    if version is None:
+        version = cfg.CONF.publisher.signature_version
+    if version == 2:
+        return _compute_signature_v2(message, secret)
+    return _compute_signature_v1(message, secret)
+
+
 def verify_signature(message, secret):
     """Check the signature in the message against the value computed
     from the rest of the contents.
     """
     old_sig = message.get('message_signature')
-    new_sig = compute_signature(message, secret)
+    if old_sig and old_sig.startswith(SIGNATURE_V2_PREFIX):
+        version = 2
+    else:
+        version = 1
+    new_sig = compute_signature(message, secret, version)
     return new_sig == old_sig
 
 
+def compute_batch_signature(messages, secret):
+    """Return the signature of a list of messages, as sent in one batch."""
+    return SIGNATURE_V2_PREFIX + hmac.new(
+        secret, _canonical_encoder.encode(_canonical(messages)),
+        hashlib.sha256).hexdigest()
+
+
+def verify_batch_signature(messages, signature, secret):
+    """Check the signature of a batch of messages.
+
+    When it matches, the signatures of the messages themselves do not
+    need to be checked.
+    """
+    return compute_batch_signature(messages, secret) == signature
+
+
 def meter_message_from_counter(sample, secret):
     """Make a metering message ready to be published or stored.
 
@@ -43,6 +43,11 @@ OPTS = [
                     deprecated_group="collector",
                     default=['database'],
                     help='dispatcher to process data'),
+    cfg.IntOpt('collector_workers',
+               default=1,
+               help='Number of collector processes, they all consume the '
+                    'metering messages from the same queue and receive the '
+                    'UDP samples on the same port.'),
 ]
 cfg.CONF.register_opts(OPTS)
 
@@ -95,18 +100,32 @@ class DispatchedService(object):
 
     DISPATCHER_NAMESPACE = 'ceilometer.dispatcher'
 
-    def __init__(self, *args, **kwargs):
-        super(DispatchedService, self).__init__(*args, **kwargs)
-        LOG.debug(_('loading dispatchers from %s'),
-                  self.DISPATCHER_NAMESPACE)
-        self.dispatcher_manager = named.NamedExtensionManager(
-            namespace=self.DISPATCHER_NAMESPACE,
-            names=cfg.CONF.dispatcher,
-            invoke_on_load=True,
-            invoke_args=[cfg.CONF])
-        if not list(self.dispatcher_manager):
-            LOG.warning(_('Failed to load any dispatchers for %s'),
-                        self.DISPATCHER_NAMESPACE)
+    _dispatcher_manager = None
+
+    @property
+    def dispatcher_manager(self):
+        """The dispatchers, loaded on first use.
+
+        The dispatchers open their storage connections when they are
+        loaded, so this is not done when the service is built: the
+        processes the service is forked into must not share them.
+        """
+        if self._dispatcher_manager is None:
+            LOG.debug(_('loading dispatchers from %s'),
+                      self.DISPATCHER_NAMESPACE)
+            self._dispatcher_manager = named.NamedExtensionManager(
+                namespace=self.DISPATCHER_NAMESPACE,
+                names=cfg.CONF.dispatcher,
+                invoke_on_load=True,
+                invoke_args=[cfg.CONF])
+            if not list(self._dispatcher_manager):
+                LOG.warning(_('Failed to load any dispatchers for %s'),
+                            self.DISPATCHER_NAMESPACE)
+        return self._dispatcher_manager
+
+    @dispatcher_manager.setter
+    def dispatcher_manager(self, manager):
+        self._dispatcher_manager = manager
 
 
 def prepare_service(argv=None):
@@ -50,6 +50,14 @@ STORAGE_OPTS = [
                default=-1,
                help="""number of seconds that samples are kept
 in the database for (<= 0 means forever)"""),
+    cfg.BoolOpt('rollup_statistics',
+                default=False,
+                help='Maintain 1 minute, 1 hour and 1 day rollups of the '
+                     'samples and compute the statistics from them when '
+                     'possible. Only supported by the SQLAlchemy driver. '
+                     'The rollups are only used for the queries starting '
+                     'after the option was last enabled, it must be set '
+                     'the same way for all the collectors.'),
 ]
 
 cfg.CONF.register_opts(STORAGE_OPTS, group='database')
@@ -135,6 +135,18 @@ class Connection(object):
         """
         raise NotImplementedError(_('Projects not implemented'))
 
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        Drivers able to write several samples in a few round trips
+        should override this; the default records them one by one.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        for data in samples:
+            self.record_metering_data(data)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system according to the
@@ -198,11 +210,15 @@ class Connection(object):
         raise NotImplementedError(_('Meters not implemented'))
 
     @staticmethod
-    def get_samples(sample_filter, limit=None):
+    def get_samples(sample_filter, limit=None, marker=None):
         """Return an iterable of model.Sample instances.
 
+        The samples are returned by descending timestamp and message_id.
+
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
+        :param marker: (timestamp, message_id) of the last sample already
+                       returned, only the following samples are returned.
         """
         raise NotImplementedError(_('Samples not implemented'))
 
@@ -286,8 +302,15 @@ class Connection(object):
         raise NotImplementedError(_('Events not implemented.'))
 
     @staticmethod
-    def get_events(event_filter):
+    def get_events(event_filter, limit=None, marker=None):
         """Return an iterable of model.Event objects.
+
+        The events are returned by ascending generated time and message_id.
+
+        :param event_filter: EventFilter instance
+        :param limit: Maximum number of events to return.
+        :param marker: (generated, message_id) of the last event already
+                       returned, only the following events are returned.
         """
         raise NotImplementedError(_('Events not implemented.'))
 
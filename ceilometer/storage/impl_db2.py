@@ -481,22 +481,30 @@ class Connection(base.Connection):
                     user_id=r['user_id'],
                 )
 
-    def get_samples(self, sample_filter, limit=None):
+    def get_samples(self, sample_filter, limit=None, marker=None):
         """Return an iterable of model.Sample instances.
 
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
+        :param marker: (timestamp, message_id) of the last sample already
+                       returned, only the following samples are returned.
         """
         if limit == 0:
             return
         q = make_query_from_filter(sample_filter, require_meter=False)
+        if marker:
+            timestamp, message_id = marker
+            q = {'$and': [q, {'$or': [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, 'message_id': {'$lt': message_id}},
+            ]}]}
+        sort = [("timestamp", pymongo.DESCENDING),
+                ("message_id", pymongo.DESCENDING)]
 
         if limit:
-            samples = self.db.meter.find(
-                q, limit=limit, sort=[("timestamp", pymongo.DESCENDING)])
+            samples = self.db.meter.find(q, limit=limit, sort=sort)
         else:
-            samples = self.db.meter.find(
-                q, sort=[("timestamp", pymongo.DESCENDING)])
+            samples = self.db.meter.find(q, sort=sort)
 
         for s in samples:
             # Remove the ObjectId generated by the database when
@@ -35,6 +35,7 @@ from ceilometer.openstack.common import network_utils
 from ceilometer.openstack.common import timeutils
 from ceilometer.storage import base
 from ceilometer.storage import models
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
@@ -83,8 +84,21 @@ class Connection(base.Connection):
     RESOURCE_TABLE = "resource"
     METER_TABLE = "meter"
 
+    # Number of user/project sources remembered as recorded, to avoid
+    # reading their row again on every sample.
+    SOURCE_CACHE_SIZE = 4096
+
+    # Meter columns fetched to compute statistics. The columns the query
+    # filters on must be part of them, as a SingleColumnValueFilter lets
+    # through the rows missing the column it tests.
+    STATISTICS_COLUMNS = ['f:timestamp', 'f:counter_volume',
+                          'f:counter_unit', 'f:counter_name', 'f:rts',
+                          'f:user_id', 'f:project_id', 'f:resource_id',
+                          'f:source']
+
     def __init__(self, conf):
         """Hbase Connection Initialization."""
+        self._known_sources = utils.LRUCache(self.SOURCE_CACHE_SIZE)
         opts = self._parse_connection_url(conf.database.connection)
 
         if opts['host'] == '__test__':
@@ -112,6 +126,7 @@ class Connection(base.Connection):
 
     def clear(self):
         LOG.debug(_('Dropping HBase schema...'))
+        self._known_sources.clear()
         for table in [self.PROJECT_TABLE,
                       self.USER_TABLE,
                       self.RESOURCE_TABLE,
@@ -167,56 +182,78 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self.record_metering_data_batch([data])
+
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        The rows are sent through happybase batches. The sources of the
+        users and projects only ever grow, so those already recorded are
+        neither read nor written again; they are only remembered as
+        recorded once the batches have been sent. The resource rows are
+        always written, another process may have written newer metadata.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
         project_table = self.conn.table(self.PROJECT_TABLE)
         user_table = self.conn.table(self.USER_TABLE)
         resource_table = self.conn.table(self.RESOURCE_TABLE)
         meter_table = self.conn.table(self.METER_TABLE)
 
-        # store metadata fields with prefix "r_"
-        resource_metadata = {}
-        if data['resource_metadata']:
-            resource_metadata = dict(('f:r_%s' % k, v)
-                                     for (k, v)
-                                     in data['resource_metadata'].iteritems())
-
-        # Make sure we know about the user and project
-        if data['user_id']:
-            user = user_table.row(data['user_id'])
-            sources = _load_hbase_list(user, 's')
-            # Update if source is new
-            if data['source'] not in sources:
-                user['f:s_%s' % data['source']] = "1"
-                user_table.put(data['user_id'], user)
-
-        project = project_table.row(data['project_id'])
-        sources = _load_hbase_list(project, 's')
+        # The sources recorded by these samples
+        sources = set()
+        with project_table.batch() as project_batch, \
+                user_table.batch() as user_batch, \
+                resource_table.batch() as resource_batch, \
+                meter_table.batch() as meter_batch:
+            for data in samples:
+                # Make sure we know about the user and project
+                if data['user_id']:
+                    self._record_source(user_table, user_batch,
+                                        data['user_id'], data['source'],
+                                        sources)
+                self._record_source(project_table, project_batch,
+                                    data['project_id'], data['source'],
+                                    sources)
+                resource_batch.put(*self._make_resource_row(data))
+                meter_batch.put(*self._make_meter_row(data))
+        for key in sources:
+            self._known_sources[key] = True
+
+    def _record_source(self, table, batch, key, source, pending):
+        """Add source to the sources of the user or project row key.
+
+        The source is added to pending rather than to the cache.
+        """
+        cache_key = (table.name, key, source)
+        if cache_key in pending or self._known_sources.get(cache_key):
+            return
+        row = table.row(key)
         # Update if source is new
-        if data['source'] not in sources:
-            project['f:s_%s' % data['source']] = "1"
-            project_table.put(data['project_id'], project)
-
-        rts = reverse_timestamp(data['timestamp'])
+        if source not in _load_hbase_list(row, 's'):
+            batch.put(key, {'f:s_%s' % source: "1"})
+        pending.add(cache_key)
 
-        resource = resource_table.row(data['resource_id'])
-
-        new_meter = _format_meter_reference(
-            data['counter_name'], data['counter_type'], data['counter_unit'])
-        new_resource = {'f:resource_id': data['resource_id'],
-                        'f:project_id': data['project_id'],
-                        'f:user_id': data['user_id'],
-                        'f:source': data["source"],
-                        # store meters with prefix "m_"
-                        'f:m_%s' % new_meter: "1"
-                        }
-        new_resource.update(resource_metadata)
-
-        # Update if resource has new information
-        if new_resource != resource:
-            meters = _load_hbase_list(resource, 'm')
-            if new_meter not in meters:
-                new_resource['f:m_%s' % new_meter] = "1"
+    @staticmethod
+    def _make_resource_row(data):
+        """Return the row key and columns of the resource of a sample."""
+        row = {'f:resource_id': data['resource_id'],
+               'f:project_id': data['project_id'],
+               'f:user_id': data['user_id'],
+               'f:source': data["source"],
+               }
+        row.update(_metadata_to_columns(data['resource_metadata']))
+        # store meters with prefix "m_"
+        row['f:m_%s' % _format_meter_reference(
+            data['counter_name'], data['counter_type'],
+            data['counter_unit'])] = "1"
+        return data['resource_id'], row
 
-            resource_table.put(data['resource_id'], new_resource)
+    @staticmethod
+    def _make_meter_row(data):
+        """Return the row key and columns of the meter row of a sample."""
+        rts = reverse_timestamp(data['timestamp'])
 
         # Rowkey consists of reversed timestamp, meter and an md5 of
         # user+resource+project for purposes of uniqueness
@@ -247,13 +284,13 @@ class Connection(base.Connection):
                   'f:rts': str(rts)
                   }
         # Need to record resource_metadata for more robust filtering.
-        record.update(resource_metadata)
+        record.update(_metadata_to_columns(data['resource_metadata']))
         # Don't want to be changing the original data object.
         data = copy.copy(data)
         data['timestamp'] = ts
         # Save original meter.
         record['f:message'] = json.dumps(data)
-        meter_table.put(row, record)
+        return row, record
 
     def get_users(self, source=None):
         """Return an iterable of user id strings.
@@ -416,12 +453,18 @@ class Connection(base.Connection):
                 user_id=data['f:user_id'],
             )
 
-    def get_samples(self, sample_filter, limit=None):
+    def get_samples(self, sample_filter, limit=None, marker=None):
         """Return an iterable of models.Sample instances.
 
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
+        :param marker: (timestamp, message_id) of the last sample already
+                       returned, only the following samples are returned.
         """
+        if marker:
+            # The rows are ordered by meter name first, not by timestamp
+            raise NotImplementedError(_('Sample markers not implemented'))
+
         def make_sample(data):
             """Transform HBase fields to Sample model."""
             data = json.loads(data['f:message'])
@@ -471,20 +514,17 @@ class Connection(base.Connection):
                 yield make_sample(meter)
 
     @staticmethod
-    def _update_meter_stats(stat, meter):
+    def _update_meter_stats(stat, ts, meter):
         """Do the stats calculation on a requested time bucket in stats dict
 
-        :param stats: dict where aggregated stats are kept
-        :param index: time bucket index in stats
+        :param stat: models.Statistics instance being aggregated
+        :param ts: timestamp of the meter record
         :param meter: meter record as returned from HBase
-        :param start_time: query start time
-        :param period: length of the time bucket
         """
-        vol = int(meter['f:counter_volume'])
-        ts = timeutils.parse_strtime(meter['f:timestamp'])
+        vol = float(meter['f:counter_volume'])
         stat.unit = meter['f:counter_unit']
-        stat.min = min(vol, stat.min or vol)
-        stat.max = max(vol, stat.max)
+        stat.min = vol if stat.min is None else min(vol, stat.min)
+        stat.max = vol if stat.max is None else max(vol, stat.max)
         stat.sum = vol + (stat.sum or 0)
         stat.count += 1
         stat.avg = (stat.sum / float(stat.count))
@@ -494,6 +534,39 @@ class Connection(base.Connection):
             timeutils.delta_seconds(stat.duration_start,
                                     stat.duration_end)
 
+    def _oldest_meter_timestamp(self, meter_table, meter, q, start, stop):
+        """Return the timestamp of the oldest row of a meter scan.
+
+        HBase cannot scan backwards and our meters are stored newest-first,
+        so the reversed timestamp of the oldest row is bisected with scans
+        returning a single row, then the rows of that second are read.
+        """
+        def first_rts(row_start):
+            for ignored, row in meter_table.scan(
+                    filter=q, row_start=row_start, row_stop=stop,
+                    columns=self.STATISTICS_COLUMNS, limit=1):
+                return long(row['f:rts'])
+
+        def row_key(rts):
+            return "%s_%d" % (meter, rts)
+
+        lo = first_rts(start)
+        if lo is None:
+            return None
+        hi = 0x7fffffffffffffff + 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            rts = first_rts(row_key(mid))
+            if rts is None:
+                hi = mid
+            else:
+                lo = rts
+        return min(timeutils.parse_strtime(row['f:timestamp'])
+                   for ignored, row in meter_table.scan(
+                       filter=q, row_start=row_key(lo),
+                       row_stop=min(stop, row_key(lo + 1)),
+                       columns=self.STATISTICS_COLUMNS))
+
     def get_meter_statistics(self, sample_filter, period=None, groupby=None):
         """Return an iterable of models.Statistics instances containing meter
         statistics described by the query parameters.
@@ -504,72 +577,71 @@ class Connection(base.Connection):
 
            Due to HBase limitations the aggregations are implemented
            in the driver itself, therefore this method will be quite slow
-           because of all the Thrift traffic it is going to create.
+           because of all the Thrift traffic it is going to create. The
+           rows are aggregated as they are scanned so only one
+           statistics object per period and group is kept in memory.
 
         """
-        if groupby:
-            raise NotImplementedError("Group by not implemented.")
+        if (groupby and
+                set(groupby) - set(['user_id', 'project_id',
+                                    'resource_id', 'source'])):
+            raise NotImplementedError("Unable to group by these fields")
 
         meter_table = self.conn.table(self.METER_TABLE)
 
         q, start, stop = make_query_from_filter(sample_filter)
 
-        meters = list(meter for (ignored, meter) in
-                      meter_table.scan(filter=q, row_start=start,
-                                       row_stop=stop)
-                      )
-
-        if sample_filter.start:
-            start_time = sample_filter.start
-        elif meters:
-            start_time = timeutils.parse_strtime(meters[-1]['f:timestamp'])
-        else:
-            start_time = None
-
-        if sample_filter.end:
-            end_time = sample_filter.end
-        elif meters:
-            end_time = timeutils.parse_strtime(meters[0]['f:timestamp'])
-        else:
-            end_time = None
-
+        start_time = sample_filter.start
+        if period and not start_time:
+            # The periods are aligned on the oldest sample
+            start_time = self._oldest_meter_timestamp(
+                meter_table, sample_filter.meter, q, start, stop)
+
+        rows = ((timeutils.parse_strtime(meter['f:timestamp']), meter)
+                for ignored, meter in meter_table.scan(
+                    filter=q, row_start=start, row_stop=stop,
+                    columns=self.STATISTICS_COLUMNS))
+
+        stats = {}
+        first_ts = last_ts = None
+        for ts, meter in rows:
+            first_ts = min(ts, first_ts or ts)
+            last_ts = max(ts, last_ts or ts)
+            index = (int(timeutils.delta_seconds(start_time, ts) / period)
+                     if period else 0)
+            key = (index,) + tuple(meter['f:%s' % g] for g in groupby or [])
+            stat = stats.get(key)
+            if stat is None:
+                stat = stats[key] = models.Statistics(
+                    unit='',
+                    count=0,
+                    min=None,
+                    max=None,
+                    avg=0,
+                    sum=0,
+                    period=period or 0,
+                    period_start=None,
+                    period_end=None,
+                    duration=None,
+                    duration_start=None,
+                    duration_end=None,
+                    groupby=dict(zip(groupby, key[1:])) if groupby else None)
+            self._update_meter_stats(stat, ts, meter)
+
+        start_time = start_time or first_ts
+        end_time = sample_filter.end or last_ts
         results = []
-
-        if not period:
-            period = 0
-            period_start = start_time
-            period_end = end_time
-
-        # As our HBase meters are stored as newest-first, we need to iterate
-        # in the reverse order
-        for meter in meters[::-1]:
-            ts = timeutils.parse_strtime(meter['f:timestamp'])
+        for key in sorted(stats):
+            stat = stats[key]
             if period:
-                offset = int(timeutils.delta_seconds(
-                    start_time, ts) / period) * period
-                period_start = start_time + datetime.timedelta(0, offset)
-
-            if not len(results) or not results[-1].period_start == \
-                    period_start:
-                if period:
-                    period_end = period_start + datetime.timedelta(
-                        0, period)
-                results.append(
-                    models.Statistics(unit='',
-                                      count=0,
-                                      min=0,
-                                      max=0,
-                                      avg=0,
-                                      sum=0,
-                                      period=period,
-                                      period_start=period_start,
-                                      period_end=period_end,
-                                      duration=None,
-                                      duration_start=None,
-                                      duration_end=None,
-                                      groupby=None)
-                )
-            self._update_meter_stats(results[-1], meter)
+                stat.period_start = start_time + datetime.timedelta(
+                    0, key[0] * period)
+                stat.period_end = stat.period_start + datetime.timedelta(
+                    0, period)
+            else:
+                stat.period_start = start_time
+                stat.period_end = end_time
+            results.append(stat)
         return results
 
 
@@ -592,9 +664,13 @@ class MTable(object):
         return ((k, self.row(k)) for k in keys)
 
     def put(self, key, data):
-        self._rows[key] = data
+        self._rows.setdefault(key, {}).update(data)
+
+    def batch(self):
+        return MBatch(self)
 
-    def scan(self, filter=None, columns=[], row_start=None, row_stop=None):
+    def scan(self, filter=None, columns=[], row_start=None, row_stop=None,
+             limit=None):
         sorted_keys = sorted(self._rows)
         # copy data between row_start and row_stop into a dict
         rows = {}
@@ -604,15 +680,7 @@ class MTable(object):
             if row_stop and row > row_stop:
                 break
             rows[row] = copy.copy(self._rows[row])
-        if columns:
-            ret = {}
-            for row in rows.keys():
-                data = rows[row]
-                for key in data:
-                    if key in columns:
-                        ret[row] = data
-            rows = ret
-        elif filter:
+        if filter:
             # TODO(jdanjou): we should really parse this properly,
             # but at the moment we are only going to support AND here
             filters = filter.split('AND')
@@ -630,7 +698,15 @@ class MTable(object):
                 else:
                     raise NotImplementedError("%s filter is not implemented, "
                                               "you may want to add it!")
-        for k in sorted(rows):
+        if columns:
+            ret = {}
+            for row, data in rows.iteritems():
+                selected = dict((key, value) for key, value in data.iteritems()
+                                if key in columns)
+                if selected:
+                    ret[row] = selected
+            rows = ret
+        for k in sorted(rows)[:limit]:
             yield k, rows[k]
 
     @staticmethod
@@ -664,6 +740,28 @@ class MTable(object):
         return r
 
 
+class MBatch(object):
+    """HappyBase.Batch mock
+    """
+    def __init__(self, table):
+        self.table = table
+        self._puts = []
+
+    def put(self, key, data):
+        self._puts.append((key, data))
+
+    def send(self):
+        for key, data in self._puts:
+            self.table.put(key, data)
+        self._puts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.send()
+
+
 class MConnection(object):
     """HappyBase.Connection mock
     """
@@ -823,6 +921,12 @@ def _format_meter_reference(counter_name, counter_type, counter_unit):
     return "%s!%s!%s" % (counter_name, counter_type, counter_unit)
 
 
+def _metadata_to_columns(metadata):
+    """Return the HBase columns storing the resource metadata."""
+    # store metadata fields with prefix "r_"
+    return dict(('f:r_%s' % k, v) for (k, v) in (metadata or {}).iteritems())
+
+
 def _metadata_from_document(doc):
     """Extract resource metadata from HBase document using prefix specific
     to HBase implementation.
@@ -131,7 +131,7 @@ class Connection(base.Connection):
         """
         return []
 
-    def get_samples(self, sample_filter):
+    def get_samples(self, sample_filter, limit=None, marker=None):
         """Return an iterable of samples as created by
         :func:`ceilometer.meter.meter_message_from_counter`.
         """
@@ -22,6 +22,7 @@
 
 import calendar
 import copy
+import datetime
 import json
 import operator
 import weakref
@@ -32,8 +33,10 @@ import pymongo
 
 from oslo.config import cfg
 
+from ceilometer.openstack.common import excutils
 from ceilometer.openstack.common.gettextutils import _  # noqa
 from ceilometer.openstack.common import log
+from ceilometer.openstack.common import timeutils
 from ceilometer import storage
 from ceilometer.storage import base
 from ceilometer.storage import models
@@ -312,9 +315,15 @@ class Connection(base.Connection):
         self.conn = self.CONNECTION_POOL.connect(url)
 
         # Require MongoDB 2.2 to use aggregate() and TTL
-        if self.conn.server_info()['versionArray'] < [2, 2]:
+        server_version = self.conn.server_info()['versionArray']
+        if server_version < [2, 2]:
             raise storage.StorageBadVersion("Need at least MongoDB 2.2")
 
+        # NOTE: computing the statistics with aggregate() needs the date
+        # arithmetic of the aggregation framework, older servers fall back
+        # to map_reduce.
+        self._aggregate_statistics = server_version >= [2, 4]
+
         connection_options = pymongo.uri_parser.parse_uri(url)
         self.db = getattr(self.conn, connection_options['database'])
         if connection_options.get('username'):
@@ -423,6 +432,75 @@ class Connection(base.Connection):
         record = copy.copy(data)
         self.db.meter.insert(record)
 
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        The user, project and resource updates are coalesced so each of
+        them is written once per batch, the last sample winning for the
+        resource metadata, and the meters are inserted in a single call.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        users = {}
+        projects = {}
+        resources = {}
+        for data in samples:
+            users.setdefault(data['user_id'], set()).add(data['source'])
+            projects.setdefault(data['project_id'], set()).add(data['source'])
+            resource = resources.setdefault(data['resource_id'],
+                                            {'meter': []})
+            resource['$set'] = {'project_id': data['project_id'],
+                                'user_id': data['user_id'],
+                                'metadata': data['resource_metadata'],
+                                'source': data['source'],
+                                }
+            meter = {'counter_name': data['counter_name'],
+                     'counter_type': data['counter_type'],
+                     'counter_unit': data['counter_unit'],
+                     }
+            if meter not in resource['meter']:
+                resource['meter'].append(meter)
+
+        for collection, owners in ((self.db.user, users),
+                                   (self.db.project, projects)):
+            for owner_id, sources in owners.iteritems():
+                collection.update(
+                    {'_id': owner_id},
+                    {'$addToSet': {'source': {'$each': list(sources)}}},
+                    upsert=True,
+                )
+
+        for resource_id, resource in resources.iteritems():
+            self.db.resource.update(
+                {'_id': resource_id},
+                {'$set': resource['$set'],
+                 '$addToSet': {'meter': {'$each': resource['meter']}},
+                 },
+                upsert=True,
+            )
+
+        # Copy the samples so we do not modify data structures owned by
+        # our caller (the driver adds a new key '_id').
+        meters = [copy.copy(data) for data in samples]
+        try:
+            self.db.meter.insert(meters)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Remove the meters inserted before the failure, so the
+                # caller can record the samples again. The insert error is
+                # raised even if the cleanup fails too.
+                try:
+                    self.db.meter.remove(
+                        {'_id': {'$in': [m['_id'] for m in meters
+                                         if '_id' in m]}})
+                except Exception:
+                    LOG.exception(_('Failed to remove the meters of a '
+                                    'failed batch'))
+
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system according to the
         time-to-live.
@@ -702,21 +780,29 @@ class Connection(base.Connection):
                     user_id=r['user_id'],
                 )
 
-    def get_samples(self, sample_filter, limit=None):
+    def get_samples(self, sample_filter, limit=None, marker=None):
         """Return an iterable of model.Sample instances.
 
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
+        :param marker: (timestamp, message_id) of the last sample already
+                       returned, only the following samples are returned.
         """
         if limit == 0:
             return
         q = make_query_from_filter(sample_filter, require_meter=False)
+        if marker:
+            timestamp, message_id = marker
+            q = {'$and': [q, {'$or': [
+                {'timestamp': {'$lt': timestamp}},
+                {'timestamp': timestamp, 'message_id': {'$lt': message_id}},
+            ]}]}
+        sort = [("timestamp", pymongo.DESCENDING),
+                ("message_id", pymongo.DESCENDING)]
         if limit:
-            samples = self.db.meter.find(
-                q, limit=limit, sort=[("timestamp", pymongo.DESCENDING)])
+            samples = self.db.meter.find(q, limit=limit, sort=sort)
         else:
-            samples = self.db.meter.find(
-                q, sort=[("timestamp", pymongo.DESCENDING)])
+            samples = self.db.meter.find(q, sort=sort)
 
         for s in samples:
             # Remove the ObjectId generated by the database when
@@ -749,6 +835,12 @@ class Connection(base.Connection):
                     limit=1, sort=[('timestamp',
                                     pymongo.ASCENDING)])[0]['timestamp']
             period_start = int(calendar.timegm(period_start.utctimetuple()))
+
+        if self._aggregate_statistics:
+            return self._get_meter_statistics_aggregate(
+                q, period, period_start if period else None, groupby)
+
+        if period:
             params_period = {'period': period,
                              'period_first': period_start,
                              'groupby_fields': json.dumps(groupby)}
@@ -777,6 +869,68 @@ class Connection(base.Connection):
             (models.Statistics(**(r['value'])) for r in results['results']),
             key=operator.attrgetter('period_start'))
 
+    def _get_meter_statistics_aggregate(self, q, period, period_start,
+                                        groupby):
+        """Compute the statistics with the aggregation framework.
+
+        The samples are bucketed by the number of milliseconds elapsed
+        between period_start and the start of their period, which gives
+        the same periods as the map_reduce implementation.
+        """
+        key = dict((field, '$' + field) for field in groupby or [])
+        if period:
+            first = datetime.datetime.utcfromtimestamp(period_start)
+            offset = {'$subtract': ['$timestamp', first]}
+            key['period_start'] = {'$subtract': [
+                offset, {'$mod': [offset, period * 1000]}]}
+
+        pipeline = [
+            {'$match': q},
+            {'$group': {
+                '_id': key or None,
+                'unit': {'$first': '$counter_unit'},
+                'min': {'$min': '$counter_volume'},
+                'max': {'$max': '$counter_volume'},
+                'sum': {'$sum': '$counter_volume'},
+                'avg': {'$avg': '$counter_volume'},
+                'count': {'$sum': 1},
+                'duration_start': {'$min': '$timestamp'},
+                'duration_end': {'$max': '$timestamp'},
+            }},
+        ]
+        if period:
+            pipeline.append({'$sort': {'_id.period_start': pymongo.ASCENDING}})
+
+        results = []
+        for r in self.db.meter.aggregate(pipeline)['result']:
+            if period:
+                start = first + datetime.timedelta(
+                    milliseconds=r['_id']['period_start'])
+                end = start + datetime.timedelta(seconds=period)
+            else:
+                start = r['duration_start']
+                end = r['duration_end']
+            results.append(models.Statistics(
+                unit=r['unit'],
+                min=r['min'],
+                max=r['max'],
+                avg=r['avg'],
+                sum=r['sum'],
+                count=int(r['count']),
+                duration=timeutils.delta_seconds(r['duration_start'],
+                                                 r['duration_end']),
+                duration_start=r['duration_start'],
+                duration_end=r['duration_end'],
+                period=int(period or 0),
+                period_start=start,
+                period_end=end,
+                groupby=(dict((field, r['_id'][field]) for field in groupby)
+                         if groupby else None),
+            ))
+        if not period:
+            results.sort(key=operator.attrgetter('period_start'))
+        return results
+
     @staticmethod
     def _decode_matching_metadata(matching_metadata):
         if isinstance(matching_metadata, dict):
@@ -18,18 +18,33 @@
 """SQLAlchemy storage backend."""
 
 from __future__ import absolute_import
+import calendar
 import datetime
 import eventlet
-import operator
+import functools
+import hashlib
+import json
+import math
 import os
 import types
 
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import case
+from sqlalchemy import cast
+from sqlalchemy import DateTime
 from sqlalchemy import desc
+from sqlalchemy import extract
 from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import literal
+from sqlalchemy import Numeric
+from sqlalchemy import or_
 from sqlalchemy.orm import aliased
 from sqlalchemy import pool
 
+from oslo.config import cfg
+
 from ceilometer.openstack.common.db import exception as dbexc
 import ceilometer.openstack.common.db.sqlalchemy.session as sqlalchemy_session
 from ceilometer.openstack.common.gettextutils import _  # noqa
@@ -41,6 +56,9 @@ from ceilometer.storage.sqlalchemy import migration
 from ceilometer.storage.sqlalchemy import models
 from ceilometer import utils
 
+cfg.CONF.import_opt('rollup_statistics', 'ceilometer.storage',
+                    group='database')
+
 LOG = log.getLogger(__name__)
 
 
@@ -170,6 +188,12 @@ def make_query_from_filter(session, query, sample_filter, require_meter=True):
 class Connection(base.Connection):
     """SqlAlchemy connection."""
 
+    # Granularities of the statistics rollups, coarsest first
+    ROLLUP_GRANULARITIES = (86400, 3600, 60)
+
+    # Number of samples fetched at once by get_samples
+    SAMPLE_PAGE_SIZE = 1000
+
     def __init__(self, conf):
         url = conf.database.connection
         if url == 'sqlite://':
@@ -183,6 +207,11 @@ class Connection(base.Connection):
             self.pool = eventlet.GreenPool(poolsize)
         else:
             self.pool = None
+        # Ids of the event types and trait types, which are never deleted
+        # but by clear()
+        self._event_type_ids = {}
+        self._trait_type_ids = {}
+        self._rollup_coverage_checked = False
 
     def upgrade(self):
         session = sqlalchemy_session.get_session()
@@ -193,6 +222,9 @@ class Connection(base.Connection):
         engine = session.get_bind()
         for table in reversed(models.Base.metadata.sorted_tables):
             engine.execute(table.delete())
+        self._event_type_ids.clear()
+        self._trait_type_ids.clear()
+        self._rollup_coverage_checked = False
 
     @staticmethod
     def _create_or_update(session, model_class, _id, source=None, **kwargs):
@@ -229,7 +261,31 @@ class Connection(base.Connection):
             setattr(obj, k, kwargs[k])
         return obj
 
+    def _check_rollup_coverage(self):
+        """Record since when the samples are added to the rollups.
+
+        The coverage starts when samples are first recorded with the
+        rollups enabled, and is removed as soon as samples are recorded
+        with them disabled. This is done once per connection, as the
+        option does not change while the service runs.
+        """
+        if self._rollup_coverage_checked:
+            return
+        session = sqlalchemy_session.get_session()
+        coverage = models.MeterRollupCoverage
+        try:
+            with session.begin():
+                if not cfg.CONF.database.rollup_statistics:
+                    session.query(coverage).delete()
+                elif not session.query(coverage).count():
+                    session.add(coverage(id=1, start=timeutils.utcnow()))
+        except dbexc.DBDuplicateEntry:
+            # a concurrent writer recorded the coverage in the meantime
+            pass
+        self._rollup_coverage_checked = True
+
     def record_metering_data(self, data):
+        self._check_rollup_coverage()
         if self.pool:
             if self.pool.waiting() > 0:
                 LOG.warn(_("Sqlalchemy connection pool is full, "
@@ -277,18 +333,266 @@ class Connection(base.Connection):
             meter.message_id = data['message_id']
             session.flush()
 
-            if rmetadata:
-                if isinstance(rmetadata, dict):
-                    for key, v in utils.dict_to_keyval(rmetadata):
-                        try:
-                            _model = META_TYPE_MAP[type(v)]
-                        except KeyError:
-                            LOG.warn(_("Unknown metadata type. Key (%s) will "
-                                       "not be queryable."), key)
-                        else:
-                            session.add(_model(id=meter.id,
-                                               meta_key=key,
-                                               value=v))
+            for _model, values in cls._metadata_rows(meter.id, rmetadata):
+                session.add(_model(**values))
+
+            if cfg.CONF.database.rollup_statistics:
+                cls._update_rollups(session, [data])
+
+    @staticmethod
+    def _metadata_rows(meter_id, rmetadata):
+        """Yield the (model, values) pairs to store for a sample metadata."""
+        if rmetadata and isinstance(rmetadata, dict):
+            for key, v in utils.dict_to_keyval(rmetadata):
+                try:
+                    _model = META_TYPE_MAP[type(v)]
+                except KeyError:
+                    LOG.warn(_("Unknown metadata type. Key (%s) will "
+                               "not be queryable."), key)
+                else:
+                    yield _model, dict(id=meter_id, meta_key=key, value=v)
+
+    def record_metering_data_batch(self, samples):
+        self._check_rollup_coverage()
+        if self.pool:
+            if self.pool.waiting() > 0:
+                LOG.warn(_("Sqlalchemy connection pool is full, "
+                           "perhaps pool_size should be increased"))
+            self.pool.spawn(self._record_metering_data_batch_or_each,
+                            samples)
+        else:
+            self._real_record_metering_data_batch(samples)
+
+    @classmethod
+    def _record_metering_data_batch_or_each(cls, samples):
+        """Write a batch of samples, one by one if the batch fails.
+
+        Used in the green threads of the pool, whose errors the caller
+        cannot see to record the samples again itself.
+        """
+        try:
+            cls._real_record_metering_data_batch(samples)
+        except Exception as err:
+            LOG.warn(_('Failed to record a batch of %(count)d samples, '
+                       'recording them one by one: %(error)s') %
+                     {'count': len(samples), 'error': err})
+            for data in samples:
+                try:
+                    cls._real_record_metering_data(data)
+                except Exception as err:
+                    LOG.exception(_('Failed to record metering data: %s'),
+                                  err)
+
+    @classmethod
+    def _insert_missing(cls, session, model_class, rows):
+        """Insert the rows, keyed by id, which are not in the table yet.
+
+        Return the set of ids that were already stored.
+        """
+        if not rows:
+            return set()
+        existing = set(x[0] for x in session.query(model_class.id).filter(
+            model_class.id.in_(rows.keys())))
+        missing = [values for _id, values in rows.iteritems()
+                   if _id not in existing]
+        if missing:
+            nested = session.connection().dialect.name != 'sqlite'
+            try:
+                with session.begin(nested=nested,
+                                   subtransactions=not nested):
+                    session.execute(model_class.__table__.insert(), missing)
+            except dbexc.DBDuplicateEntry:
+                # a concurrent writer created some of these rows in the
+                # meantime, so fall back to the row by row upsert
+                for values in missing:
+                    values = values.copy()
+                    cls._create_or_update(session, model_class,
+                                          values.pop('id'), **values)
+        return existing
+
+    @staticmethod
+    def _associate_sources(session, column, pairs):
+        """Record the (id, source id) pairs missing from sourceassoc."""
+        if not pairs:
+            return
+        assoc = models.sourceassoc
+        existing = set(tuple(x) for x in session.query(
+            assoc.c[column], assoc.c.source_id).filter(
+                assoc.c[column].in_(set(p[0] for p in pairs))))
+        rows = [{column: _id, 'source_id': source_id}
+                for _id, source_id in pairs - existing]
+        if rows:
+            session.execute(assoc.insert(), rows)
+
+    @classmethod
+    def _real_record_metering_data_batch(cls, samples):
+        """Write a list of samples to the backend storage system.
+
+        Sources, users, projects and resources are deduplicated in
+        memory and written with a few multi-row statements, then the
+        meters and their metadata are inserted with executemany.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        sources = {}
+        users = {}
+        projects = {}
+        resources = {}
+        user_sources = set()
+        project_sources = set()
+        resource_sources = set()
+        for data in samples:
+            source_id = data['source']
+            sources[source_id] = {'id': source_id}
+            if data['user_id']:
+                users[data['user_id']] = {'id': data['user_id']}
+                user_sources.add((data['user_id'], source_id))
+            if data['project_id']:
+                projects[data['project_id']] = {'id': data['project_id']}
+                project_sources.add((data['project_id'], source_id))
+            if data['resource_id']:
+                # The latest sample of a resource wins, as it would if
+                # the samples were recorded one by one.
+                resources[data['resource_id']] = {
+                    'id': data['resource_id'],
+                    'user_id': data['user_id'] or None,
+                    'project_id': data['project_id'] or None,
+                    'resource_metadata': data['resource_metadata'],
+                }
+                resource_sources.add((data['resource_id'], source_id))
+
+        session = sqlalchemy_session.get_session()
+        with session.begin():
+            cls._insert_missing(session, models.Source, sources)
+            cls._insert_missing(session, models.User, users)
+            cls._insert_missing(session, models.Project, projects)
+            existing = cls._insert_missing(session, models.Resource,
+                                           resources)
+            if existing:
+                resource_table = models.Resource.__table__
+                session.execute(
+                    resource_table.update().where(
+                        resource_table.c.id == bindparam('_id')),
+                    [dict(_id=_id,
+                          user_id=resources[_id]['user_id'],
+                          project_id=resources[_id]['project_id'],
+                          resource_metadata=(
+                              resources[_id]['resource_metadata']))
+                     for _id in existing])
+            cls._associate_sources(session, 'user_id', user_sources)
+            cls._associate_sources(session, 'project_id', project_sources)
+            cls._associate_sources(session, 'resource_id', resource_sources)
+
+            # Record the raw data for the meters.
+            last_id = session.query(func.max(models.Meter.id)).scalar() or 0
+            session.execute(models.Meter.__table__.insert(), [
+                dict(counter_type=data['counter_type'],
+                     counter_unit=data['counter_unit'],
+                     counter_name=data['counter_name'],
+                     user_id=data['user_id'] or None,
+                     project_id=data['project_id'] or None,
+                     resource_id=data['resource_id'] or None,
+                     timestamp=data['timestamp'],
+                     resource_metadata=data['resource_metadata'],
+                     counter_volume=data['counter_volume'],
+                     message_signature=data['message_signature'],
+                     message_id=data['message_id'])
+                for data in samples])
+
+            # executemany() does not report the generated primary keys,
+            # read them back through the message ids. The id range skips
+            # the rows stored before this batch, and as the rows are
+            # inserted in order, the newest ids of a message id belong to
+            # its last samples in the batch.
+            meter_ids = {}
+            query = session.query(models.Meter.id, models.Meter.message_id)\
+                .filter(models.Meter.id > last_id)\
+                .filter(models.Meter.message_id.in_(
+                    set(data['message_id'] for data in samples)))\
+                .order_by(models.Meter.id)
+            for meter_id, message_id in query:
+                meter_ids.setdefault(message_id, []).append(meter_id)
+            meter_sources = []
+            metadata = {}
+            for data in reversed(samples):
+                meter_id = meter_ids[data['message_id']].pop()
+                meter_sources.append({'meter_id': meter_id,
+                                      'source_id': data['source']})
+                for _model, values in cls._metadata_rows(
+                        meter_id, data['resource_metadata']):
+                    metadata.setdefault(_model, []).append(values)
+
+            session.execute(models.sourceassoc.insert(), meter_sources)
+            for _model, rows in metadata.iteritems():
+                session.execute(_model.__table__.insert(), rows)
+
+            if cfg.CONF.database.rollup_statistics:
+                cls._update_rollups(session, samples)
+
+    @classmethod
+    def _update_rollups(cls, session, samples):
+        """Add the samples to the statistics rollups they belong to."""
+        rollups = {}
+        for data in samples:
+            volume = data['counter_volume']
+            if volume is None:
+                continue
+            ts = data['timestamp']
+            epoch = calendar.timegm(ts.utctimetuple())
+            for granularity in cls.ROLLUP_GRANULARITIES:
+                key = (granularity, epoch - epoch % granularity,
+                       data['counter_name'], data['resource_id'] or None,
+                       data['project_id'] or None, data['user_id'] or None,
+                       data['source'])
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = dict(counter_unit=data['counter_unit'],
+                                        min=volume, max=volume, sum=volume,
+                                        count=1, tsmin=ts, tsmax=ts)
+                else:
+                    rollup['min'] = min(rollup['min'], volume)
+                    rollup['max'] = max(rollup['max'], volume)
+                    rollup['sum'] += volume
+                    rollup['count'] += 1
+                    rollup['tsmin'] = min(rollup['tsmin'], ts)
+                    rollup['tsmax'] = max(rollup['tsmax'], ts)
+
+        def least(column, value):
+            value = literal(value, column.type)
+            return case([(column < value, column)], else_=value)
+
+        def greatest(column, value):
+            value = literal(value, column.type)
+            return case([(column > value, column)], else_=value)
+
+        table = models.MeterRollup.__table__
+        nested = session.connection().dialect.name != 'sqlite'
+        for key, values in rollups.iteritems():
+            rollup_id = hashlib.sha1(json.dumps(key)).hexdigest()
+            update = table.update().where(table.c.id == rollup_id).values(
+                min=least(table.c.min, values['min']),
+                max=greatest(table.c.max, values['max']),
+                sum=table.c.sum + values['sum'],
+                count=table.c.count + values['count'],
+                tsmin=least(table.c.tsmin, values['tsmin']),
+                tsmax=greatest(table.c.tsmax, values['tsmax']))
+            if session.execute(update).rowcount:
+                continue
+            row = dict(values, id=rollup_id, granularity=key[0],
+                       period_start=datetime.datetime.utcfromtimestamp(key[1]),
+                       counter_name=key[2], resource_id=key[3],
+                       project_id=key[4], user_id=key[5], source_id=key[6])
+            try:
+                with session.begin(nested=nested,
+                                   subtransactions=not nested):
+                    session.execute(table.insert(), row)
+            except dbexc.DBDuplicateEntry:
+                # a concurrent writer created the rollup in the meantime
+                session.execute(update)
 
     @staticmethod
     def clear_expired_metering_data(ttl):
@@ -307,6 +611,14 @@ class Connection(base.Connection):
             for meter_obj in meter_query.all():
                 session.delete(meter_obj)
 
+            # keep the rollups whose period is only partially expired
+            rollup = models.MeterRollup
+            for granularity in Connection.ROLLUP_GRANULARITIES:
+                session.query(rollup).filter(
+                    rollup.granularity == granularity,
+                    rollup.period_start <= end - datetime.timedelta(
+                        seconds=granularity)).delete()
+
             query = session.query(models.User).filter(
                 ~models.User.id.in_(session.query(models.Meter.user_id)
                                     .group_by(models.Meter.user_id)),
@@ -536,12 +848,18 @@ class Connection(base.Connection):
                 source=resource.sources[0].id,
                 user_id=resource.user_id)
 
-    @staticmethod
-    def get_samples(sample_filter, limit=None):
+    @classmethod
+    def get_samples(cls, sample_filter, limit=None, marker=None):
         """Return an iterable of api_models.Samples.
 
+        The samples are streamed from a single ordered query, fetched
+        SAMPLE_PAGE_SIZE rows at a time, so that the whole result set is
+        never loaded in memory.
+
         :param sample_filter: Filter.
         :param limit: Maximum number of results to return.
+        :param marker: (timestamp, message_id) of the last sample already
+                       returned, only the following samples are returned.
         """
         if limit == 0:
             return
@@ -550,12 +868,19 @@ class Connection(base.Connection):
         query = session.query(models.Meter)
         query = make_query_from_filter(session, query, sample_filter,
                                        require_meter=False)
+        if marker:
+            timestamp, message_id = marker
+            query = query.filter(or_(
+                models.Meter.timestamp < timestamp,
+                and_(models.Meter.timestamp == timestamp,
+                     models.Meter.message_id < message_id)))
+        query = query.order_by(desc(models.Meter.timestamp),
+                               desc(models.Meter.message_id),
+                               desc(models.Meter.id))
         if limit:
             query = query.limit(limit)
-        samples = query.from_self()\
-            .order_by(desc(models.Meter.timestamp)).all()
 
-        for s in samples:
+        for s in query.yield_per(cls.SAMPLE_PAGE_SIZE):
             # Remove the id generated by the database when
             # the sample was inserted. It is an implementation
             # detail that should not leak outside of the driver.
@@ -626,11 +951,138 @@ class Connection(base.Connection):
                      if groupby else None)
         )
 
+    @classmethod
+    def _rollup_granularity(cls, sample_filter, period):
+        """Return the coarsest rollup granularity able to answer a
+        statistics query, or None if it has to use the raw samples.
+
+        The query has to start after the rollups coverage, the samples
+        recorded before it may be missing from them.
+        """
+        if (not cfg.CONF.database.rollup_statistics or
+                sample_filter.metaquery or
+                sample_filter.start_timestamp_op not in (None, 'ge') or
+                sample_filter.end_timestamp_op not in (None, 'lt') or
+                not sample_filter.start):
+            return None
+        session = sqlalchemy_session.get_session()
+        coverage = session.query(models.MeterRollupCoverage.start).scalar()
+        if coverage is None or sample_filter.start < coverage:
+            return None
+        bounds = [ts for ts in (sample_filter.start, sample_filter.end)
+                  if ts is not None]
+        if any(ts.microsecond for ts in bounds):
+            return None
+        for granularity in cls.ROLLUP_GRANULARITIES:
+            if period and period % granularity:
+                continue
+            if all(calendar.timegm(ts.utctimetuple()) % granularity == 0
+                   for ts in bounds):
+                return granularity
+        return None
+
+    @staticmethod
+    def _make_rollup_query(sample_filter, groupby, granularity):
+        """Same as _make_stats_query, but reading the rollups."""
+        rollup = models.MeterRollup
+        select = [
+            func.max(rollup.counter_unit).label('unit'),
+            func.min(rollup.tsmin).label('tsmin'),
+            func.max(rollup.tsmax).label('tsmax'),
+            (func.sum(rollup.sum) / func.sum(rollup.count)).label('avg'),
+            func.sum(rollup.sum).label('sum'),
+            func.min(rollup.min).label('min'),
+            func.max(rollup.max).label('max'),
+            func.sum(rollup.count).label('count'),
+        ]
+
+        session = sqlalchemy_session.get_session()
+
+        if groupby:
+            group_attributes = [getattr(rollup, g) for g in groupby]
+            select.extend(group_attributes)
+
+        query = session.query(*select).filter(
+            rollup.granularity == granularity,
+            rollup.counter_name == sample_filter.meter)
+
+        if groupby:
+            query = query.group_by(*group_attributes)
+
+        if sample_filter.source:
+            query = query.filter(rollup.source_id == sample_filter.source)
+        if sample_filter.start:
+            query = query.filter(rollup.period_start >= sample_filter.start)
+        if sample_filter.end:
+            query = query.filter(rollup.period_start < sample_filter.end)
+        if sample_filter.user:
+            query = query.filter(rollup.user_id == sample_filter.user)
+        if sample_filter.project:
+            query = query.filter(rollup.project_id == sample_filter.project)
+        if sample_filter.resource:
+            query = query.filter(rollup.resource_id == sample_filter.resource)
+        return query
+
+    @staticmethod
+    def _period_bucket(dialect, ts, start, period):
+        """Return the SQL expression of the period index of a sample.
+
+        The index is the number of whole periods elapsed between start
+        and the timestamp column ts, or None if the dialect is unknown.
+        """
+        if dialect == 'mysql':
+            # PreciseTimestamp is stored as a decimal unix timestamp
+            delta = ts - literal(utils.dt_to_decimal(start), Numeric(20, 6))
+            return func.floor(delta / period)
+        elif dialect == 'postgresql':
+            delta = extract('epoch', ts - literal(start, DateTime))
+            return func.floor(delta / period)
+        elif dialect == 'sqlite':
+            # strftime('%s') has a one second resolution, add the
+            # fractional part of the seconds to it
+            epoch = lambda t: (func.strftime('%s', t) +
+                               func.strftime('%f', t) -
+                               func.strftime('%S', t))
+            delta = epoch(ts) - epoch(literal(start, DateTime))
+            # there is no floor() in SQLite, but as the samples are
+            # never older than start the delta is never negative and
+            # the integer cast truncates it the same way
+            return cast(delta / period, Integer)
+        return None
+
+    @classmethod
+    def _get_period_statistics(cls, query, ts, bucket, start, end, period,
+                               groupby):
+        """Compute the statistics of all the periods in a single query."""
+        periods = int(math.ceil(timeutils.delta_seconds(start, end)
+                                / float(period)))
+        if not periods:
+            return
+        query = query.filter(ts >= start)
+        query = query.filter(ts < start +
+                             datetime.timedelta(seconds=periods * period))
+        bucket = bucket.label('period_bucket')
+        query = query.add_columns(bucket).group_by(bucket).order_by(bucket)
+        for r in query.all():
+            if r.count:
+                period_start = start + datetime.timedelta(
+                    seconds=int(r.period_bucket) * period)
+                yield cls._stats_result_to_model(
+                    result=r,
+                    period=period,
+                    period_start=period_start,
+                    period_end=(period_start +
+                                datetime.timedelta(seconds=period)),
+                    groupby=groupby
+                )
+
     def get_meter_statistics(self, sample_filter, period=None, groupby=None):
         """Return an iterable of api_models.Statistics instances containing
         meter statistics described by the query parameters.
 
-        The filter must have a meter value set.
+        The filter must have a meter value set. When the rollups are
+        enabled and aligned with the filter and period, the statistics
+        are computed from them instead of the raw samples.
 
         """
         if groupby:
@@ -639,8 +1091,17 @@ class Connection(base.Connection):
                     raise NotImplementedError(
                         _("Unable to group by these fields"))
 
+        granularity = self._rollup_granularity(sample_filter, period)
+        if granularity:
+            make_stats_query = functools.partial(self._make_rollup_query,
+                                                 granularity=granularity)
+            ts = models.MeterRollup.period_start
+        else:
+            make_stats_query = self._make_stats_query
+            ts = models.Meter.timestamp
+
         if not period:
-            for res in self._make_stats_query(sample_filter, groupby):
+            for res in make_stats_query(sample_filter, groupby):
                 if res.count:
                     yield self._stats_result_to_model(res, 0,
                                                       res.tsmin, res.tsmax,
@@ -648,20 +1109,30 @@ class Connection(base.Connection):
             return
 
         if not sample_filter.start or not sample_filter.end:
-            res = self._make_stats_query(sample_filter, None).first()
+            res = make_stats_query(sample_filter, None).first()
+
+        start = sample_filter.start or res.tsmin
+        end = sample_filter.end or res.tsmax
+        if start is None or end is None:
+            return
+
+        query = make_stats_query(sample_filter, groupby)
+        dialect = sqlalchemy_session.get_session().get_bind().dialect.name
+        bucket = self._period_bucket(dialect, ts, start, period)
+        if bucket is not None:
+            for stats in self._get_period_statistics(query, ts, bucket, start,
+                                                     end, period, groupby):
+                yield stats
+            return
 
-        query = self._make_stats_query(sample_filter, groupby)
         # HACK(jd) This is an awful method to compute stats by period, but
         # since we're trying to be SQL agnostic we have to write portable
         # code, so here it is, admire! We're going to do one request to get
-        # stats by period. We would like to use GROUP BY, but there's no
-        # portable way to manipulate timestamp in SQL, so we can't.
-        for period_start, period_end in base.iter_period(
-                sample_filter.start or res.tsmin,
-                sample_filter.end or res.tsmax,
-                period):
-            q = query.filter(models.Meter.timestamp >= period_start)
-            q = q.filter(models.Meter.timestamp < period_end)
+        # stats by period. It is only used for the database engines
+        # _period_bucket does not know how to manipulate timestamps for.
+        for period_start, period_end in base.iter_period(start, end, period):
+            q = query.filter(ts >= period_start)
+            q = q.filter(ts < period_end)
             for r in q.all():
                 if r.count:
                     yield self._stats_result_to_model(
@@ -921,6 +1392,91 @@ class Connection(base.Connection):
         # does it). Otherwise, just wait until all the Events are staged.
         return (event, new_traits)
 
+    def _event_type_id(self, event_type):
+        """Return the id of an event type, creating it if needed."""
+        try:
+            return self._event_type_ids[event_type]
+        except KeyError:
+            try:
+                et = self._get_or_create_event_type(event_type)
+            except dbexc.DBDuplicateEntry:
+                # created by a concurrent writer in the meantime
+                et = self._get_or_create_event_type(event_type)
+            self._event_type_ids[event_type] = et.id
+            return et.id
+
+    def _trait_type_id(self, trait_type, data_type):
+        """Return the id of a trait type, creating it if needed."""
+        key = (trait_type, data_type)
+        try:
+            return self._trait_type_ids[key]
+        except KeyError:
+            try:
+                tt = self._get_or_create_trait_type(trait_type, data_type)
+            except dbexc.DBDuplicateEntry:
+                # created by a concurrent writer in the meantime
+                tt = self._get_or_create_trait_type(trait_type, data_type)
+            self._trait_type_ids[key] = tt.id
+            return tt.id
+
+    def _record_events_batch(self, session, event_models):
+        """Store Events and their Traits with a few multi-row statements.
+
+        The event and trait types are created beforehand in their own
+        transactions, so the cached ids never refer to rolled back rows.
+
+        Return the (reason, event) tuples of the events which already
+        exist in the database or are repeated in the list.
+        """
+        event_type_ids = dict((m.event_type, self._event_type_id(m.event_type))
+                              for m in event_models)
+        trait_type_ids = dict(((t.name, t.dtype),
+                               self._trait_type_id(t.name, t.dtype))
+                              for m in event_models for t in m.traits or [])
+
+        problem_events = []
+        with session.begin():
+            stored = set(x[0] for x in session.query(
+                models.Event.message_id).filter(models.Event.message_id.in_(
+                    set(m.message_id for m in event_models))))
+            new_events = []
+            for event_model in event_models:
+                if event_model.message_id in stored:
+                    problem_events.append((api_models.Event.DUPLICATE,
+                                           event_model))
+                else:
+                    stored.add(event_model.message_id)
+                    new_events.append(event_model)
+            if not new_events:
+                return problem_events
+
+            session.execute(models.Event.__table__.insert(), [
+                dict(message_id=m.message_id,
+                     event_type_id=event_type_ids[m.event_type],
+                     generated=m.generated)
+                for m in new_events])
+
+            # executemany() does not report the generated primary keys,
+            # read them back through the unique message ids
+            event_ids = dict(session.query(
+                models.Event.message_id, models.Event.id).filter(
+                    models.Event.message_id.in_(
+                        [m.message_id for m in new_events])))
+            value_map = models.Trait._value_map
+            traits = []
+            for event_model in new_events:
+                for trait in event_model.traits or []:
+                    values = {'t_string': None, 't_float': None,
+                              't_int': None, 't_datetime': None,
+                              'event_id': event_ids[event_model.message_id],
+                              'trait_type_id': trait_type_ids[
+                                  (trait.name, trait.dtype)]}
+                    values[value_map[trait.dtype]] = trait.value
+                    traits.append(values)
+            if traits:
+                session.execute(models.Trait.__table__.insert(), traits)
+        return problem_events
+
     def record_events(self, event_models):
         """Write the events to SQL database via sqlalchemy.
 
@@ -930,10 +1486,20 @@ class Connection(base.Connection):
         (reason, event) tuple. Reasons are enumerated in
         storage.model.Event
 
-        Flush when they're all added, unless new EventTypes or
-        TraitTypes are added along the way.
+        The events are written in a single transaction. If that fails,
+        they are written again one by one, so only the faulty ones are
+        reported.
         """
+        if not event_models:
+            return []
         session = sqlalchemy_session.get_session()
+        try:
+            return self._record_events_batch(session, event_models)
+        except Exception as e:
+            LOG.warn(_('Failed to record a batch of %(count)d events, '
+                       'recording them one by one: %(error)s') %
+                     {'count': len(event_models), 'error': e})
+
         events = []
         problem_events = []
         for event_model in event_models:
@@ -951,19 +1517,32 @@ class Connection(base.Connection):
             events.append(event)
         return problem_events
 
-    def get_events(self, event_filter):
-        """Return an iterable of model.Event objects.
+    # Trait value column compared by each key of a trait filter
+    TRAIT_FILTER_COLUMNS = {'string': models.Trait.t_string,
+                            'integer': models.Trait.t_int,
+                            'datetime': models.Trait.t_datetime,
+                            'float': models.Trait.t_float}
+
+    def get_events(self, event_filter, limit=None, marker=None):
+        """Return a list of model.Event objects.
+
+        The events are returned by ascending generated time and
+        message_id. They are fetched with one query, the trait filters
+        being applied by the database, and their traits with a second one.
 
         :param event_filter: EventFilter instance
+        :param limit: Maximum number of events to return.
+        :param marker: (generated, message_id) of the last event already
+                       returned, only the following events are returned.
         """
+        if limit == 0:
+            return []
 
         start = event_filter.start_time
         end = event_filter.end_time
         session = sqlalchemy_session.get_session()
         LOG.debug(_("Getting events that match filter: %s") % event_filter)
         with session.begin():
-            event_query = session.query(models.Event)
-
             # Build up the join conditions
             event_join_conditions = [models.EventType.id ==
                                      models.Event.event_type_id]
@@ -972,8 +1551,11 @@ class Connection(base.Connection):
                 event_join_conditions\
                     .append(models.EventType.desc == event_filter.event_type)
 
-            event_query = event_query.join(models.EventType,
-                                           and_(*event_join_conditions))
+            event_query = session.query(models.Event.id,
+                                        models.Event.message_id,
+                                        models.Event.generated,
+                                        models.EventType.desc)\
+                .join(models.EventType, and_(*event_join_conditions))
 
             # Build up the where conditions
             event_filter_conditions = []
@@ -984,77 +1566,65 @@ class Connection(base.Connection):
                 event_filter_conditions.append(models.Event.generated >= start)
             if end:
                 event_filter_conditions.append(models.Event.generated <= end)
+            if marker:
+                generated, message_id = marker
+                event_filter_conditions.append(or_(
+                    models.Event.generated > generated,
+                    and_(models.Event.generated == generated,
+                         models.Event.message_id > message_id)))
+
+            for trait_filter in event_filter.traits_filter or []:
+                # Keep the events having a trait of that name and values
+                conditions = [models.Trait.trait_type_id ==
+                              models.TraitType.id,
+                              models.TraitType.desc == trait_filter['key']]
+                for key, value in trait_filter.iteritems():
+                    if key in self.TRAIT_FILTER_COLUMNS:
+                        conditions.append(
+                            self.TRAIT_FILTER_COLUMNS[key] == value)
+                event_filter_conditions.append(models.Event.id.in_(
+                    session.query(models.Trait.event_id).filter(
+                        and_(*conditions))))
 
             if event_filter_conditions:
                 event_query = event_query\
                     .filter(and_(*event_filter_conditions))
-
-            event_models_dict = {}
-            if event_filter.traits_filter:
-                for trait_filter in event_filter.traits_filter:
-
-                    # Build a sub query that joins Trait to TraitType
-                    # where the trait name matches
-                    trait_name = trait_filter.pop('key')
-                    conditions = [models.Trait.trait_type_id ==
-                                  models.TraitType.id,
-                                  models.TraitType.desc == trait_name]
-
-                    for key, value in trait_filter.iteritems():
-                        if key == 'string':
-                            conditions.append(models.Trait.t_string == value)
-                        elif key == 'integer':
-                            conditions.append(models.Trait.t_int == value)
-                        elif key == 'datetime':
-                            conditions.append(models.Trait.t_datetime == value)
-                        elif key == 'float':
-                            conditions.append(models.Trait.t_float == value)
-
-                    trait_query = session.query(models.Trait.event_id)\
-                        .join(models.TraitType, and_(*conditions)).subquery()
-
-                    event_query = event_query\
-                        .join(trait_query,
-                              models.Event.id == trait_query.c.event_id)
-            else:
-                # If there are no trait filters, grab the events from the db
-                query = session.query(models.Event.id,
-                                      models.Event.generated,
-                                      models.Event.message_id,
-                                      models.EventType.desc)\
-                    .join(models.EventType,
-                          and_(*event_join_conditions))
-                if event_filter_conditions:
-                    query = query.filter(and_(*event_filter_conditions))
-                for (id, generated, message_id, desc) in query.all():
-                    event_models_dict[id] = api_models.Event(message_id,
-                                                             desc,
-                                                             generated,
-                                                             [])
-
-            # Build event models for the events
-            event_query = event_query.subquery()
-            query = session.query(models.Trait)\
+            event_query = event_query.order_by(models.Event.generated,
+                                               models.Event.message_id)
+            if limit:
+                event_query = event_query.limit(limit)
+
+            events = []
+            events_by_id = {}
+            for id, message_id, generated, desc in event_query.all():
+                event = api_models.Event(message_id, desc, generated, [])
+                events.append(event)
+                events_by_id[id] = event
+            if not events:
+                return events
+
+            # Fetch the traits of all these events at once
+            event_ids = event_query.subquery()
+            query = session.query(models.Trait.event_id,
+                                  models.TraitType.desc,
+                                  models.TraitType.data_type,
+                                  models.Trait.t_string,
+                                  models.Trait.t_float,
+                                  models.Trait.t_int,
+                                  models.Trait.t_datetime)\
                 .join(models.TraitType,
                       models.Trait.trait_type_id == models.TraitType.id)\
-                .join(event_query, models.Trait.event_id == event_query.c.id)
+                .join(event_ids, models.Trait.event_id == event_ids.c.id)\
+                .order_by(models.Trait.id)
 
-            # Now convert the sqlalchemy objects back into Models ...
-            for trait in query.all():
-                event = event_models_dict.get(trait.event_id)
-                if not event:
-                    event = api_models.Event(
-                        trait.event.message_id,
-                        trait.event.event_type.desc,
-                        trait.event.generated, [])
-                    event_models_dict[trait.event_id] = event
-                trait_model = api_models.Trait(trait.trait_type.desc,
-                                               trait.trait_type.data_type,
-                                               trait.get_value())
-                event.append_trait(trait_model)
-
-        event_models = event_models_dict.values()
-        return sorted(event_models, key=operator.attrgetter('generated'))
+            value_map = models.Trait._value_map
+            for row in query.all():
+                column = value_map.get(row.data_type)
+                value = getattr(row, column) if column else None
+                events_by_id[row.event_id].append_trait(
+                    api_models.Trait(row.desc, row.data_type, value))
+
+        return events
 
     @staticmethod
     def get_event_types():
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import MetaData, Table, Column, Index
+from sqlalchemy import Float, Integer, String
+
+from ceilometer.storage.sqlalchemy import models
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    meter_rollup = Table(
+        'meter_rollup', meta,
+        Column('id', String(40), primary_key=True),
+        Column('granularity', Integer),
+        Column('period_start', models.PreciseTimestamp()),
+        Column('counter_name', String(255)),
+        Column('counter_unit', String(255)),
+        Column('resource_id', String(255)),
+        Column('project_id', String(255)),
+        Column('user_id', String(255)),
+        Column('source_id', String(255)),
+        Column('min', Float(53)),
+        Column('max', Float(53)),
+        Column('sum', Float(53)),
+        Column('count', Integer),
+        Column('tsmin', models.PreciseTimestamp()),
+        Column('tsmax', models.PreciseTimestamp()),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8')
+    meter_rollup.create()
+    Index('ix_meter_rollup_name_period', meter_rollup.c.counter_name,
+          meter_rollup.c.granularity, meter_rollup.c.period_start).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    meter_rollup = Table('meter_rollup', meta, autoload=True)
+    meter_rollup.drop()
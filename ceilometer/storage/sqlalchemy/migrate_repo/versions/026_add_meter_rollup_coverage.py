@@ -0,0 +1,36 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import MetaData, Table, Column
+from sqlalchemy import Integer
+
+from ceilometer.storage.sqlalchemy import models
+
+
+def upgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    meter_rollup_coverage = Table(
+        'meter_rollup_coverage', meta,
+        Column('id', Integer, primary_key=True),
+        Column('start', models.PreciseTimestamp()),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8')
+    meter_rollup_coverage.create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData(bind=migrate_engine)
+    meter_rollup_coverage = Table('meter_rollup_coverage', meta,
+                                  autoload=True)
+    meter_rollup_coverage.drop()
@@ -222,6 +222,47 @@ class Meter(Base):
                              cascade="all, delete-orphan")
 
 
+class MeterRollup(Base):
+    """Statistics of the samples of a meter over a period.
+
+    The id is a hash of the granularity, period start, counter name,
+    resource, project, user and source the statistics are about.
+    """
+
+    __tablename__ = 'meter_rollup'
+    __table_args__ = (
+        Index('ix_meter_rollup_name_period', 'counter_name', 'granularity',
+              'period_start'),
+    )
+    id = Column(String(40), primary_key=True)
+    granularity = Column(Integer)
+    period_start = Column(PreciseTimestamp())
+    counter_name = Column(String(255))
+    counter_unit = Column(String(255))
+    resource_id = Column(String(255))
+    project_id = Column(String(255))
+    user_id = Column(String(255))
+    source_id = Column(String(255))
+    min = Column(Float(53))
+    max = Column(Float(53))
+    sum = Column(Float(53))
+    count = Column(Integer)
+    tsmin = Column(PreciseTimestamp())
+    tsmax = Column(PreciseTimestamp())
+
+
+class MeterRollupCoverage(Base):
+    """Time since which all the recorded samples are in the rollups.
+
+    The single row is written when samples are first recorded with the
+    rollups enabled, and removed when samples are recorded without them.
+    """
+
+    __tablename__ = 'meter_rollup_coverage'
+    id = Column(Integer, primary_key=True)
+    start = Column(PreciseTimestamp())
+
+
 class User(Base):
     __tablename__ = 'user'
     id = Column(String(255), primary_key=True)
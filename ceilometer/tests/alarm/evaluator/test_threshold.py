@@ -17,11 +17,14 @@
 # under the License.
 """Tests for ceilometer/alarm/evaluator/threshold.py
 """
+import copy
 import datetime
 import mock
+import urlparse
 import uuid
 
 from ceilometer.alarm.evaluator import threshold
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import timeutils
 from ceilometer.storage import models
 from ceilometer.tests.alarm.evaluator import base
@@ -311,3 +314,87 @@ class TestEvaluate(base.TestEvaluatorBase):
                                       os_endpoint_type=conf.os_endpoint_type)]
                 actual = client.call_args_list
                 self.assertEqual(actual, expected)
+
+    def _resource_alarms(self, *resource_ids):
+        alarms = []
+        for resource_id in resource_ids:
+            alarm = copy.deepcopy(self.alarms[0])
+            alarm.alarm_id = str(uuid.uuid4())
+            alarm.rule['query'][1]['value'] = resource_id
+            alarms.append(alarm)
+        return alarms
+
+    def _group_min_size(self, size):
+        self.useFixture(config.Config()).conf.set_override(
+            'statistics_group_min_size', size, group='alarm')
+
+    def test_grouped_statistics(self):
+        self._group_min_size(3)
+        alarms = self._resource_alarms('a', 'b', 'c') + [self.alarms[1]]
+        threshold = alarms[0].rule['threshold']
+
+        def _stat(value, resource_id):
+            return statistics.Statistics(
+                None, {'avg': value, 'groupby': {'resource_id': resource_id}})
+
+        grouped = ([_stat(threshold + v, 'a') for v in xrange(1, 6)] +
+                   [_stat(threshold - v, 'b') for v in xrange(5)])
+        maxs = [self._get_stat('max', self.alarms[1].rule['threshold'] - v)
+                for v in xrange(4)]
+
+        with mock.patch('ceilometerclient.client.get_client',
+                        return_value=self.api_client):
+            self.api_client.statistics._list.return_value = grouped
+            self.api_client.statistics.list.return_value = maxs
+            self.evaluator.evaluate_all(alarms)
+        self.assertEqual(['alarm', 'ok', 'insufficient data', 'alarm'],
+                         [alarm.state for alarm in alarms])
+        self.assertEqual(1, self.api_client.statistics.list.call_count)
+        url = self.api_client.statistics._list.call_args[0][0]
+        path, params = url.split('?')
+        self.assertEqual('/v2/meters/cpu_util/statistics', path)
+        params = urlparse.parse_qs(params)
+        self.assertEqual(['resource_id'], params['groupby'])
+        self.assertEqual(['60'], params['period'])
+        self.assertEqual(['meter', 'timestamp', 'timestamp'],
+                         sorted(params['q.field']))
+
+    def test_grouped_statistics_failure(self):
+        self._group_min_size(2)
+        alarms = self._resource_alarms('a', 'b')
+        threshold = alarms[0].rule['threshold']
+        avgs = [self._get_stat('avg', threshold + v) for v in xrange(1, 6)]
+
+        def _list(meter_name, q, period):
+            resources = [x['value'] for x in q if x['field'] == 'resource_id']
+            return avgs if resources == ['a'] else []
+
+        with mock.patch('ceilometerclient.client.get_client',
+                        return_value=self.api_client):
+            self.api_client.statistics._list.side_effect = (
+                exc.HTTPNotImplemented())
+            self.api_client.statistics.list.side_effect = _list
+            self.evaluator.evaluate_all(alarms)
+        self.assertEqual(['alarm', 'insufficient data'],
+                         [alarm.state for alarm in alarms])
+        self.assertEqual(1, self.api_client.statistics._list.call_count)
+        self.assertEqual(2, self.api_client.statistics.list.call_count)
+
+    def test_small_groups_not_grouped(self):
+        self._group_min_size(3)
+        alarms = self._resource_alarms('a', 'b')
+        threshold = alarms[0].rule['threshold']
+        avgs = [self._get_stat('avg', threshold + v) for v in xrange(1, 6)]
+
+        def _list(meter_name, q, period):
+            resources = [x['value'] for x in q if x['field'] == 'resource_id']
+            return avgs if resources == ['a'] else []
+
+        with mock.patch('ceilometerclient.client.get_client',
+                        return_value=self.api_client):
+            self.api_client.statistics.list.side_effect = _list
+            self.evaluator.evaluate_all(alarms)
+        self.assertEqual(['alarm', 'insufficient data'],
+                         [alarm.state for alarm in alarms])
+        self.assertFalse(self.api_client.statistics._list.called)
+        self.assertEqual(2, self.api_client.statistics.list.call_count)
@@ -69,7 +69,7 @@ class TestSingletonAlarmService(test.BaseTestCase):
         with mock.patch('ceilometerclient.client.get_client',
                         return_value=self.api_client):
             self.singleton._evaluate_assigned_alarms()
-            self.threshold_eval.evaluate.assert_called_once_with(alarm)
+            self.threshold_eval.evaluate_all.assert_called_once_with([alarm])
 
     def test_unknown_extention_skipped(self):
         alarms = [
@@ -82,7 +82,8 @@ class TestSingletonAlarmService(test.BaseTestCase):
                         return_value=self.api_client):
             self.singleton.start()
             self.singleton._evaluate_assigned_alarms()
-            self.threshold_eval.evaluate.assert_called_once_with(alarms[1])
+            self.threshold_eval.evaluate_all.assert_called_once_with(
+                [alarms[1]])
 
     def test_singleton_endpoint_types(self):
         endpoint_types = ["internalURL", "publicURL"]
@@ -0,0 +1,110 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/api/statistics_cache.py
+"""
+import datetime
+
+import mock
+
+from ceilometer.api import statistics_cache
+from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
+from ceilometer import storage
+from ceilometer.storage import base
+from ceilometer.storage import models
+
+
+class TestStatisticsCache(test.BaseTestCase):
+
+    def setUp(self):
+        super(TestStatisticsCache, self).setUp()
+        self.start = datetime.datetime(2013, 8, 1, 10, 0)
+        self.cache = statistics_cache.StatisticsCache(100, 600)
+        self.conn = mock.Mock()
+        self.conn.get_meter_statistics.side_effect = self._statistics
+        timeutils.set_time_override(datetime.datetime(2013, 8, 1, 10, 45))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _statistics(self, sample_filter, period, groupby):
+        # One sample at the start of each period
+        end = sample_filter.end or timeutils.utcnow()
+        return [models.Statistics(unit='%', min=1, max=1, avg=1, sum=1,
+                                  count=1, period=period,
+                                  period_start=period_start,
+                                  period_end=period_end,
+                                  duration=0,
+                                  duration_start=period_start,
+                                  duration_end=period_start,
+                                  groupby=None)
+                for period_start, period_end in base.iter_period(
+                    sample_filter.start, end, period or 3600)]
+
+    def _filter(self, minutes, end_timestamp_op=None):
+        return storage.SampleFilter(
+            meter='cpu_util', start=self.start,
+            end=self.start + datetime.timedelta(minutes=minutes),
+            end_timestamp_op=end_timestamp_op)
+
+    def _starts(self, statistics):
+        return [s.period_start for s in statistics]
+
+    def test_closed_periods_are_cached(self):
+        first = self.cache.get_meter_statistics(self.conn, self._filter(60),
+                                                600)
+        second = self.cache.get_meter_statistics(self.conn,
+                                                 self._filter(60), 600)
+        self.assertEqual(self._starts(first), self._starts(second))
+        self.assertEqual(len(second), 6)
+        # Only the period still open at 10:45 is computed again
+        f = self.conn.get_meter_statistics.call_args[0][0]
+        self.assertEqual(f.start, datetime.datetime(2013, 8, 1, 10, 40))
+        self.assertEqual(f.start_timestamp_op, 'ge')
+        self.assertEqual(self.conn.get_meter_statistics.call_count, 2)
+
+    def test_truncated_last_period_is_not_cached(self):
+        self.cache.get_meter_statistics(self.conn, self._filter(25), 600)
+        self.cache.get_meter_statistics(self.conn, self._filter(30), 600)
+        f = self.conn.get_meter_statistics.call_args[0][0]
+        self.assertEqual(f.start, datetime.datetime(2013, 8, 1, 10, 20))
+
+    def test_ttl(self):
+        self.cache.get_meter_statistics(self.conn, self._filter(30), 600)
+        timeutils.advance_time_seconds(601)
+        self.cache.get_meter_statistics(self.conn, self._filter(30), 600)
+        f = self.conn.get_meter_statistics.call_args[0][0]
+        self.assertEqual(f.start, self.start)
+
+    def test_different_filters_are_not_shared(self):
+        self.cache.get_meter_statistics(self.conn, self._filter(30), 600)
+        f = self._filter(30)
+        f.resource = 'resource-id'
+        self.cache.get_meter_statistics(self.conn, f, 600)
+        self.assertEqual(self.conn.get_meter_statistics.call_args[0][0].start,
+                         self.start)
+
+    def test_not_cacheable(self):
+        f = storage.SampleFilter(meter='cpu_util', start=self.start)
+        for i in range(2):
+            self.cache.get_meter_statistics(self.conn, f, 600)
+            self.conn.get_meter_statistics.assert_called_with(f, 600, None)
+        self.cache.get_meter_statistics(self.conn, self._filter(30))
+        self.conn.get_meter_statistics.assert_called_with(mock.ANY,
+                                                          None, None)
+
+    def test_disabled(self):
+        cache = statistics_cache.StatisticsCache(0, 600)
+        f = self._filter(30)
+        for i in range(2):
+            cache.get_meter_statistics(self.conn, f, 600)
+            self.conn.get_meter_statistics.assert_called_with(f, 600, None)
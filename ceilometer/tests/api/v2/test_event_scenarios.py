@@ -131,6 +131,17 @@ class TestEventAPI(EventTestBase):
                                'trait_C', 'trait_D']:
                 self.assertTrue(trait_name in event['traits'])
 
+    def test_get_events_limit(self):
+        data = self.get_json(self.PATH, headers=headers, limit=2)
+        self.assertEqual(['0', '100'], [e['message_id'] for e in data])
+        for event in data:
+            self.assertEqual(4, len(event['traits']))
+
+    def test_get_events_limit_negative(self):
+        resp = self.get_json(self.PATH, headers=headers, limit=-1,
+                             expect_errors=True)
+        self.assertEqual(400, resp.status_int)
+
     def test_get_event_by_message_id(self):
         event = self.get_json(self.PATH + "/100", headers=headers)
         expected_traits = {'trait_D': '2013-12-31T05:00:00',
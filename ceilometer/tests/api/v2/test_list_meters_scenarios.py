@@ -503,3 +503,33 @@ class TestListMeters(FunctionalTest,
             expected = base64.encodestring('%s+%s' % (i['resource_id'],
                                                       i['name']))
             self.assertEqual(expected, i['meter_id'])
+
+    def test_list_samples_stream(self):
+        data = self.get_json('/samples', stream=True)
+        self.assertEqual(5, len(data['samples']))
+        self.assertEqual([], data['links'])
+
+    def test_list_samples_stream_pages(self):
+        expected = [s['id'] for s in self.get_json('/samples')]
+        data = self.get_json('/samples', stream=True, limit=2)
+        ids = [s['id'] for s in data['samples']]
+        while data['links']:
+            self.assertEqual('next', data['links'][0]['rel'])
+            response = self.app.get(data['links'][0]['href'],
+                                    expect_errors=True)
+            if response.status_int == 501:
+                self.skipTest('Sample markers not implemented')
+            data = response.json
+            ids.extend(s['id'] for s in data['samples'])
+        self.assertEqual(expected, ids)
+
+    def test_list_meter_samples_stream(self):
+        data = self.get_json('/meters/meter.test', stream=True, limit=2)
+        self.assertEqual(['meter.test', 'meter.test'],
+                         [s['counter_name'] for s in data['samples']])
+        self.assertEqual('next', data['links'][0]['rel'])
+
+    def test_list_samples_invalid_marker(self):
+        data = self.get_json('/samples', marker='not-a-marker',
+                             expect_errors=True)
+        self.assertEqual(400, data.status_int)
@@ -31,6 +31,7 @@ class TestPollsterBase(test.BaseTestCase):
         self.addCleanup(mock.patch.stopall)
 
         self.inspector = mock.Mock()
+        self.inspector.inspect_all.side_effect = NotImplementedError
         self.instance = mock.MagicMock()
         self.instance.name = 'instance-00000001'
         setattr(self.instance, 'OS-EXT-SRV-ATTR:instance_name',
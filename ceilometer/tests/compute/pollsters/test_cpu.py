@@ -25,6 +25,7 @@ import six
 
 from ceilometer.compute import manager
 from ceilometer.compute.pollsters import cpu
+from ceilometer.compute.pollsters import util
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.tests.compute.pollsters import base
 
@@ -78,4 +79,24 @@ class TestCPUPollster(base.TestPollsterBase):
         samples = list(pollster.get_samples(mgr, cache, self.instance))
         self.assertEqual(len(samples), 1)
         self.assertEqual(samples[0].volume, 10 ** 6)
-        self.assertEqual(len(cache), 0)
+        # Only the failed bulk inspection and the metadata are remembered
+        self.assertEqual(set(cache), set([util.CACHE_KEY_ALL_STATS,
+                                          util.CACHE_KEY_METADATA]))
+        self.assertEqual(cache[util.CACHE_KEY_ALL_STATS], {})
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_get_samples_bulk_inspection(self):
+        cpu_stats = virt_inspector.CPUStats(time=1 * (10 ** 6), number=2)
+        self.inspector.inspect_all = mock.Mock(return_value={
+            self.instance.name: virt_inspector.InstanceStats(
+                cpu=cpu_stats, vnics=[], disks=[])})
+
+        mgr = manager.AgentManager()
+        pollster = cpu.CPUPollster()
+
+        cache = {}
+        for i in range(2):
+            samples = list(pollster.get_samples(mgr, cache, self.instance))
+            self.assertEqual(samples[0].volume, 10 ** 6)
+        self.assertEqual(self.inspector.inspect_all.call_count, 1)
+        self.assertFalse(self.inspector.inspect_cpus.called)
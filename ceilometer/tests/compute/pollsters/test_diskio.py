@@ -73,3 +73,25 @@ class TestDiskPollsters(base.TestPollsterBase):
     def test_disk_write_bytes(self):
         self._check_get_samples(disk.WriteBytesPollster,
                                 'disk.write.bytes', 3L)
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_bulk_inspection(self):
+        self.inspector.inspect_all = mock.Mock(return_value={
+            self.instance.name: virt_inspector.InstanceStats(
+                cpu=None, vnics=[], disks=self.DISKS)})
+
+        mgr = manager.AgentManager()
+        samples = list(disk.ReadBytesPollster().get_samples(mgr, {},
+                                                            self.instance))
+        self.assertEqual(samples[0].volume, 1L)
+        self.assertFalse(self.inspector.inspect_disks.called)
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_bulk_inspection_unknown_instance(self):
+        self.inspector.inspect_all = mock.Mock(return_value={})
+
+        mgr = manager.AgentManager()
+        samples = list(disk.ReadBytesPollster().get_samples(mgr, {},
+                                                            self.instance))
+        self.assertEqual(samples[0].volume, 1L)
+        self.assertTrue(self.inspector.inspect_disks.called)
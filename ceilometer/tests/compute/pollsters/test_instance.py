@@ -22,6 +22,7 @@ import mock
 
 from ceilometer.compute import manager
 from ceilometer.compute.pollsters import instance as pollsters_instance
+from ceilometer.compute.pollsters import util
 from ceilometer.tests.compute.pollsters import base
 
 
@@ -50,3 +51,30 @@ class TestInstancePollster(base.TestPollsterBase):
         samples = list(pollster.get_samples(mgr, {}, self.instance))
         self.assertEqual(len(samples), 1)
         self.assertEqual(samples[0].name, 'instance:m1.small')
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_metadata_shared_in_cycle(self):
+        mgr = manager.AgentManager()
+        cache = {}
+        with mock.patch.object(util, '_get_metadata_from_object',
+                               wraps=util._get_metadata_from_object) as md:
+            samples = []
+            for pollster in (pollsters_instance.InstancePollster(),
+                             pollsters_instance.InstanceFlavorPollster()):
+                samples.extend(pollster.get_samples(mgr, cache,
+                                                    self.instance))
+        self.assertEqual(md.call_count, 1)
+        self.assertIs(samples[0].resource_metadata,
+                      samples[1].resource_metadata)
+
+    def test_additional_metadata_is_not_shared(self):
+        cache = {}
+        first = util.make_sample_from_instance(
+            self.instance, 'cpu', 'cumulative', 'ns', 1,
+            additional_metadata={'cpu_number': 2}, cache=cache)
+        second = util.make_sample_from_instance(
+            self.instance, 'instance', 'gauge', 'instance', 1, cache=cache)
+        self.assertEqual(first.resource_metadata['cpu_number'], 2)
+        self.assertNotIn('cpu_number', second.resource_metadata)
+        self.assertEqual(first.resource_metadata['vcpus'],
+                         second.resource_metadata['vcpus'])
@@ -17,12 +17,16 @@
 # under the License.
 """Tests for ceilometer/agent/manager.py
 """
+from eventlet import event
 import mock
 
 from ceilometer.compute import manager
+from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer import nova_client
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common.fixture import mockpatch
 from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
 from ceilometer.tests import agentbase
 
 
@@ -82,3 +86,127 @@ class TestRunTasks(agentbase.BaseAgentManagerTestCase):
             mgr = manager.AgentManager()
             polling_task = manager.PollingTask(mgr)
             polling_task.poll_and_publish()
+
+    def test_concurrent_polling(self):
+        self.CONF.set_override('instance_polling_concurrency', 4)
+        instances = [self._fake_instance('instance-%d' % i, 'active')
+                     for i in range(10)]
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        polling_task.poll_and_publish_instances(instances)
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(len(pub.samples), 10)
+        self.assertEqual(set(i for m, i in self.Pollster.samples),
+                         set(instances))
+
+    def test_polling_timeout(self):
+        self.CONF.set_override('instance_polling_concurrency', 2)
+        # a short deadline, the hung pollster is only stopped by it
+        self.CONF.set_override('instance_polling_timeout', 0.01)
+        slow_instance = self._fake_instance('slow', 'active')
+        hung = event.Event()
+
+        def get_samples(manager, cache, instance):
+            if instance is slow_instance:
+                hung.wait()
+            return [self.Pollster.test_data]
+
+        polling_task = self.mgr.setup_polling_tasks()[60]
+        with mock.patch.object(self.Pollster, 'get_samples',
+                               side_effect=get_samples):
+            polling_task.poll_and_publish_instances([slow_instance,
+                                                     self.instance])
+        self.assertFalse(hung.ready())
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(len(pub.samples), 1)
+
+
+class TestLocalDiscovery(test.BaseTestCase):
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def setUp(self):
+        super(TestLocalDiscovery, self).setUp()
+        self.mgr = manager.AgentManager()
+        self.mgr._inspector = mock.Mock()
+        self.local = [virt_inspector.Instance(name='instance-1', UUID='a'),
+                      virt_inspector.Instance(name='instance-2', UUID='b')]
+        self.mgr._inspector.inspect_instances.side_effect = (
+            lambda: iter(self.local))
+        self.nova = self.useFixture(mockpatch.PatchObject(
+            nova_client.Client, 'instance_get_by_uuid',
+            side_effect=self._instance_get_by_uuid)).mock
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    @staticmethod
+    def _instance_get_by_uuid(uuid):
+        if uuid == 'unknown':
+            return None
+        instance = mock.Mock()
+        instance.id = uuid
+        return instance
+
+    def _discovered(self):
+        return sorted(i.id for i in self.mgr.discover_local_instances())
+
+    def test_only_new_instances_are_fetched(self):
+        self.assertEqual(self._discovered(), ['a', 'b'])
+        self.local.append(virt_inspector.Instance(name='instance-3',
+                                                  UUID='c'))
+        self.assertEqual(self._discovered(), ['a', 'b', 'c'])
+        self.assertEqual([c[0][0] for c in self.nova.call_args_list],
+                         ['a', 'b', 'c'])
+
+    def test_refresh(self):
+        self._discovered()
+        timeutils.advance_time_seconds(3601)
+        self._discovered()
+        self.assertEqual(self.nova.call_count, 4)
+
+    def test_gone_instances_are_forgotten(self):
+        self._discovered()
+        self.local.pop()
+        self.assertEqual(self._discovered(), ['a'])
+        self.assertEqual(list(self.mgr._instances), ['a'])
+
+    def test_unknown_domain(self):
+        self.local.append(virt_inspector.Instance(name='foreign',
+                                                  UUID='unknown'))
+        self.assertEqual(self._discovered(), ['a', 'b'])
+        self.assertEqual(self._discovered(), ['a', 'b'])
+        self.assertEqual(self.nova.call_count, 3)
+
+    def test_nova_error_keeps_known_details(self):
+        self._discovered()
+        timeutils.advance_time_seconds(3601)
+        self.nova.side_effect = Exception('boom')
+        self.local.append(virt_inspector.Instance(name='instance-3',
+                                                  UUID='c'))
+        self.assertEqual(self._discovered(), ['a', 'b'])
+
+    def test_poll_and_publish_uses_local_discovery(self):
+        self.useFixture(config.Config()).conf.set_override(
+            'instance_discovery_method', 'local')
+        polling_task = manager.PollingTask(self.mgr)
+        with mock.patch.object(nova_client.Client,
+                               'instance_get_all_by_host') as by_host:
+            with mock.patch.object(polling_task,
+                                   'poll_and_publish_instances') as poll:
+                polling_task.poll_and_publish()
+        self.assertFalse(by_host.called)
+        self.assertEqual(sorted(i.id for i in poll.call_args[0][0]),
+                         ['a', 'b'])
+
+    def test_unknown_discovery_method(self):
+        self.useFixture(config.Config()).conf.set_override(
+            'instance_discovery_method', 'nowhere')
+        with mock.patch.object(manager.LOG, 'error') as error:
+            polling_task = manager.PollingTask(self.mgr)
+        self.assertTrue(error.called)
+        self.assertEqual(polling_task.discovery_method, 'nova')
+        with mock.patch.object(nova_client.Client,
+                               'instance_get_all_by_host',
+                               return_value=[]) as by_host:
+            with mock.patch.object(polling_task,
+                                   'poll_and_publish_instances'):
+                polling_task.poll_and_publish()
+        self.assertTrue(by_host.called)
@@ -21,12 +21,15 @@
 
 import contextlib
 
+from eventlet import tpool
 import fixtures
 import mock
 
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.compute.virt.libvirt import inspector as libvirt_inspector
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
 
 
 class TestLibvirtInspection(test.BaseTestCase):
@@ -221,6 +224,151 @@ class TestLibvirtInspection(test.BaseTestCase):
                 self.assertEqual(info0.write_bytes, 4L)
 
 
+class TestLibvirtInspectionCache(test.BaseTestCase):
+
+    dom_xml = """
+         <domain type='kvm'>
+             <devices>
+                 <disk type='file' device='disk'>
+                     <target dev='vda' bus='virtio'/>
+                 </disk>
+                 <interface type='bridge'>
+                     <mac address='fa:16:3e:71:ec:6d'/>
+                     <target dev='vnet0'/>
+                 </interface>
+             </devices>
+         </domain>
+    """
+
+    def setUp(self):
+        super(TestLibvirtInspectionCache, self).setUp()
+        self.inspector = libvirt_inspector.LibvirtInspector()
+        self.inspector.connection = mock.Mock()
+        self.domain = self._domain(1)
+        self.inspector.connection.lookupByName.return_value = self.domain
+        self.inspector.connection.lookupByUUIDString.return_value = (
+            self.domain)
+
+    def _domain(self, domain_id):
+        # Like a real handle, the ID of a mocked domain is fixed
+        domain = mock.Mock()
+        domain.ID.return_value = domain_id
+        domain.UUIDString.return_value = 'uuid'
+        domain.XMLDesc.return_value = self.dom_xml
+        domain.blockStats.return_value = (1L, 2L, 3L, 4L, -1)
+        return domain
+
+    def _inspect_disks(self):
+        return [disk.device for disk, stats in
+                self.inspector.inspect_disks('instance-00000001')]
+
+    def test_devices_are_cached(self):
+        self.assertEqual(self._inspect_disks(), ['vda'])
+        self.assertEqual(self._inspect_disks(), ['vda'])
+        self.assertEqual(self.inspector.connection.lookupByName.call_count, 1)
+        self.inspector.connection.lookupByUUIDString.assert_called_once_with(
+            'uuid')
+        self.assertEqual(self.domain.XMLDesc.call_count, 1)
+
+    def test_devices_parsed_again_after_restart(self):
+        self._inspect_disks()
+        restarted = self._domain(2)
+        self.inspector.connection.lookupByUUIDString.return_value = restarted
+        self._inspect_disks()
+        self.assertEqual(self.domain.XMLDesc.call_count, 1)
+        self.assertEqual(restarted.XMLDesc.call_count, 1)
+
+    def test_devices_cache_expiry(self):
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override()
+        self._inspect_disks()
+        timeutils.advance_time_seconds(301)
+        self._inspect_disks()
+        self.assertEqual(self.domain.XMLDesc.call_count, 2)
+
+    def test_gone_domain(self):
+        class FakeLibvirtError(Exception):
+            def get_error_code(self):
+                return 42
+
+        self._inspect_disks()
+        connection = self.inspector.connection
+        connection.lookupByUUIDString.side_effect = FakeLibvirtError()
+        connection.lookupByName.side_effect = FakeLibvirtError()
+        with mock.patch.object(libvirt_inspector, 'libvirt',
+                               libvirtError=FakeLibvirtError):
+            self.assertRaises(virt_inspector.InstanceNotFoundException,
+                              self.inspector.inspect_cpus,
+                              'instance-00000001')
+            # a new domain of the same name is found by name
+            connection.lookupByName.side_effect = None
+            connection.lookupByName.return_value = self._domain(3)
+            connection.lookupByName.return_value.info.return_value = (
+                0L, 0L, 0L, 2L, 999999L)
+            cpu_info = self.inspector.inspect_cpus('instance-00000001')
+        self.assertEqual(cpu_info.number, 2L)
+        self.assertEqual(connection.lookupByUUIDString.call_count, 1)
+
+    def test_inspect_all(self):
+        self.domain.name.return_value = 'instance-00000001'
+        self.inspector.connection.getAllDomainStats.return_value = [
+            (self.domain, {'cpu.time': 999999L, 'vcpu.current': 2,
+                           'net.count': 1, 'net.0.name': 'vnet0',
+                           'net.0.rx.bytes': 1L, 'net.0.rx.pkts': 2L,
+                           'net.0.tx.bytes': 3L, 'net.0.tx.pkts': 4L,
+                           'block.count': 1, 'block.0.name': 'vda',
+                           'block.0.rd.reqs': 1L, 'block.0.rd.bytes': 2L,
+                           'block.0.wr.reqs': 3L, 'block.0.wr.bytes': 4L}),
+        ]
+        with mock.patch.object(libvirt_inspector, 'libvirt'):
+            all_stats = self.inspector.inspect_all()
+        stats = all_stats['instance-00000001']
+        self.assertEqual(stats.cpu, virt_inspector.CPUStats(number=2,
+                                                            time=999999L))
+        vnic, vnic_stats = stats.vnics[0]
+        self.assertEqual(vnic.mac, 'fa:16:3e:71:ec:6d')
+        self.assertEqual(vnic_stats.rx_packets, 2L)
+        self.assertEqual(vnic_stats.tx_bytes, 3L)
+        disk, disk_stats = stats.disks[0]
+        self.assertEqual(disk.device, 'vda')
+        self.assertEqual(disk_stats.read_bytes, 2L)
+        self.assertEqual(disk_stats.write_requests, 3L)
+        self.assertEqual(disk_stats.errors, -1)
+        self.assertFalse(self.inspector.connection.lookupByName.called)
+
+    def test_inspect_all_not_available(self):
+        del self.inspector.connection.getAllDomainStats
+        self.assertRaises(NotImplementedError, self.inspector.inspect_all)
+
+
+class TestLibvirtConnection(test.BaseTestCase):
+
+    def setUp(self):
+        super(TestLibvirtConnection, self).setUp()
+        self.CONF = self.useFixture(config.Config()).conf
+        self.inspector = libvirt_inspector.LibvirtInspector()
+        self.libvirt = mock.Mock(virConnect=mock.Mock,
+                                 virDomain=mock.Mock)
+        self.useFixture(fixtures.MonkeyPatch(
+            'ceilometer.compute.virt.libvirt.inspector.libvirt',
+            self.libvirt))
+
+    def test_serial_polling_uses_connection(self):
+        connection = self.inspector._get_connection()
+        self.assertIs(connection, self.libvirt.openReadOnly.return_value)
+
+    def test_concurrent_polling_uses_native_threads(self):
+        self.CONF.set_override('instance_polling_concurrency', 2)
+        connection = self.inspector._get_connection()
+        self.assertIsInstance(connection, tpool.Proxy)
+        self.libvirt.openReadOnly.return_value.numOfDomains.return_value = 0
+        self.assertEqual(list(self.inspector.inspect_instances()), [])
+
+    def test_polling_timeout_uses_native_threads(self):
+        self.CONF.set_override('instance_polling_timeout', 10)
+        self.assertIsInstance(self.inspector._get_connection(), tpool.Proxy)
+
+
 class TestLibvirtInspectionWithError(test.BaseTestCase):
 
     def setUp(self):
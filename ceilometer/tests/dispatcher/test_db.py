@@ -44,10 +44,10 @@ class TestDispatcherDB(test.BaseTestCase):
         )
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(msg)
+        record_batch.assert_called_once_with([msg])
 
     def test_invalid_message(self):
         msg = {'counter_name': 'test',
@@ -60,7 +60,7 @@ class TestDispatcherDB(test.BaseTestCase):
 
             called = False
 
-            def record_metering_data(self, data):
+            def record_metering_data_batch(self, samples):
                 self.called = True
 
         self.dispatcher.storage_conn = ErrorConnection()
@@ -70,6 +70,61 @@ class TestDispatcherDB(test.BaseTestCase):
         assert not self.dispatcher.storage_conn.called, \
             'Should not have called the storage connection'
 
+    def test_batch_skips_invalid_messages(self):
+        msgs = []
+        for i in range(3):
+            msg = {'counter_name': 'test',
+                   'resource_id': '%s-%d' % (self.id(), i),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = utils.compute_signature(
+                msg,
+                self.CONF.publisher.metering_secret,
+            )
+            msgs.append(msg)
+        msgs[1]['message_signature'] = 'invalid-signature'
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data(msgs)
+
+        record_batch.assert_called_once_with([msgs[0], msgs[2]])
+
+    def test_failed_batch_recorded_one_by_one(self):
+        msgs = [{'counter_name': 'test',
+                 'resource_id': 'resource-%d' % i,
+                 'counter_volume': i,
+                 } for i in range(3)]
+
+        def record_metering_data(msg):
+            if msg['resource_id'] == 'resource-1':
+                raise Exception('Boom')
+            recorded.append(msg)
+
+        recorded = []
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch',
+                               side_effect=Exception('Boom')):
+            with mock.patch.object(self.dispatcher.storage_conn,
+                                   'record_metering_data',
+                                   side_effect=record_metering_data):
+                self.dispatcher.record_metering_data(msgs, verified=True)
+
+        self.assertEqual([msgs[0], msgs[2]], recorded)
+
+    def test_verified_batch(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               'message_signature': 'not-checked',
+               }
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data([msg], verified=True)
+
+        record_batch.assert_called_once_with([msg])
+
     def test_timestamp_conversion(self):
         msg = {'counter_name': 'test',
                'resource_id': self.id(),
@@ -85,10 +140,10 @@ class TestDispatcherDB(test.BaseTestCase):
         expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
 
     def test_timestamp_tzinfo_conversion(self):
         msg = {'counter_name': 'test',
@@ -106,7 +161,7 @@ class TestDispatcherDB(test.BaseTestCase):
                                                   31, 50, 262000)
 
         with mock.patch.object(self.dispatcher.storage_conn,
-                               'record_metering_data') as record_metering_data:
+                               'record_metering_data_batch') as record_batch:
             self.dispatcher.record_metering_data(msg)
 
-        record_metering_data.assert_called_once_with(expected)
+        record_batch.assert_called_once_with([expected])
@@ -289,6 +289,37 @@ class TestTraitDefinition(ConverterBase):
         t = tdef.to_trait(self.n1)
         self.assertIs(None, t)
 
+    def test_to_trait_compiled_fields(self):
+        cfg = dict(type='text',
+                   fields=["payload[image_meta].'thing'",
+                           'payload.host'],
+                   plugin=dict(name='test'))
+        tdef = converter.TraitDefinition('test_trait', cfg,
+                                         self.fake_plugin_mgr)
+        with mock.patch.object(tdef.fields, 'find',
+                               side_effect=AssertionError):
+            tdef.to_trait(self.n1)
+        self.test_plugin.trait_value.assert_called_once_with([
+            ('payload.image_meta.thing', 'whatzit'),
+            ('payload.host', 'host-1-2-3')])
+
+    def test_to_trait_jsonpath_fields(self):
+        cfg = dict(type='text', fields='payload.image_meta.*',
+                   plugin=dict(name='test'))
+        tdef = converter.TraitDefinition('test_trait', cfg,
+                                         self.fake_plugin_mgr)
+        tdef.to_trait(self.n1)
+        self.assertEqual(
+            sorted(self.test_plugin.trait_value.call_args[0][0]),
+            [('payload.image_meta.disk_gb', '20'),
+             ('payload.image_meta.thing', 'whatzit')])
+
+    def test_to_trait_not_a_dict(self):
+        cfg = dict(type='text', fields='payload.host.name')
+        tdef = converter.TraitDefinition('test_trait', cfg,
+                                         self.fake_plugin_mgr)
+        self.assertIsNone(tdef.to_trait(self.n1))
+
     def test_missing_fields_config(self):
         self.assertRaises(converter.EventDefinitionException,
                           converter.TraitDefinition,
@@ -677,6 +708,20 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event(self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_converter_definition_memoized(self):
+        c = converter.NotificationEventsConverter(
+            self.valid_event_def1,
+            self.fake_plugin_mgr,
+            add_catchall=False)
+        c.to_event(self.test_notification1)
+        c.to_event(self.test_notification2)
+        for d in c.definitions:
+            d.match_type = mock.Mock(side_effect=AssertionError)
+        e = c.to_event(self.test_notification1)
+        self.assertIsValidEvent(e, self.test_notification1)
+        e = c.to_event(self.test_notification2)
+        self.assertIsNotValidEvent(e, self.test_notification2)
+
     def test_converter_empty_cfg_with_catchall(self):
         c = converter.NotificationEventsConverter(
             [],
@@ -28,6 +28,7 @@ from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import network_utils
 from ceilometer.openstack.common import test
 from ceilometer.publisher import rpc
+from ceilometer.publisher import utils
 from ceilometer import sample
 
 
@@ -157,6 +158,25 @@ class TestPublish(test.BaseTestCase):
         self.assertIn(
             self.CONF.publisher_rpc.metering_topic + '.' + 'test3', topics)
 
+    def test_published_with_batch_signature(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://?per_meter_topic=1&sign_batch=1'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertEqual(len(self.published), 4)
+        for topic, rpc_call in self.published:
+            self.assertTrue(utils.verify_batch_signature(
+                rpc_call['args']['data'],
+                rpc_call['args']['signature'],
+                self.CONF.publisher.metering_secret))
+
+    def test_published_without_batch_signature(self):
+        publisher = rpc.RPCPublisher(
+            network_utils.urlsplit('rpc://'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+        self.assertNotIn('signature', self.published[0][1]['args'])
+
     def test_published_concurrency(self):
         """This test the concurrent access to the local queue
         of the rpc publisher
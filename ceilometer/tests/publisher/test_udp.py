@@ -143,6 +143,62 @@ class TestUDPPublisher(test.BaseTestCase):
                                  "not-so-secret")
                               for d in self.test_data]))
 
+    def _published_messages(self):
+        messages = []
+        for data, dest in self.data_sent:
+            payload = msgpack.loads(data)
+            if isinstance(payload, list):
+                messages.extend(payload)
+            else:
+                messages.append(payload)
+        return messages
+
+    def test_published_packed(self):
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(
+                network_utils.urlsplit(
+                    'udp://somehost?packed=1&datagram_size=65000'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        self.assertEqual(len(self.data_sent), 1)
+        self.assertEqual(sorted(self._published_messages()),
+                         sorted(
+                             [utils.meter_message_from_counter(
+                                 d,
+                                 "not-so-secret")
+                              for d in self.test_data]))
+
+    def test_published_packed_datagram_size(self):
+        size = max(len(msgpack.dumps(utils.meter_message_from_counter(
+            d, "not-so-secret"))) for d in self.test_data)
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(network_utils.urlsplit(
+                'udp://somehost?packed=1&datagram_size=%d' % (size * 2 + 5)))
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        self.assertEqual(len(self.data_sent), 3)
+        for data, dest in self.data_sent:
+            self.assertTrue(len(data) <= size * 2 + 5)
+        self.assertEqual(len(self._published_messages()), 5)
+
+    def test_pack_messages_oversized(self):
+        messages = [{'name': 'x' * 100}, {'name': 'y'}]
+        payloads = udp.pack_messages(messages, 50)
+        self.assertEqual([msgpack.loads(p) for p in payloads],
+                         [messages[0], [messages[1]]])
+
+    def test_pack_messages_large_array(self):
+        messages = [{'n': i} for i in range(20)]
+        payloads = udp.pack_messages(messages, 1472)
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(msgpack.loads(payloads[0]), messages)
+
     @staticmethod
     def _raise_ioerror(*args):
         raise IOError
@@ -20,6 +20,7 @@
 """Tests for ceilometer/publisher/utils.py
 """
 
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import test
 from ceilometer.publisher import utils
@@ -101,3 +102,61 @@ class TestSignature(test.BaseTestCase):
             'not-so-secret')
         jsondata = jsonutils.loads(jsonutils.dumps(data))
         self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_compute_signature_v2(self):
+        data = {'a': 'A', 'b': {'c': [1, {'d': 'D', 'e': 'E'}]}}
+        sig1 = utils.compute_signature(data, 'not-so-secret', version=2)
+        self.assertTrue(sig1.startswith(utils.SIGNATURE_V2_PREFIX))
+        self.assertNotEqual(sig1, utils.compute_signature(data,
+                                                          'not-so-secret'))
+        data['message_signature'] = sig1
+        self.assertEqual(sig1, utils.compute_signature(data, 'not-so-secret',
+                                                       version=2))
+        data['b']['c'][1]['d'] = 'X'
+        self.assertNotEqual(sig1, utils.compute_signature(data,
+                                                          'not-so-secret',
+                                                          version=2))
+
+    def test_compute_signature_configured_version(self):
+        self.useFixture(config.Config()).conf.set_override(
+            'signature_version', 2, group='publisher')
+        data = {'a': 'A', 'b': 'B'}
+        self.assertEqual(utils.compute_signature(data, 'not-so-secret'),
+                         utils.compute_signature(data, 'not-so-secret',
+                                                 version=2))
+
+    def test_verify_signature_v2_nested_json(self):
+        data = {'a': 'A',
+                'b': u'\xe9',
+                'nested': {'a': 1.5,
+                           'c': ('c',),
+                           'd': [{'e': 'E', 'f': None}]
+                           },
+                }
+        data['message_signature'] = utils.compute_signature(
+            data,
+            'not-so-secret',
+            version=2)
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_signature(jsondata, 'not-so-secret'))
+        jsondata['nested']['a'] = 2
+        self.assertFalse(utils.verify_signature(jsondata, 'not-so-secret'))
+
+    def test_verify_batch_signature(self):
+        data = [{'a': 'A', 'message_signature': 'x'}, {'b': 'B'}]
+        sig = utils.compute_batch_signature(data, 'not-so-secret')
+        jsondata = jsonutils.loads(jsonutils.dumps(data))
+        self.assertTrue(utils.verify_batch_signature(jsondata, sig,
+                                                     'not-so-secret'))
+        jsondata[0]['message_signature'] = 'y'
+        self.assertFalse(utils.verify_batch_signature(jsondata, sig,
+                                                      'not-so-secret'))
+        self.assertFalse(utils.verify_batch_signature(data[:1], sig,
+                                                      'not-so-secret'))
+
+    def test_compute_signature_v2_dict_is_not_list(self):
+        sig1 = utils.compute_signature({'a': {'b': 'B'}}, 'not-so-secret',
+                                       version=2)
+        sig2 = utils.compute_signature({'a': [['b', 'B']]}, 'not-so-secret',
+                                       version=2)
+        self.assertNotEqual(sig1, sig2)
@@ -24,8 +24,13 @@
   running the tests. Make sure the Thrift server is running on that server.
 
 """
+import datetime
+
 from mock import patch
 
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import storage
 from ceilometer.storage import impl_hbase as hbase
 from ceilometer.tests import db as tests_db
 
@@ -56,3 +61,130 @@ class ConnectionTest(HBaseEngineTestBase):
                           side_effect=get_connection):
             conn = hbase.Connection(self.CONF)
         self.assertIsInstance(conn.conn, TestConn)
+
+
+class RecordMeteringDataTest(HBaseEngineTestBase):
+
+    def _make_sample(self, minute, metadata):
+        s = sample.Sample('instance', sample.TYPE_CUMULATIVE, 'instance', 1,
+                          'user-id', 'project-id', 'resource-id',
+                          timestamp=datetime.datetime(2013, 8, 1, 10, minute),
+                          resource_metadata=metadata,
+                          source='test')
+        return utils.meter_message_from_counter(s, 'not-so-secret')
+
+    def test_known_rows_are_not_read_again(self):
+        msgs = [self._make_sample(m, {'display_name': 'vm'})
+                for m in range(3)]
+        with patch.object(hbase.MTable, 'row',
+                          return_value={}) as row:
+            self.conn.record_metering_data_batch(msgs[:2])
+            self.conn.record_metering_data(msgs[2])
+        # one read for the user and one for the project, then none
+        self.assertEqual(row.call_count, 2)
+        self.assertEqual(len(list(self.conn.get_samples(
+            storage.SampleFilter(meter='instance')))), 3)
+
+    def test_failed_send_is_not_remembered(self):
+        msg = self._make_sample(0, {'display_name': 'vm'})
+        with patch.object(hbase.MBatch, 'send',
+                          side_effect=Exception('boom')):
+            self.assertRaises(Exception,
+                              self.conn.record_metering_data, msg)
+        self.assertEqual(len(self.conn._known_sources), 0)
+        self.conn.record_metering_data(msg)
+        self.assertEqual(list(self.conn.get_users()), ['user-id'])
+        self.assertEqual(list(self.conn.get_projects()), ['project-id'])
+        self.assertEqual([r.resource_id for r in self.conn.get_resources()],
+                         ['resource-id'])
+
+    def test_resource_written_after_concurrent_change(self):
+        self.conn.record_metering_data(
+            self._make_sample(0, {'display_name': 'vm'}))
+        # another collector process records newer metadata
+        other = hbase.Connection(self.CONF)
+        other.record_metering_data(
+            self._make_sample(1, {'display_name': 'renamed'}))
+        self.conn.record_metering_data(
+            self._make_sample(2, {'display_name': 'vm'}))
+        resource = list(self.conn.get_resources())[0]
+        self.assertEqual(resource.metadata, {'display_name': 'vm'})
+
+    def test_resource_metadata_change_is_written(self):
+        self.conn.record_metering_data(
+            self._make_sample(0, {'display_name': 'vm'}))
+        self.conn.record_metering_data(
+            self._make_sample(1, {'display_name': 'renamed'}))
+        resource = list(self.conn.get_resources())[0]
+        self.assertEqual(resource.metadata, {'display_name': 'renamed'})
+
+
+class MTableTest(HBaseEngineTestBase):
+
+    def test_scan_columns(self):
+        table = hbase.MTable('test', {'f': {}})
+        table.put('row1', {'f:a': '1', 'f:b': '2'})
+        table.put('row2', {'f:b': '3'})
+        table.put('row3', {'f:a': '4', 'f:b': '5'})
+        rows = list(table.scan(
+            filter="SingleColumnValueFilter ('f', 'b', >=, 'binary:3')",
+            columns=['f:a']))
+        self.assertEqual(rows, [('row3', {'f:a': '4'})])
+
+
+class StatisticsTest(HBaseEngineTestBase):
+
+    def _make_sample(self, hour, minute, volume, project_id):
+        s = sample.Sample('instance', sample.TYPE_GAUGE, 'instance', volume,
+                          'user-id', project_id, 'resource-id',
+                          timestamp=datetime.datetime(2013, 8, 1, hour,
+                                                      minute),
+                          resource_metadata={},
+                          source='test')
+        return utils.meter_message_from_counter(s, 'not-so-secret')
+
+    def test_groupby_with_period_streams_rows(self):
+        for hour, minute, volume, project_id in [(10, 11, 1, 'project-1'),
+                                                 (10, 40, 3, 'project-1'),
+                                                 (11, 30, 2, 'project-2'),
+                                                 (12, 20, 4, 'project-1')]:
+            self.conn.record_metering_data(
+                self._make_sample(hour, minute, volume, project_id))
+        scanned = []
+        real_scan = hbase.MTable.scan
+
+        def scan(table, *args, **kwargs):
+            rows = list(real_scan(table, *args, **kwargs))
+            if kwargs.get('limit') != 1:
+                scanned.append(len(rows))
+            return iter(rows)
+
+        with patch.object(hbase.MTable, 'scan', side_effect=scan,
+                          autospec=True):
+            results = self.conn.get_meter_statistics(
+                storage.SampleFilter(meter='instance'), period=3600,
+                groupby=['project_id'])
+        # the main scan and the read of the oldest second, all the others
+        # return a single row
+        self.assertEqual(scanned, [1, 4])
+        self.assertEqual(
+            [(r.period_start, r.groupby['project_id'], r.count, r.sum)
+             for r in results],
+            [(datetime.datetime(2013, 8, 1, 10, 11), 'project-1', 2, 4),
+             (datetime.datetime(2013, 8, 1, 11, 11), 'project-2', 1, 2),
+             (datetime.datetime(2013, 8, 1, 12, 11), 'project-1', 1, 4)])
+
+    def test_oldest_timestamp_with_filter(self):
+        for hour, minute, volume, project_id in [(10, 11, 1, 'project-1'),
+                                                 (10, 40, 3, 'project-2'),
+                                                 (12, 20, 4, 'project-2'),
+                                                 (13, 20, 4, 'project-1')]:
+            self.conn.record_metering_data(
+                self._make_sample(hour, minute, volume, project_id))
+        results = self.conn.get_meter_statistics(
+            storage.SampleFilter(meter='instance', project='project-2'),
+            period=3600)
+        self.assertEqual(
+            [(r.period_start, r.count) for r in results],
+            [(datetime.datetime(2013, 8, 1, 10, 40), 1),
+             (datetime.datetime(2013, 8, 1, 11, 40), 1)])
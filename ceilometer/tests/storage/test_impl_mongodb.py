@@ -27,6 +27,7 @@
 import copy
 import datetime
 from mock import patch
+import pymongo
 
 from ceilometer.publisher import utils
 from ceilometer import sample
@@ -64,6 +65,41 @@ class MongoDBConnection(MongoDBEngineTestBase):
         self.assertEqual(ret, expect)
 
 
+class RecordBatchTest(MongoDBEngineTestBase):
+
+    @staticmethod
+    def _messages(count):
+        return [utils.meter_message_from_counter(
+            sample.Sample('instance', 'gauge', 'instance', 1, 'user-id',
+                          'project-id', 'resource-%d' % i,
+                          timestamp=datetime.datetime(2012, 9, 25, 12),
+                          resource_metadata={}, source='test'),
+            'not-so-secret') for i in range(count)]
+
+    def test_failed_insert_removes_meters(self):
+        real_insert = pymongo.collection.Collection.insert
+
+        def insert(collection, meters):
+            # store the first meter before failing
+            real_insert(collection, meters[:1])
+            raise ValueError('insert failed')
+
+        with patch('pymongo.collection.Collection.insert', insert):
+            self.assertRaises(ValueError,
+                              self.conn.record_metering_data_batch,
+                              self._messages(3))
+        self.assertEqual(0, self.conn.db.meter.count())
+
+    def test_failed_cleanup_raises_insert_error(self):
+        with patch('pymongo.collection.Collection.insert',
+                   side_effect=ValueError('insert failed')):
+            with patch('pymongo.collection.Collection.remove',
+                       side_effect=KeyError('remove failed')):
+                self.assertRaises(ValueError,
+                                  self.conn.record_metering_data_batch,
+                                  self._messages(3))
+
+
 class MongoDBTestMarkerBase(test_storage_scenarios.DBTestBase,
                             MongoDBEngineTestBase):
     #NOTE(Fengqian): All these three test case are the same for resource
@@ -291,3 +327,13 @@ class AlarmTestPagination(test_storage_scenarios.AlarmTestBase,
                              'counter-name-foo')
         except base.MultipleResultsFound:
             self.assertTrue(True)
+
+
+class StatisticsMapReduceTest(test_storage_scenarios.StatisticsGroupByTest):
+    # Run the statistics tests through the map_reduce code path used for
+    # the servers whose aggregation framework is too old.
+    database_connection = tests_db.MongoDBFakeConnectionUrl()
+
+    def setUp(self):
+        super(StatisticsMapReduceTest, self).setUp()
+        self.conn._aggregate_statistics = False
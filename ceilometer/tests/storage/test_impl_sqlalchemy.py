@@ -30,6 +30,10 @@ from mock import patch
 
 import ceilometer.openstack.common.db.sqlalchemy.session as sqlalchemy_session
 from ceilometer.openstack.common import timeutils
+from ceilometer.publisher import utils as publisher_utils
+from ceilometer import sample
+from ceilometer import storage
+from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage import models
 from ceilometer.storage.sqlalchemy import models as sql_models
 from ceilometer.tests import db as tests_db
@@ -154,13 +158,56 @@ class EventTest(EventTestBase):
         m = [models.Event("1", "Foo", now, []),
              models.Event("2", "Zoo", now, [])]
 
-        with patch.object(self.conn, "_record_event") as mock_save:
-            mock_save.side_effect = MyException("Boom")
-            problem_events = self.conn.record_events(m)
+        with patch.object(self.conn, "_record_events_batch") as mock_batch:
+            mock_batch.side_effect = MyException("Boom")
+            with patch.object(self.conn, "_record_event") as mock_save:
+                mock_save.side_effect = MyException("Boom")
+                problem_events = self.conn.record_events(m)
         self.assertEqual(2, len(problem_events))
         for bad, event in problem_events:
             self.assertEqual(models.Event.UNKNOWN_PROBLEM, bad)
 
+    def _events(self, *message_ids):
+        now = datetime.datetime.utcnow()
+        return [models.Event(message_id, "Foo", now,
+                             [models.Trait("Bar", models.Trait.INT_TYPE, 1),
+                              models.Trait("Baz", models.Trait.TEXT_TYPE,
+                                           message_id)])
+                for message_id in message_ids]
+
+    def test_record_events_batch_caches_types(self):
+        self.assertEqual([], self.conn.record_events(self._events("1", "2")))
+        with patch.object(self.conn, "_get_or_create_event_type",
+                          side_effect=AssertionError):
+            with patch.object(self.conn, "_get_or_create_trait_type",
+                              side_effect=AssertionError):
+                self.assertEqual([],
+                                 self.conn.record_events(self._events("3")))
+        events = self.conn.get_events(storage.EventFilter(event_type="Foo"))
+        self.assertEqual(["1", "2", "3"],
+                         sorted(e.message_id for e in events))
+        for event in events:
+            self.assertEqual(["Bar", "Baz"],
+                             sorted(t.name for t in event.traits))
+            self.assertIn(event.message_id, [t.value for t in event.traits])
+
+    def test_record_events_batch_duplicate(self):
+        self.conn.record_events(self._events("1"))
+        problem_events = self.conn.record_events(self._events("1", "2", "2"))
+        self.assertEqual([(models.Event.DUPLICATE, "1"),
+                          (models.Event.DUPLICATE, "2")],
+                         [(bad, event.message_id)
+                          for bad, event in problem_events])
+        events = self.conn.get_events(storage.EventFilter(event_type="Foo"))
+        self.assertEqual(2, len(events))
+
+    def test_record_events_batch_failure_falls_back(self):
+        with patch.object(self.conn, "_record_events_batch",
+                          side_effect=MyException("Boom")):
+            self.assertEqual([], self.conn.record_events(self._events("1")))
+        events = self.conn.get_events(storage.EventFilter(event_type="Foo"))
+        self.assertEqual(1, len(events))
+
     def test_get_none_value_traits(self):
         model = sql_models.Trait(None, None, 5)
         self.assertIsNone(model.get_value())
@@ -172,6 +219,33 @@ class EventTest(EventTestBase):
         self.assertTrue(repr.repr(ev))
 
 
+class EventPagingTest(scenarios.GetEventTest):
+    database_connection = 'sqlite://'
+
+    def test_get_events_by_pages(self):
+        event_filter = storage.EventFilter(self.start, self.end)
+        expected = [e.message_id for e in self.conn.get_events(event_filter)]
+        pages = []
+        marker = None
+        while True:
+            page = self.conn.get_events(event_filter, limit=4, marker=marker)
+            if not page:
+                break
+            self.assertEqual(4, len(page[0].traits))
+            pages.append([e.message_id for e in page])
+            marker = (page[-1].generated, page[-1].message_id)
+        self.assertEqual([expected[:4], expected[4:]], pages)
+
+    def test_get_events_limit_with_trait_filter(self):
+        trait_filters = [{'key': 'trait_A', 'string': 'my_Foo_text'}]
+        event_filter = storage.EventFilter(self.start, self.end,
+                                           traits_filter=trait_filters)
+        events = self.conn.get_events(event_filter, limit=1)
+        self.assertEqual(['id_Foo_0'], [e.message_id for e in events])
+        # The filters given by the caller are left untouched
+        self.assertEqual('trait_A', trait_filters[0]['key'])
+
+
 class ModelTest(tests_db.TestBase):
     database_connection = 'mysql://localhost'
 
@@ -216,3 +290,183 @@ class RelationshipTest(scenarios.DBTestBase):
                 session.query(sql_models.User.id)
                     .group_by(sql_models.User.id)
                     )).count(), 0)
+
+
+class SamplePagingTest(scenarios.DBTestBase):
+    database_connection = 'sqlite://'
+
+    def test_get_samples_streamed(self):
+        f = storage.SampleFilter()
+        expected = [s.message_id for s in self.conn.get_samples(f)]
+        with patch.object(impl_sqlalchemy.Connection, 'SAMPLE_PAGE_SIZE', 3):
+            self.assertEqual(expected, [s.message_id for s in
+                                        self.conn.get_samples(f)])
+            self.assertEqual(expected[:7], [s.message_id for s in
+                                            self.conn.get_samples(f,
+                                                                  limit=7)])
+
+
+class SampleBatchTest(tests_db.TestBase):
+    database_connection = 'sqlite://'
+
+    @staticmethod
+    def _messages(count, **metadata):
+        msgs = []
+        for i in range(count):
+            c = sample.Sample('instance', 'gauge', 'instance', 1,
+                              'user-id', 'project1', 'resource-%d' % i,
+                              timestamp=datetime.datetime(2012, 9, 25, 12),
+                              resource_metadata=dict(
+                                  (k, '%s-%d' % (v, i))
+                                  for k, v in metadata.iteritems()),
+                              source='test')
+            msgs.append(publisher_utils.meter_message_from_counter(
+                c, 'not-so-secret'))
+        return msgs
+
+    def test_batch_duplicate_message_ids(self):
+        msgs = self._messages(3, display_name='vm')
+        for msg in msgs:
+            msg['message_id'] = 'same-message-id'
+        self.conn.record_metering_data(msgs[0])
+        self.conn.record_metering_data_batch(msgs[1:])
+        for i in range(3):
+            f = storage.SampleFilter(
+                metaquery={'metadata.display_name': 'vm-%d' % i})
+            self.assertEqual(['resource-%d' % i],
+                             [s.resource_id
+                              for s in self.conn.get_samples(f)])
+
+    def test_failed_batch_recorded_one_by_one(self):
+        msgs = self._messages(3)
+        real_record = impl_sqlalchemy.Connection._real_record_metering_data
+
+        def record_metering_data(data):
+            if data['resource_id'] == 'resource-1':
+                raise MyException("Boom")
+            real_record(data)
+
+        with patch.object(impl_sqlalchemy.Connection,
+                          '_real_record_metering_data_batch',
+                          side_effect=MyException("Boom")):
+            with patch.object(impl_sqlalchemy.Connection,
+                              '_real_record_metering_data',
+                              side_effect=record_metering_data):
+                self.conn._record_metering_data_batch_or_each(msgs)
+        samples = self.conn.get_samples(storage.SampleFilter())
+        self.assertEqual(['resource-0', 'resource-2'],
+                         sorted(s.resource_id for s in samples))
+
+
+class StatisticsPeriodFallbackTest(scenarios.StatisticsGroupByTest):
+    # Run the statistics tests through the one query per period code path
+    # used for the engines that can't compute the period in SQL.
+    database_connection = 'sqlite://'
+
+    def setUp(self):
+        super(StatisticsPeriodFallbackTest, self).setUp()
+        bucket = patch.object(impl_sqlalchemy.Connection, '_period_bucket',
+                              return_value=None)
+        bucket.start()
+        self.addCleanup(bucket.stop)
+
+
+class RollupMixin(object):
+
+    def prepare_data(self):
+        self.CONF.set_override('rollup_statistics', True, group='database')
+        # Start the rollups coverage before the samples
+        timeutils.set_time_override(datetime.datetime(2012, 1, 1))
+        try:
+            super(RollupMixin, self).prepare_data()
+        finally:
+            timeutils.clear_time_override()
+
+
+class RollupStatisticsTest(RollupMixin, scenarios.StatisticsTest):
+    database_connection = 'sqlite://'
+
+    def test_aligned_query_uses_rollups(self):
+        f = storage.SampleFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 9, 25, 10, 0),
+            end=datetime.datetime(2012, 9, 25, 13, 0),
+        )
+        with patch.object(impl_sqlalchemy.Connection, '_make_stats_query',
+                          side_effect=AssertionError):
+            results = list(self.conn.get_meter_statistics(f, period=3600))
+        self.assertEqual([r.count for r in results], [2, 2, 2])
+        self.assertEqual([r.sum for r in results], [13, 15, 17])
+        self.assertEqual([r.min for r in results], [5, 6, 7])
+        self.assertEqual([r.max for r in results], [8, 9, 10])
+        self.assertEqual(results[0].period_start,
+                         datetime.datetime(2012, 9, 25, 10, 0))
+        self.assertEqual(results[0].duration_start,
+                         datetime.datetime(2012, 9, 25, 10, 30))
+
+    def test_unaligned_query_uses_samples(self):
+        f = storage.SampleFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 9, 25, 10, 31, 30),
+        )
+        with patch.object(impl_sqlalchemy.Connection, '_make_rollup_query',
+                          side_effect=AssertionError):
+            results = list(self.conn.get_meter_statistics(f))
+        self.assertEqual(results[0].count, 4)
+
+    def test_clear_expired_rollups(self):
+        timeutils.utcnow.override_time = datetime.datetime(2012, 9, 25, 12)
+        self.conn.clear_expired_metering_data(3600)
+        session = sqlalchemy_session.get_session()
+        rollups = session.query(sql_models.MeterRollup)
+        self.assertEqual(rollups.filter_by(granularity=3600).count(), 4)
+        self.assertEqual(rollups.filter_by(granularity=86400).count(), 2)
+
+
+class RollupStatisticsGroupByTest(RollupMixin,
+                                  scenarios.StatisticsGroupByTest):
+    database_connection = 'sqlite://'
+
+
+class RollupCoverageTest(scenarios.StatisticsTest):
+    # The samples are recorded before the rollups are enabled
+    database_connection = 'sqlite://'
+
+    def _record_sample(self):
+        # A new connection, as when the collector is restarted
+        conn = impl_sqlalchemy.Connection(self.CONF)
+        c = sample.Sample('instance', 'gauge', 'instance', 1,
+                          'user-id', 'project1', 'resource-id',
+                          timestamp=datetime.datetime(2012, 9, 25, 12),
+                          resource_metadata={}, source='test')
+        conn.record_metering_data(
+            publisher_utils.meter_message_from_counter(c, 'not-so-secret'))
+
+    def prepare_data(self):
+        super(RollupCoverageTest, self).prepare_data()
+        self.CONF.set_override('rollup_statistics', True, group='database')
+        self._record_sample()
+
+    def _coverage(self):
+        session = sqlalchemy_session.get_session()
+        return session.query(sql_models.MeterRollupCoverage.start).scalar()
+
+    def test_rollups_not_used_before_coverage(self):
+        self.assertIsNotNone(self._coverage())
+        f = storage.SampleFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 9, 25, 10, 0),
+            end=datetime.datetime(2012, 9, 25, 13, 0),
+        )
+        with patch.object(impl_sqlalchemy.Connection, '_make_rollup_query',
+                          side_effect=AssertionError):
+            results = list(self.conn.get_meter_statistics(f, period=3600))
+        self.assertEqual([r.count for r in results], [2, 2, 2])
+        self.assertEqual([r.sum for r in results], [13, 15, 17])
+        self.assertEqual([r.min for r in results], [5, 6, 7])
+        self.assertEqual([r.max for r in results], [8, 9, 10])
+
+    def test_disabling_removes_coverage(self):
+        self.CONF.set_override('rollup_statistics', False, group='database')
+        self._record_sample()
+        self.assertIsNone(self._coverage())
@@ -21,6 +21,7 @@
 
 import datetime
 
+import mock
 import testscenarios
 
 from ceilometer.openstack.common import timeutils
@@ -493,6 +494,22 @@ class RawSampleTest(DBTestBase,
                 self.assertTrue(prev_timestamp >= sample.timestamp)
             prev_timestamp = sample.timestamp
 
+    def test_get_samples_marker(self):
+        f = storage.SampleFilter()
+        expected = [s.message_id for s in self.conn.get_samples(f)]
+        results = []
+        marker = None
+        while True:
+            try:
+                page = list(self.conn.get_samples(f, limit=3, marker=marker))
+            except NotImplementedError:
+                self.skipTest('Sample markers not implemented')
+            results.extend(s.message_id for s in page)
+            if len(page) < 3:
+                break
+            marker = (page[-1].timestamp, page[-1].message_id)
+        self.assertEqual(expected, results)
+
     def test_get_samples_by_user(self):
         f = storage.SampleFilter(user='user-id')
         results = list(self.conn.get_samples(f))
@@ -709,6 +726,33 @@ class RawSampleTest(DBTestBase,
         self.assertEqual(len(results), 2)
 
 
+class BatchRecordMixin(object):
+    """Store the test data with a single record_metering_data_batch call."""
+
+    def prepare_data(self):
+        batch = []
+        with mock.patch.object(self.conn, 'record_metering_data',
+                               side_effect=batch.append):
+            super(BatchRecordMixin, self).prepare_data()
+        self.conn.record_metering_data_batch(batch)
+
+
+class UserBatchTest(BatchRecordMixin, UserTest):
+    pass
+
+
+class ProjectBatchTest(BatchRecordMixin, ProjectTest):
+    pass
+
+
+class ResourceBatchTest(BatchRecordMixin, ResourceTest):
+    pass
+
+
+class RawSampleBatchTest(BatchRecordMixin, RawSampleTest):
+    pass
+
+
 class StatisticsTest(DBTestBase,
                      tests_db.MixinTestsWithBackendScenarios):
 
@@ -15,6 +15,7 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import errno
 import socket
 
 import mock
@@ -25,6 +26,7 @@ from stevedore.tests import manager as test_manager
 
 from ceilometer import collector
 from ceilometer.openstack.common.fixture import config
+from ceilometer.publisher import utils as publisher_utils
 from ceilometer import sample
 from ceilometer.tests import base as tests_base
 
@@ -52,11 +54,16 @@ class TestCollector(tests_base.BaseTestCase):
             resource_metadata={},
         ).as_dict()
 
-    def _make_fake_socket(self):
+    def _make_fake_socket(self, count=1):
+        datagrams = [(msgpack.dumps(self.counter), ('127.0.0.1', 12345))
+                     for i in range(count)]
+
         def recvfrom(size):
+            if not datagrams:
+                raise socket.error(errno.EAGAIN, 'Resource unavailable')
             # Make the loop stop
             self.srv.stop()
-            return (msgpack.dumps(self.counter), ('127.0.0.1', 12345))
+            return datagrams.pop(0)
 
         sock = mock.Mock()
         sock.recvfrom = recvfrom
@@ -84,6 +91,50 @@ class TestCollector(tests_base.BaseTestCase):
         mock_dispatcher.record_metering_data.assert_called_once_with(
             data=self.counter)
 
+    def _signed_batch(self):
+        data = [self.counter]
+        return data, publisher_utils.compute_batch_signature(
+            data, self.CONF.publisher.metering_secret)
+
+    def test_record_metering_data_signed_batch(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test', None, None, mock_dispatcher)])
+        data, signature = self._signed_batch()
+
+        self.srv.record_metering_data(None, data, signature)
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            data=data, verified=True)
+
+    def test_record_metering_data_signed_batch_old_dispatcher(self):
+        class OldDispatcher(object):
+            def __init__(self):
+                self.recorded = []
+
+            def record_metering_data(self, data):
+                self.recorded.append(data)
+
+        dispatcher = OldDispatcher()
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test', None, None, dispatcher)])
+        data, signature = self._signed_batch()
+
+        self.srv.record_metering_data(None, data, signature)
+
+        self.assertEqual([data], dispatcher.recorded)
+
+    def test_record_metering_data_invalid_batch(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test', None, None, mock_dispatcher)])
+        data, signature = self._signed_batch()
+        data[0]['volume'] = 42
+
+        self.srv.record_metering_data(None, data, signature)
+
+        self.assertFalse(mock_dispatcher.record_metering_data.called)
+
     def test_udp_receive(self):
         mock_dispatcher = mock.MagicMock()
         self.srv.dispatcher_manager = test_manager.TestExtensionManager(
@@ -106,7 +157,7 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     def test_udp_receive_storage_error(self):
         mock_dispatcher = mock.MagicMock()
@@ -132,12 +183,120 @@ class TestCollector(tests_base.BaseTestCase):
         self._verify_udp_socket(udp_socket)
 
         mock_dispatcher.record_metering_data.assert_called_once_with(
-            self.counter)
+            [self.counter])
 
     @staticmethod
     def _raise_error():
         raise Exception
 
+    def test_udp_receive_batch(self):
+        self.CONF.set_override('udp_batch_size', 3, group='collector')
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test', None, None, mock_dispatcher)])
+        udp_socket = self._make_fake_socket(count=5)
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+        self.assertEqual(mock_dispatcher.record_metering_data.call_args_list,
+                         [mock.call([self.counter] * 3)])
+        udp_socket.setblocking.assert_called_with(True)
+
+    def test_udp_receive_packed(self):
+        mock_dispatcher = mock.MagicMock()
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test', None, None, mock_dispatcher)])
+        udp_socket = self._make_fake_socket(count=2)
+        with patch('socket.socket', return_value=udp_socket):
+            with patch('msgpack.loads',
+                       side_effect=[[self.counter, self.counter],
+                                    self.counter]):
+                self.srv.start_udp()
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            [self.counter] * 3)
+
+    def test_udp_socket_options(self):
+        self.CONF.set_override('udp_workers', 4, group='collector')
+        self.CONF.set_override('udp_receive_buffer', 8 * 1024 * 1024,
+                               group='collector')
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager([])
+        udp_socket = self._make_fake_socket()
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+        self.assertEqual(udp_socket.setsockopt.call_args_list, [
+            mock.call(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
+            mock.call(socket.SOL_SOCKET, collector.SO_REUSEPORT, 1),
+            mock.call(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024),
+        ])
+
+    def test_collector_workers_share_udp_port(self):
+        self.CONF.set_override('collector_workers', 4)
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager([])
+        udp_socket = self._make_fake_socket()
+        with patch('socket.socket', return_value=udp_socket):
+            self.srv.start_udp()
+        udp_socket.setsockopt.assert_any_call(socket.SOL_SOCKET,
+                                              collector.SO_REUSEPORT, 1)
+
+    @patch('ceilometer.service.prepare_service', mock.Mock())
+    @patch('ceilometer.openstack.common.service.ProcessLauncher')
+    def test_collector_workers(self, launcher):
+        self.CONF.set_override('collector_workers', 4)
+        collector.collector()
+        service, = launcher.return_value.launch_service.call_args_list
+        self.assertIsInstance(service[0][0], collector.CollectorService)
+        self.assertEqual(service[1], {'workers': 4})
+        launcher.return_value.wait.assert_called_once_with()
+
+    @patch('ceilometer.service.prepare_service', mock.Mock())
+    @patch('ceilometer.openstack.common.service.ProcessLauncher')
+    def test_collector_udp_workers(self, launcher):
+        self.CONF.set_override('collector_workers', 2)
+        self.CONF.set_override('udp_workers', 3, group='collector')
+        collector.collector()
+        udp, rpc = launcher.return_value.launch_service.call_args_list
+        self.assertIsInstance(udp[0][0], collector.UDPCollectorService)
+        self.assertNotIsInstance(udp[0][0], collector.CollectorService)
+        self.assertEqual(udp[1], {'workers': 3})
+        self.assertIsInstance(rpc[0][0], collector.CollectorService)
+        self.assertEqual(rpc[1], {'workers': 2})
+
+    @patch('ceilometer.service.prepare_service', mock.Mock())
+    @patch('ceilometer.openstack.common.service.ProcessLauncher')
+    @patch('stevedore.named.NamedExtensionManager')
+    def test_collector_workers_load_dispatchers_after_fork(self, dispatchers,
+                                                           launcher):
+        self.CONF.set_override('collector_workers', 4)
+        collector.collector()
+        self.assertFalse(dispatchers.called)
+        service, = launcher.return_value.launch_service.call_args_list
+        self.assertEqual(dispatchers.return_value,
+                         service[0][0].dispatcher_manager)
+        dispatchers.assert_called_once_with(
+            namespace=collector.CollectorService.DISPATCHER_NAMESPACE,
+            names=self.CONF.dispatcher, invoke_on_load=True,
+            invoke_args=[mock.ANY])
+
+    @patch('ceilometer.service.prepare_service', mock.Mock())
+    @patch('ceilometer.openstack.common.service.ProcessLauncher')
+    @patch('stevedore.named.NamedExtensionManager')
+    def test_udp_workers_load_dispatchers_after_fork(self, dispatchers,
+                                                     launcher):
+        self.CONF.set_override('rpc_backend', '')
+        self.CONF.set_override('udp_workers', 3, group='collector')
+        collector.collector()
+        self.assertFalse(dispatchers.called)
+        udp, = launcher.return_value.launch_service.call_args_list
+        self.assertEqual(dispatchers.return_value,
+                         udp[0][0].dispatcher_manager)
+        self.assertEqual(1, dispatchers.call_count)
+
+    def test_udp_workers_only_rpc(self):
+        self.CONF.set_override('udp_workers', 4, group='collector')
+        with patch('ceilometer.openstack.common.rpc.create_connection'):
+            with patch.object(self.srv, 'start_udp') as start_udp:
+                self.srv.start()
+        self.assertFalse(start_udp.called)
+
     def test_udp_receive_bad_decoding(self):
         udp_socket = self._make_fake_socket()
         with patch('socket.socket', return_value=udp_socket):
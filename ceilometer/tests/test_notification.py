@@ -107,6 +107,53 @@ class TestNotification(tests_base.BaseTestCase):
         self.assertTrue(
             self.srv.pipeline_manager.publisher.called)
 
+    def _handler(self, name, event_types, samples=None):
+        handler = mock.Mock(event_types=event_types)
+        handler.process_notification.return_value = samples or [name]
+        return extension.Extension(name, None, None, handler)
+
+    def test_process_notification_routing(self):
+        self.CONF.set_override("store_events", False, group="notification")
+        self.srv.pipeline_manager = mock.MagicMock()
+        handlers = [self._handler('exact', ['compute.instance.create.end']),
+                    self._handler('wildcard', ['compute.instance.*']),
+                    self._handler('other', ['image.*', 'volume.exists'])]
+        self.srv.notification_manager = test_manager.TestExtensionManager(
+            handlers)
+
+        self.srv.process_notification(TEST_NOTICE)
+
+        for ext in handlers[:2]:
+            ext.obj.process_notification.assert_called_once_with(TEST_NOTICE)
+        self.assertFalse(handlers[2].obj.process_notification.called)
+        self.assertEqual(self.srv.pipeline_manager.publisher.call_count, 1)
+        publish = self.srv.pipeline_manager.publisher.return_value.__enter__
+        publish.return_value.assert_called_once_with(['exact', 'wildcard'])
+
+    def test_process_notification_handlers_memoized(self):
+        self.CONF.set_override("store_events", False, group="notification")
+        self.srv.pipeline_manager = mock.MagicMock()
+        self.srv.notification_manager = test_manager.TestExtensionManager(
+            [self._handler('wildcard', ['compute.instance.*'])])
+        self.srv.process_notification(TEST_NOTICE)
+        with mock.patch.object(self.srv, '_event_type_matchers', []):
+            self.srv.process_notification(TEST_NOTICE)
+            self.srv.process_notification({'event_type': 'image.update'})
+        self.assertEqual(self.srv.pipeline_manager.publisher.call_count, 2)
+
+    def test_process_notification_handler_error(self):
+        self.CONF.set_override("store_events", False, group="notification")
+        self.srv.pipeline_manager = mock.MagicMock()
+        broken = self._handler('broken', ['compute.instance.*'])
+        broken.obj.process_notification.side_effect = Exception('boom')
+        self.srv.notification_manager = test_manager.TestExtensionManager(
+            [broken, self._handler('ok', ['compute.instance.*'])])
+
+        self.srv.process_notification(TEST_NOTICE)
+
+        publish = self.srv.pipeline_manager.publisher.return_value.__enter__
+        publish.return_value.assert_called_once_with(['ok'])
+
     def test_process_notification_no_events(self):
         self.CONF.set_override("store_events", False, group="notification")
         self.srv.notification_manager = mock.MagicMock()
@@ -159,3 +206,41 @@ class TestNotification(tests_base.BaseTestCase):
         message = {'event_type': "foo", 'message_id': "abc"}
         self.assertRaises(notification.UnableToSaveEventException,
                           self.srv._message_to_event, message)
+
+    def _buffering_service(self):
+        self.CONF.set_override("event_batch_size", 3, group="notification")
+        mock_dispatcher = mock.MagicMock()
+        mock_dispatcher.record_events.return_value = []
+        self.srv.event_converter = mock.MagicMock()
+        self.srv.event_converter.to_event.side_effect = (
+            lambda body: body['message_id'])
+        self.srv.dispatcher_manager = test_manager.TestExtensionManager(
+            [extension.Extension('test',
+                                 None,
+                                 None,
+                                 mock_dispatcher
+                                 ),
+             ])
+        return mock_dispatcher
+
+    def test_message_to_event_buffered(self):
+        mock_dispatcher = self._buffering_service()
+        for message_id in ['a', 'b']:
+            self.srv._message_to_event({'message_id': message_id})
+        self.assertFalse(mock_dispatcher.record_events.called)
+        self.srv._message_to_event({'message_id': 'c'})
+        mock_dispatcher.record_events.assert_called_once_with(['a', 'b', 'c'])
+        self.srv._message_to_event({'message_id': 'd'})
+        self.srv._flush_events()
+        mock_dispatcher.record_events.assert_called_with(['d'])
+        self.srv._flush_events()
+        self.assertEqual(2, mock_dispatcher.record_events.call_count)
+
+    def test_message_to_event_buffered_bad_event(self):
+        mock_dispatcher = self._buffering_service()
+        mock_dispatcher.record_events.return_value = [
+            (models.Event.UNKNOWN_PROBLEM, object())]
+        for message_id in ['a', 'b', 'c']:
+            # Should return silently, the events can't be requeued.
+            self.srv._message_to_event({'message_id': message_id})
+        self.assertEqual([], self.srv._events)
@@ -22,14 +22,17 @@ from mock import patch
 import novaclient
 
 from ceilometer import nova_client
+from ceilometer.openstack.common.fixture import config
 from ceilometer.openstack.common.fixture import mockpatch
 from ceilometer.openstack.common import test
+from ceilometer.openstack.common import timeutils
 
 
 class TestNovaClient(test.BaseTestCase):
 
     def setUp(self):
         super(TestNovaClient, self).setUp()
+        self.CONF = self.useFixture(config.Config()).conf
         self.nv = nova_client.Client()
         self.useFixture(mockpatch.PatchObject(
             self.nv.nova_client.flavors, 'get',
@@ -140,6 +143,19 @@ class TestNovaClient(test.BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(instances[0].image['name'], 'unknown-id-666')
 
+    def test_instance_get_by_uuid(self):
+        with patch.object(self.nv.nova_client.servers, 'get',
+                          side_effect=lambda uuid:
+                          self.fake_servers_list()[0]):
+            instance = self.nv.instance_get_by_uuid('uuid')
+        self.assertEqual(instance.flavor['name'], 'm1.tiny')
+        self.assertEqual(instance.image['name'], 'ubuntu-12.04-x86')
+
+    def test_instance_get_by_uuid_not_found(self):
+        with patch.object(self.nv.nova_client.servers, 'get',
+                          side_effect=novaclient.exceptions.NotFound('x')):
+            self.assertIsNone(self.nv.instance_get_by_uuid('uuid'))
+
     def test_with_flavor_and_image(self):
         results = self.nv._with_flavor_and_image(self.fake_servers_list())
         instance = results[0]
@@ -196,3 +212,36 @@ class TestNovaClient(test.BaseTestCase):
         instance = results[0]
         self.assertIsNone(instance.kernel_id)
         self.assertEqual(instance.ramdisk_id, 21)
+
+    def test_flavor_and_image_are_cached(self):
+        for i in range(2):
+            self.nv._with_flavor_and_image(self.fake_servers_list() +
+                                           self.fake_servers_list())
+        self.assertEqual(self.nv.nova_client.flavors.get.call_count, 1)
+        self.assertEqual(self.nv.nova_client.images.get.call_count, 1)
+
+    def test_not_found_is_cached(self):
+        for i in range(2):
+            instances = self.nv._with_flavor_and_image(
+                self.fake_servers_list_unknown_flavor() +
+                self.fake_servers_list_unknown_image())
+            self.assertEqual(instances[0].flavor['name'], 'unknown-id-666')
+            self.assertEqual(instances[1].image['name'], 'unknown-id-666')
+        self.assertEqual(self.nv.nova_client.flavors.get.call_count, 2)
+        self.assertEqual(self.nv.nova_client.images.get.call_count, 2)
+
+    def test_cache_ttl(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        timeutils.advance_time_seconds(601)
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(self.nv.nova_client.flavors.get.call_count, 2)
+        self.assertEqual(self.nv.nova_client.images.get.call_count, 2)
+
+    def test_cache_disabled(self):
+        self.CONF.set_override('nova_metadata_cache_ttl', 0)
+        for i in range(2):
+            self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(self.nv.nova_client.flavors.get.call_count, 2)
+        self.assertEqual(len(self.nv._flavors), 0)
@@ -388,6 +388,56 @@ class TestPipeline(test.BaseTestCase):
         self.assertTrue(pipeline_manager.pipelines[0].
                         support_meter('instance'))
 
+    def test_wildcard_patterns(self):
+        counter_cfg = ['cpu', 'disk.*', 'net?', 'image.[st]*']
+        self.pipeline_cfg[0]['counters'] = counter_cfg
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        for name in ['cpu', 'disk.read.bytes', 'net1', 'image.size']:
+            self.assertTrue(pipe.support_meter(name))
+        for name in ['cpu_util', 'disk', 'net', 'net12', 'image.upload']:
+            self.assertFalse(pipe.support_meter(name))
+
+    def test_routes_are_memoized(self):
+        self.pipeline_cfg[0]['counters'] = ['a', 'b']
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter])
+        self.useFixture(mockpatch.PatchObject(pipe, '_match_meter',
+                                              side_effect=AssertionError))
+        with pipeline_manager.publisher(None) as p:
+            p([self.test_counter, self.test_counter])
+        self.assertEqual(len(pipe.publishers[0].samples), 3)
+        self.assertEqual(pipeline_manager._routes['a'], [pipe])
+
+    def test_meter_caches_are_bounded(self):
+        self.pipeline_cfg[0]['counters'] = ['*']
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        with pipeline_manager.publisher(None) as p:
+            for i in range(pipeline.METER_CACHE_SIZE + 10):
+                p([sample.Sample(
+                    name='meter-%d' % i,
+                    type=self.test_counter.type,
+                    volume=self.test_counter.volume,
+                    unit=self.test_counter.unit,
+                    user_id=self.test_counter.user_id,
+                    project_id=self.test_counter.project_id,
+                    resource_id=self.test_counter.resource_id,
+                    timestamp=self.test_counter.timestamp,
+                    resource_metadata=self.test_counter.resource_metadata,
+                )])
+        self.assertEqual(len(pipe.publishers[0].samples),
+                         pipeline.METER_CACHE_SIZE + 10)
+        self.assertEqual(len(pipeline_manager._routes),
+                         pipeline.METER_CACHE_SIZE)
+        self.assertEqual(len(pipe._supported_meters),
+                         pipeline.METER_CACHE_SIZE)
+
     def test_multiple_pipeline(self):
         self.pipeline_cfg.append({
             'name': 'second_pipeline',
@@ -100,3 +100,38 @@ class TestUtils(test.BaseTestCase):
                                  ('nested2[1].c', 'B'),
                                  ('nested.a', 'A'),
                                  ('nested.b', 'B')])
+
+    def test_lru_cache_drops_least_recently_used(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_lru_cache_clear(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a', 'default'), 'default')
+
+    def test_lru_cache_getitem(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = None
+        self.assertIsNone(cache['a'])
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+
+    def test_compile_patterns(self):
+        match = utils.compile_patterns(['compute.instance.exists',
+                                        'image.*', 'volume.[cd]*'])
+        self.assertTrue(match('compute.instance.exists'))
+        self.assertTrue(match('image.update'))
+        self.assertTrue(match('volume.create.end'))
+        self.assertFalse(match('compute.instance.exists.verified'))
+        self.assertFalse(match('volume.exists'))
+        self.assertFalse(utils.compile_patterns([])('image.update'))
@@ -19,12 +19,36 @@
 """Utilities and helper functions."""
 
 import calendar
+import collections
 import datetime
 import decimal
+import fnmatch
+import re
 
 from ceilometer.openstack.common import timeutils
 
 
+_WILDCARD = re.compile(r'[*?[]')
+
+
+def compile_patterns(patterns):
+    """Return a function matching a name against the fnmatch patterns.
+
+    The names without wildcard are looked up in a set, the other patterns
+    are merged into a single regular expression.
+    """
+    names = frozenset(p for p in patterns if not _WILDCARD.search(p))
+    wildcards = [p for p in patterns if p not in names]
+    if not wildcards:
+        return names.__contains__
+    regex = re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                for p in wildcards))
+
+    def match(name):
+        return name in names or regex.match(name) is not None
+    return match
+
+
 def recursive_keypairs(d, separator=':'):
     """Generator that produces sequence of keypairs for nested dictionaries.
     """
@@ -116,3 +140,43 @@ def dict_to_keyval(value, key_base=None):
                     yield key_gen, v
             else:
                 yield key_gen, v
+
+
+class LRUCache(object):
+    """A mapping holding at most `size` items.
+
+    When full, storing a new item drops the least recently used one.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._items.pop(key, default)
+
+    def clear(self):
+        self._items.clear()